@@ -1,21 +1,91 @@
 """Generic cache module."""
+__all__ = ['AsyncCache', 'AsyncFileCache', 'AsyncMemoryCache',
+           'AsyncRedisCache', 'Cache', 'ConcurrentMemoryCache', 'FileCache',
+           'MemoryCache', 'RedisCache', 'RefreshingCache', 'SQLiteCache',
+           'ShardedRedisCache', 'SharedMemoryCache', 'TieredCache', 'cached',
+           'clear_cache_instances', 'get_async_cache', 'get_cache',
+           'register_backend']
 
+import importlib
+
+from .async_cache_protocol import AsyncCache
+from .async_file_cache import AsyncFileCache
+from .async_memory_cache import AsyncMemoryCache
 from .cache_protocol import Cache
+from .cached import cached
+from .concurrent_memory_cache import ConcurrentMemoryCache
 from .file_cache import FileCache
 from .memory_cache import MemoryCache
-from .redis_cache import RedisCache
+from .refreshing_cache import RefreshingCache
+from .registry import (ASYNC_BACKENDS, INSTANCES, SYNC_BACKENDS,
+                       register_backend)
+from .shared_memory_cache import SharedMemoryCache
+from .sqlite_cache import SQLiteCache
+from .tiered_cache import TieredCache
+
+# Backends importing optional or heavy packages load on first use
+_LAZY = {
+    'RedisCache': 'redis_cache',
+    'AsyncRedisCache': 'async_redis_cache',
+    'ShardedRedisCache': 'sharded_redis_cache',
+}
+
+register_backend('memory', MemoryCache)
+register_backend('memory', ConcurrentMemoryCache, option='shards')
+register_backend('path', FileCache)
+register_backend('redis', 'gs.cache.redis_cache:RedisCache')
+register_backend('redis', 'gs.cache.sharded_redis_cache:ShardedRedisCache')
+register_backend('sqlite', SQLiteCache)
+register_backend('shm', SharedMemoryCache)
+register_backend('tiered', TieredCache)
+
+register_backend('memory', AsyncMemoryCache, asynchronous=True)
+register_backend('path', AsyncFileCache, asynchronous=True)
+register_backend('redis', 'gs.cache.async_redis_cache:AsyncRedisCache',
+                 asynchronous=True)
 
 
-def get_cache(connection_string: str) -> Cache:
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(importlib.import_module(f'.{module}', __name__), name)
+
+
+def get_cache(connection_string: str, reuse: bool = False) -> Cache:
     """Get cache instance from connection string.
 
     connection string can be:
     - memory
+    - memory?shards=16 (ConcurrentMemoryCache, for many threads)
     - path:/path/to/cache/directory
     - redis://host:port/db_number
+    - redis://host1:port/db,redis://host2:port/db (consistent hashing)
+    - sqlite:/path/to/cache.db
+    - shm:name?size=512MB (shared by the processes of the host)
+    - tiered:<L1 connection string>|<L2 connection string>[|l1_ttl=60]
+    - any scheme added by register_backend
+
+    Every call returns a new instance, unless reuse is True: calls with the
+    same connection string and reuse=True share one instance (see
+    clear_cache_instances).
+    """
+    if reuse:
+        return INSTANCES.get(connection_string)
+    return SYNC_BACKENDS.create(connection_string)
+
+
+def clear_cache_instances() -> None:
+    """Forget the instances shared by get_cache(reuse=True)"""
+    INSTANCES.clear()
+
+
+def get_async_cache(connection_string: str) -> AsyncCache:
+    """Get a new async cache instance from connection string.
+
+    Accepts the same connection strings of get_cache:
+    - memory: runs in the event loop
+    - path:/path/to/cache/directory: file I/O in a bounded thread pool
+    - redis://host:port/db_number: redis.asyncio client
     """
-    for cache in [MemoryCache, FileCache, RedisCache]:
-        instance = cache().parse(connection_string)
-        if instance:
-            return instance
-    raise Exception("Cache not found")
+    return ASYNC_BACKENDS.create(connection_string)
@@ -0,0 +1,37 @@
+"""Async Cache Protocol"""
+
+import datetime
+from typing import Dict, Iterable, Protocol, Union
+
+
+class AsyncCache(Protocol):
+    """Async Cache Protocol
+
+    Same methods and TTL semantics of Cache, as coroutines."""
+
+    async def get(self, key: str) -> Union[str, None]:
+        """Return value or None if not found."""
+
+    async def set(self, key: str, value: str,
+                  ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                  ) -> None:
+        """Set value with time to live"""
+
+    async def get_many(self, keys: Iterable[str]
+                       ) -> Dict[str, Union[str, None]]:
+        """Return {key: value} for all keys. Value is None if not found."""
+
+    async def set_many(self, items: Dict[str, str],
+                       ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                       ) -> None:
+        """Set all values with the same time to live"""
+
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        """Delete keys and return the number of deleted entries."""
+
+    async def close(self) -> None:
+        """Release connections and workers"""
+
+    def parse(self, connection_string: str) -> 'AsyncCache':
+        """Parse connection string and return instance of AsyncCache if
+        valid."""
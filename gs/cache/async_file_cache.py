@@ -0,0 +1,64 @@
+"""Async File Cache"""
+import asyncio
+import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Union
+
+from .async_cache_protocol import AsyncCache
+from .file_cache import FileCache
+from .options import split_options
+
+
+class AsyncFileCache(AsyncCache):
+    """Async File Cache
+
+    Runs FileCache operations in a bounded thread pool (max_workers), so
+    file I/O never blocks the event loop."""
+
+    def __init__(self, cache: FileCache = None, max_workers: int = 4):
+        self.cache = cache or FileCache()
+        self.max_workers = max_workers
+        self._executor: ThreadPoolExecutor = None
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=self.__class__.__name__)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args))
+
+    async def get(self, key: str) -> Union[str, None]:
+        return await self._run(self.cache.get, key)
+
+    async def set(self, key: str, value: str,
+                  ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                  ) -> None:
+        await self._run(self.cache.set, key, value, ttl)
+
+    async def get_many(self, keys: Iterable[str]
+                       ) -> Dict[str, Union[str, None]]:
+        return await self._run(self.cache.get_many, list(keys))
+
+    async def set_many(self, items: Dict[str, str],
+                       ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                       ) -> None:
+        await self._run(self.cache.set_many, dict(items), ttl)
+
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        return await self._run(self.cache.delete_many, list(keys))
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def parse(self, connection_string: str) -> 'AsyncFileCache':
+        """path:str[?max_workers=int&...] (and FileCache options)"""
+        if not self.cache.parse(connection_string):
+            return None
+        _, options = split_options(connection_string)
+        self.max_workers = int(options.get('max_workers', self.max_workers))
+        return self
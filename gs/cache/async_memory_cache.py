@@ -0,0 +1,47 @@
+"""Async Memory Cache"""
+import datetime
+from typing import Dict, Iterable, Union
+
+from .async_cache_protocol import AsyncCache
+from .memory_cache import MemoryCache
+
+
+class AsyncMemoryCache(AsyncCache):
+    """Async Memory Cache
+
+    Runs MemoryCache operations directly in the event loop. They never
+    await, so each call is atomic for the loop. The MemoryCache lock is
+    only taken with thread_safe or a sweeper (uncontended unless other
+    threads use the same cache)."""
+
+    def __init__(self, cache: MemoryCache = None):
+        self.cache = cache or MemoryCache()
+
+    async def get(self, key: str) -> Union[str, None]:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: str,
+                  ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                  ) -> None:
+        self.cache.set(key, value, ttl)
+
+    async def get_many(self, keys: Iterable[str]
+                       ) -> Dict[str, Union[str, None]]:
+        return self.cache.get_many(keys)
+
+    async def set_many(self, items: Dict[str, str],
+                       ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                       ) -> None:
+        self.cache.set_many(items, ttl)
+
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        return self.cache.delete_many(keys)
+
+    async def close(self) -> None:
+        self.cache.stop_sweeper()
+
+    def parse(self, connection_string: str) -> 'AsyncMemoryCache':
+        """memory[?options] (same options of MemoryCache)"""
+        if not self.cache.parse(connection_string):
+            return None
+        return self
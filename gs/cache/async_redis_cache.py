@@ -0,0 +1,83 @@
+"""Async Redis Cache"""
+import datetime
+import logging
+from typing import Dict, Iterable, Union
+from urllib.parse import urlencode
+
+import redis.asyncio
+
+from .async_cache_protocol import AsyncCache
+from .options import split_options
+from .serializers import Codec, codec_from_options
+
+
+class AsyncRedisCache(AsyncCache):
+    """Async Redis Cache, using redis.asyncio"""
+
+    def __init__(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.redis: redis.asyncio.Redis = None
+        self.codec = Codec()
+
+    async def get(self, key: str) -> Union[str, None]:
+        return self.codec.decode(await self.redis.get(key))
+
+    async def set(self, key: str, value: str,
+                  ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                  ) -> None:
+        value = self.codec.encode(value)
+        if ttl.total_seconds() > 0:
+            await self.redis.set(key, value, ex=int(ttl.total_seconds()))
+        elif ttl.total_seconds() == 0:
+            await self.redis.set(key, value)
+
+    async def get_many(self, keys: Iterable[str]
+                       ) -> Dict[str, Union[str, None]]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        return {key: self.codec.decode(value)
+                for key, value in zip(keys, await self.redis.mget(keys))}
+
+    async def set_many(self, items: Dict[str, str],
+                       ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                       ) -> None:
+        seconds = ttl.total_seconds()
+        if seconds < 0 or not items:
+            return
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, value in items.items():
+            value = self.codec.encode(value)
+            if seconds > 0:
+                pipeline.set(key, value, ex=int(seconds))
+            else:
+                pipeline.set(key, value)
+        await pipeline.execute()
+
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return 0
+        return await self.redis.delete(*keys)
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            # redis>=5 renamed close() to aclose()
+            close = getattr(self.redis, 'aclose', None) or self.redis.close
+            await close()
+
+    def parse(self, connection_string: str) -> 'AsyncCache':
+        """redis://host:port/db_number[?options]
+
+        Value options: serializer, compression, compress_min,
+        compress_level. Other options are passed to redis."""
+        if not connection_string.startswith('redis://'):
+            return None
+
+        base, options = split_options(connection_string)
+        self.codec = codec_from_options(options)
+        url = f'{base}?{urlencode(sorted(options.items()))}' \
+            if options else base
+        self.redis = redis.asyncio.from_url(url)
+        self.log.info('Initialized')
+        return self
@@ -0,0 +1,286 @@
+"""Cache benchmark
+
+Measures get/set throughput and latency percentiles of the cache backends
+over a matrix of value sizes, key counts, hit ratios and thread counts, and
+writes the results as JSON.
+
+Usage:
+    python -m gs.cache.benchmark [--backends memory,path,sqlite,shm,redis]
+        [--value-sizes 64,4096] [--keys 1000] [--hit-ratios 1,0.5]
+        [--threads 1,4] [--operations 5000] [--seed 42]
+        [--redis-url redis://localhost:6379/15] [--output results.json]
+
+Redis runs against --redis-url, a redis-server spawned on a free port (when
+available in PATH) or fakeredis (when installed), in this order; otherwise
+redis results are skipped.
+"""
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .. import __version__
+from .cache_protocol import Cache
+
+BACKENDS = ('memory', 'path', 'sqlite', 'shm', 'redis')
+REDIS_DB = 15
+
+
+@dataclass
+class Scenario:
+    """Benchmark parameters"""
+    backend: str
+    value_size: int
+    keys: int
+    hit_ratio: float
+    threads: int
+    operations: int
+
+    @property
+    def name(self) -> str:
+        """Stable scenario id, to compare results of different runs"""
+        return (f'{self.backend}/value={self.value_size}/keys={self.keys}'
+                f'/hit={self.hit_ratio:g}/threads={self.threads}')
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    """Percentile of sorted samples (nearest rank)"""
+    if not samples:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(samples))) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
+
+
+def _measure(func: Callable, calls: List[tuple], threads: int
+             ) -> Tuple[float, List[float], list]:
+    """Run func(*call) for all calls split among threads.
+    Returns (wall seconds, sorted latencies, results)."""
+    chunks = [calls[index::threads] for index in range(threads)]
+    latencies: List[List[float]] = [[] for _ in range(threads)]
+    results: List[list] = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index: int) -> None:
+        timings, values = latencies[index], results[index]
+        clock = time.perf_counter
+        barrier.wait()
+        for call in chunks[index]:
+            start = clock()
+            values.append(func(*call))
+            timings.append(clock() - start)
+
+    workers = [threading.Thread(target=worker, args=(index,), daemon=True)
+               for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - start
+    return (seconds, sorted(itertools.chain.from_iterable(latencies)),
+            list(itertools.chain.from_iterable(results)))
+
+
+def _result(scenario: Scenario, operation: str, seconds: float,
+            latencies: List[float], **extra) -> dict:
+    return {
+        'scenario': scenario.name,
+        **asdict(scenario),
+        'operation': operation,
+        'seconds': seconds,
+        'ops_per_second': len(latencies) / seconds if seconds else 0.0,
+        'mean_us': sum(latencies) / len(latencies) * 1e6
+        if latencies else 0.0,
+        'p50_us': percentile(latencies, 50) * 1e6,
+        'p99_us': percentile(latencies, 99) * 1e6,
+        **extra,
+    }
+
+
+def run_scenario(cache: Cache, scenario: Scenario, seed: int) -> List[dict]:
+    """Populate the cache, then measure set and get"""
+    rng = random.Random(seed)
+    value = 'x' * scenario.value_size
+    keys = [f'bench:{index}' for index in range(scenario.keys)]
+    cache.set_many(dict.fromkeys(keys, value))
+
+    sets = [(rng.choice(keys), value)
+            for _ in range(scenario.operations)]
+    seconds, latencies, _ = _measure(cache.set, sets, scenario.threads)
+    results = [_result(scenario, 'set', seconds, latencies)]
+
+    gets = [(rng.choice(keys),) if rng.random() < scenario.hit_ratio
+            else (f'miss:{index}',)
+            for index in range(scenario.operations)]
+    seconds, latencies, values = _measure(cache.get, gets, scenario.threads)
+    hits = sum(1 for found in values if found is not None)
+    results.append(_result(scenario, 'get', seconds, latencies,
+                           hits=hits))
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def redis_stand_in(url: str = None) -> Iterator[Optional[str]]:
+    """Yields a redis URL, 'fakeredis' or None (redis unavailable)"""
+    if url:
+        yield url
+        return
+    server = shutil.which('redis-server')
+    if server:
+        port = _free_port()
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            [server, '--port', str(port), '--save', '',
+             '--appendonly', 'no'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                with contextlib.suppress(OSError), \
+                        socket.create_connection(('127.0.0.1', port), 0.1):
+                    break
+                time.sleep(0.05)
+            yield f'redis://127.0.0.1:{port}/{REDIS_DB}'
+        finally:
+            process.terminate()
+            process.wait()
+        return
+    try:
+        import fakeredis  # noqa: F401 pylint: disable=import-outside-toplevel
+    except ImportError:
+        yield None
+        return
+    yield 'fakeredis'
+
+
+def create_cache(backend: str, directory: str, redis_url: str) -> Cache:
+    """Empty cache of backend, never shared with other get_cache callers
+    (scenarios close it, the fakeredis client replaces its connection)"""
+    # pylint: disable=import-outside-toplevel
+    from . import get_cache
+    if backend == 'memory':
+        return get_cache('memory', reuse=False)
+    if backend == 'path':
+        path = tempfile.mkdtemp(dir=directory)
+        return get_cache(f'path:{path}', reuse=False)
+    if backend == 'sqlite':
+        handle, filename = tempfile.mkstemp(suffix='.db', dir=directory)
+        os.close(handle)
+        return get_cache(f'sqlite:{filename}', reuse=False)
+    if backend == 'shm':
+        path = tempfile.mkdtemp(dir=directory)
+        return get_cache(f'shm:bench?size=64MB&slot_size=8KB&dir={path}',
+                         reuse=False)
+    if redis_url == 'fakeredis':
+        import fakeredis
+        cache = get_cache(f'redis://localhost:6379/{REDIS_DB}', reuse=False)
+        cache.redis = fakeredis.FakeRedis()
+    else:
+        cache = get_cache(redis_url, reuse=False)
+    cache.redis.flushdb()
+    return cache
+
+
+def run(backends: List[str], value_sizes: List[int], key_counts: List[int],
+        hit_ratios: List[float], thread_counts: List[int],
+        operations: int, seed: int = 42, redis_url: str = None) -> dict:
+    """Run all scenarios, returns {'meta': {...}, 'results': [...]}"""
+    results = []
+    skipped = []
+    stand_in = redis_stand_in(redis_url) if 'redis' in backends \
+        else contextlib.nullcontext()
+    with stand_in as redis_source, \
+            tempfile.TemporaryDirectory() as directory:
+        for backend in backends:
+            if backend == 'redis' and redis_source is None:
+                skipped.append({'backend': backend, 'reason':
+                                'no redis-server, fakeredis or --redis-url'})
+                continue
+            for value_size, keys, hit_ratio, threads in itertools.product(
+                    value_sizes, key_counts, hit_ratios, thread_counts):
+                scenario = Scenario(backend, value_size, keys, hit_ratio,
+                                    threads, operations)
+                cache = create_cache(backend, directory, redis_source)
+                try:
+                    results.extend(run_scenario(cache, scenario, seed))
+                finally:
+                    if hasattr(cache, 'close'):
+                        cache.close()
+    return {
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': datetime.datetime.now(
+                datetime.timezone.utc).isoformat(),
+            'seed': seed,
+            'redis': redis_source,
+            'skipped': skipped,
+        },
+        'results': results,
+    }
+
+
+def _list(cast: Callable) -> Callable[[str], list]:
+    def parse(text: str) -> list:
+        return [cast(item) for item in text.split(',') if item]
+    return parse
+
+
+def main(args: List[str] = None) -> int:
+    """Run the benchmark and write the results as JSON"""
+    parser = argparse.ArgumentParser(
+        prog='python -m gs.cache.benchmark',
+        description='Measure cache backends throughput and latency')
+    parser.add_argument('--backends', type=_list(str),
+                        default=list(BACKENDS))
+    parser.add_argument('--value-sizes', type=_list(int), default=[64, 4096])
+    parser.add_argument('--keys', type=_list(int), default=[1000])
+    parser.add_argument('--hit-ratios', type=_list(float),
+                        default=[1.0, 0.5])
+    parser.add_argument('--threads', type=_list(int), default=[1, 4])
+    parser.add_argument('--operations', type=int, default=5000,
+                        help='Operations per scenario and operation type')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--redis-url',
+                        help='Use this redis (the database is flushed)')
+    parser.add_argument('--output', help='JSON file (default stdout)')
+    options = parser.parse_args(args)
+    unknown = set(options.backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f'Unknown backends {sorted(unknown)}')
+
+    report = run(options.backends, options.value_sizes, options.keys,
+                 options.hit_ratios, options.threads, options.operations,
+                 options.seed, options.redis_url)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,67 @@
 """Cache Protocol"""
 
 import datetime
-from typing import Protocol, Union
+from typing import Dict, Iterable, Protocol, Tuple, Union
 
 
 class Cache(Protocol):
-    """Cache Protocol"""
+    """Cache Protocol
 
-    def get(self, key: str) -> Union[str, None]:
+    Values are str or bytes. Backends may be configured with other
+    serializers (json, pickle, msgpack) that accept other value types."""
+
+    def get(self, key: str) -> Union[str, bytes, None]:
         """Return value or None if not found."""
 
-    def set(self, key: str, value: str,
+    def set(self, key: str, value: Union[str, bytes],
             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
         """Set value with time to live"""
 
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        """Return (value, remaining time to live) or (None, None) if not
+        found. Remaining time to live is timedelta(0) for entries without
+        expiration, as in set."""
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        """Return {key: value} for all keys. Value is None if not found."""
+
+    def get_many_with_ttl(self, keys: Iterable[str]
+                          ) -> Dict[str, Tuple[Union[str, None],
+                                               Union[datetime.timedelta,
+                                                     None]]]:
+        """Return {key: (value, remaining time to live)} for all keys, as
+        get_with_ttl. Backends with batch reads override this default."""
+        return {key: self.get_with_ttl(key) for key in dict.fromkeys(keys)}
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        """Set all values with the same time to live"""
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Delete keys and return the number of deleted entries."""
+
+    def delete(self, key: str) -> bool:
+        """Delete key and return True if an entry was deleted."""
+
+    def add(self, key: str, value: Union[str, bytes],
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        """Set value only if key is not found (set-if-absent), atomically.
+        Return True if value was stored."""
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        """Add delta to the integer value of key atomically and return the
+        result. Keys not found start at 0 with ttl; existing keys keep their
+        expiration. Counters are stored as decimal strings."""
+
+    def cas(self, key: str, expected: Union[str, bytes],
+            value: Union[str, bytes],
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        """Compare and set: replace the value of key only if it equals
+        expected, atomically. Return True if value was stored."""
+
     def parse(self, connection_string: str) -> 'Cache':
         """Parse connection string and return instance of Cache if valid."""
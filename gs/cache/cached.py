@@ -0,0 +1,149 @@
+"""Memoization decorator"""
+import datetime
+import functools
+import hashlib
+import inspect
+import json
+from typing import Any, Callable, Union
+
+from .async_cache_protocol import AsyncCache
+from .cache_protocol import Cache
+from .memory_cache import MemoryCache
+from .single_flight import AsyncSingleFlight, SingleFlight
+
+
+def _as_timedelta(ttl: Union[datetime.timedelta, float]) -> datetime.timedelta:
+    if isinstance(ttl, datetime.timedelta):
+        return ttl
+    return datetime.timedelta(seconds=ttl)
+
+
+def _not_serializable(value: Any) -> Any:
+    raise TypeError(
+        f'{type(value).__name__} argument is not JSON serializable: pass '
+        'key= to cached() to build cache keys for it')
+
+
+def make_key(func: Callable, *args, **kwargs) -> str:
+    """Stable cache key for a call: module.qualname:sha1(arguments).
+
+    Arguments are bound to the function signature (so f(1), f(a=1) and
+    f() with default a=1 share the key) and JSON encoded. Arguments that
+    are not JSON serializable (objects, self of methods) raise TypeError:
+    their repr may hold a memory address, which is not stable between
+    processes and may be reused by another object."""
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = json.dumps(list(bound.arguments.items()),
+                           sort_keys=True, default=_not_serializable)
+    digest = hashlib.sha1(arguments.encode('utf-8')).hexdigest()
+    return f'{func.__module__}.{func.__qualname__}:{digest}'
+
+
+def cached(cache: Union[Cache, AsyncCache, str] = None,
+           ttl: Union[datetime.timedelta, float] = datetime.timedelta(0),
+           key: Callable[..., str] = None):
+    """Cache function results.
+
+    cache: Cache, AsyncCache (async functions only), connection string
+    (a new instance per decorated function) or None for a private
+    thread safe MemoryCache.
+    ttl: timedelta or seconds (0 = no expiration).
+    key: function receiving the call arguments and returning the cache key
+    (default make_key, which needs JSON serializable arguments: methods
+    and functions taking objects need key).
+
+    Results are stored as JSON. Concurrent misses for the same key are
+    merged: one caller computes the value while the others wait for it
+    (single flight, per decorated function and process).
+
+    The wrapper exposes cache, cache_key(*args, **kwargs) and
+    invalidate(*args, **kwargs)."""
+    ttl = _as_timedelta(ttl)
+
+    def decorator(func):
+        is_async = inspect.iscoroutinefunction(func)
+        backend = _resolve_cache(cache, is_async)
+        async_backend = is_async and \
+            inspect.iscoroutinefunction(getattr(backend, 'get', None))
+
+        def cache_key(*args, **kwargs) -> str:
+            if key:
+                return key(*args, **kwargs)
+            return make_key(func, *args, **kwargs)
+
+        if not is_async:
+            flight = SingleFlight()
+
+            def compute(cache_key_, args, kwargs):
+                # Another caller may have stored the value meanwhile
+                value = backend.get(cache_key_)
+                if value is not None:
+                    return json.loads(value)
+                result = func(*args, **kwargs)
+                backend.set(cache_key_, json.dumps(result), ttl)
+                return result
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key_ = cache_key(*args, **kwargs)
+                value = backend.get(cache_key_)
+                if value is not None:
+                    return json.loads(value)
+                return flight.do(cache_key_, compute, cache_key_, args, kwargs)
+
+            def invalidate(*args, **kwargs) -> bool:
+                return bool(backend.delete_many([cache_key(*args, **kwargs)]))
+
+        else:
+            flight = AsyncSingleFlight()
+
+            async def backend_call(method: str, *args):
+                result = getattr(backend, method)(*args)
+                if async_backend:
+                    result = await result
+                return result
+
+            async def compute(cache_key_, args, kwargs):
+                value = await backend_call('get', cache_key_)
+                if value is not None:
+                    return json.loads(value)
+                result = await func(*args, **kwargs)
+                await backend_call('set', cache_key_, json.dumps(result), ttl)
+                return result
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                cache_key_ = cache_key(*args, **kwargs)
+                value = await backend_call('get', cache_key_)
+                if value is not None:
+                    return json.loads(value)
+                return await flight.do(cache_key_, compute,
+                                       cache_key_, args, kwargs)
+
+            async def invalidate(*args, **kwargs) -> bool:
+                return bool(await backend_call(
+                    'delete_many', [cache_key(*args, **kwargs)]))
+
+        wrapper.cache = backend
+        wrapper.cache_key = cache_key
+        wrapper.invalidate = invalidate
+        return wrapper
+
+    return decorator
+
+
+def _resolve_cache(cache: Union[Cache, AsyncCache, str, None],
+                   is_async: bool) -> Any:
+    if cache is None:
+        # Decorated functions are called from many threads
+        return MemoryCache(thread_safe=True)
+    if isinstance(cache, str):
+        # gs.cache imports this module
+        # pylint: disable=import-outside-toplevel
+        from . import get_async_cache, get_cache
+        return get_async_cache(cache) if is_async else get_cache(cache)
+    if not is_async and inspect.iscoroutinefunction(
+            getattr(cache, 'get', None)):
+        raise TypeError('AsyncCache can only be used with async functions')
+    return cache
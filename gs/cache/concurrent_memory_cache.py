@@ -0,0 +1,206 @@
+"""Concurrent Memory Cache"""
+import datetime
+import logging
+import threading
+from typing import Dict, Iterable, List, Tuple, Union
+
+from .cache_protocol import Cache
+from .memory_cache import MemoryCache
+from .options import parse_size, split_options
+from .serializers import codec_from_options, has_codec_options
+from .stats import MetricsMixin
+
+DEFAULT_SHARDS = 16
+
+
+class ConcurrentMemoryCache(MetricsMixin, Cache):
+    """Memory cache for many threads (lock striping).
+
+    Keys are spread by hash over shards: thread-safe MemoryCache instances,
+    each with its own lock, so threads working on different shards do not
+    contend.
+
+    Thread-safety contract:
+    - every method can be called from any thread, including free-threaded
+      builds (no reliance on the GIL)
+    - single key operations (get, set, get_with_ttl, delete, add, incr,
+      cas) are atomic
+    - get_many, set_many and delete_many are atomic per shard, not across
+      shards: concurrent writers may interleave between shards
+    - limits (max_items, max_bytes) are split evenly between shards, so the
+      whole cache stays under them, but eviction order is per shard
+
+    Counters (evictions, evicted_bytes, expirations, size_bytes) are the
+    sums of the shard counters."""
+
+    def __init__(self, shards: int = DEFAULT_SHARDS, max_items: int = 0,
+                 max_bytes: int = 0, policy: str = 'lru',
+                 sweep_slice: int = 32):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.shards: List[MemoryCache] = []
+        self._create_shards(shards, sweep_slice)
+        self.max_items = 0
+        self.max_bytes = 0
+        self._sweeper: threading.Thread = None
+        self._sweeper_stop: threading.Event = None
+        self.configure(max_items, max_bytes, policy)
+
+    def _create_shards(self, shards: int, sweep_slice: int) -> None:
+        if shards < 1:
+            raise ValueError(f'Invalid number of shards {shards}')
+        self.shards = [MemoryCache(sweep_slice=sweep_slice, thread_safe=True)
+                       for _ in range(shards)]
+
+    def configure(self, max_items: int = 0, max_bytes: int = 0,
+                  policy: str = 'lru') -> None:
+        """Set whole cache limits (0 = unlimited) and eviction policy"""
+        max_items = max(0, int(max_items))
+        max_bytes = max(0, int(max_bytes))
+        count = len(self.shards)
+        if 0 < max_items < count or 0 < max_bytes < count:
+            raise ValueError(
+                f'Limits must allow at least one item and byte per shard '
+                f'({count} shards)')
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        for shard in self.shards:
+            with shard.lock:
+                shard.configure(max_items // count, max_bytes // count,
+                                policy)
+
+    def _shard(self, key: str) -> MemoryCache:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def _by_shard(self, keys: Iterable[str]
+                  ) -> Dict[int, List[str]]:
+        groups: Dict[int, List[str]] = {}
+        count = len(self.shards)
+        for key in keys:
+            groups.setdefault(hash(key) % count, []).append(key)
+        return groups
+
+    def __len__(self) -> int:
+        return sum(len(shard.cache) for shard in self.shards)
+
+    def __bool__(self) -> bool:
+        # An empty cache is still a cache (get_cache tests parse results)
+        return True
+
+    @property
+    def size_bytes(self) -> int:
+        """Approximate size of bounded shards"""
+        return sum(shard.size_bytes for shard in self.shards)
+
+    @property
+    def evictions(self) -> int:
+        """Evicted entries"""
+        return sum(shard.evictions for shard in self.shards)
+
+    @property
+    def evicted_bytes(self) -> int:
+        """Approximate size of evicted entries"""
+        return sum(shard.evicted_bytes for shard in self.shards)
+
+    @property
+    def expirations(self) -> int:
+        """Removed expired entries"""
+        return sum(shard.expirations for shard in self.shards)
+
+    def get(self, key: str) -> Union[str, None]:
+        return self._shard(key).get(key)
+
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        return self._shard(key).get_with_ttl(key)
+
+    def set(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
+        self._shard(key).set(key, value, ttl)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        keys = list(keys)
+        found = {}
+        for index, shard_keys in self._by_shard(keys).items():
+            found.update(self.shards[index].get_many(shard_keys))
+        return {key: found[key] for key in keys}
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        for index, shard_keys in self._by_shard(items).items():
+            self.shards[index].set_many(
+                {key: items[key] for key in shard_keys}, ttl)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        return sum(self.shards[index].delete_many(shard_keys)
+                   for index, shard_keys in self._by_shard(
+                       dict.fromkeys(keys)).items())
+
+    def delete(self, key: str) -> bool:
+        return self._shard(key).delete(key)
+
+    def add(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        return self._shard(key).add(key, value, ttl)
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        return self._shard(key).incr(key, delta, ttl)
+
+    def cas(self, key: str, expected: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        return self._shard(key).cas(key, expected, value, ttl)
+
+    def sweep(self, max_items: int = 0) -> int:
+        """Remove up to max_items expired entries per shard (0 = all).
+        Returns the number of removed entries."""
+        return sum(shard.sweep(max_items) for shard in self.shards)
+
+    def start_sweeper(self, interval: float = 1.0) -> None:
+        """Start a daemon thread that sweeps every shard every interval
+        seconds, locking one shard at a time."""
+        if self._sweeper:
+            return
+        self._sweeper_stop = threading.Event()
+        self._sweeper = threading.Thread(
+            target=self._sweeper_loop, args=(interval,),
+            name=f'{self.__class__.__name__}-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        """Stop the background sweeper"""
+        if not self._sweeper:
+            return
+        self._sweeper_stop.set()
+        self._sweeper.join()
+        self._sweeper = None
+
+    def _sweeper_loop(self, interval: float) -> None:
+        while not self._sweeper_stop.wait(interval):
+            for shard in self.shards:
+                while shard.sweep(shard.sweep_slice or 32) and \
+                        not self._sweeper_stop.is_set():
+                    ...
+
+    def parse(self, connection_string: str) -> 'ConcurrentMemoryCache':
+        """memory?shards=int[&max_items=int&max_bytes=size&policy=lru|lfu
+        &sweep_slice=int&sweep_interval=seconds&serializer=name
+        &compression=name&compress_min=size&compress_level=int&metrics=1]"""
+        base, options = split_options(connection_string)
+        if base != 'memory' or 'shards' not in options:
+            return None
+        self.configure_metrics(options)
+        self._create_shards(int(options['shards']),
+                            int(options.get('sweep_slice', 32)))
+        if has_codec_options(options):
+            codec = codec_from_options(options)
+            for shard in self.shards:
+                shard.codec = codec
+        self.configure(max_items=int(options.get('max_items', 0)),
+                       max_bytes=parse_size(options.get('max_bytes', 0)),
+                       policy=options.get('policy', 'lru'))
+        if float(options.get('sweep_interval', 0)) > 0:
+            self.start_sweeper(float(options['sweep_interval']))
+        self.log.info('Initialized')
+        return self
@@ -0,0 +1,155 @@
+"""Eviction policies for bounded caches"""
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class EvictionPolicy:
+    """Eviction policy base class.
+
+    Policies only track keys; the cache owns the values and calls:
+    - add(key) when a new key is stored
+    - touch(key) when a key is read or overwritten
+    - remove(key) when a key leaves the cache
+    - victim() to know which key must be evicted next
+    """
+
+    def add(self, key: Hashable) -> None:
+        """Track a new key"""
+        raise NotImplementedError
+
+    def touch(self, key: Hashable) -> None:
+        """Register an access to key"""
+        raise NotImplementedError
+
+    def remove(self, key: Hashable) -> None:
+        """Stop tracking key"""
+        raise NotImplementedError
+
+    def victim(self) -> Optional[Hashable]:
+        """Return the next key to be evicted, or None if empty"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Stop tracking all keys"""
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+    """Least Recently Used, O(1) on every operation"""
+
+    def __init__(self):
+        self.keys: 'OrderedDict[Hashable, None]' = OrderedDict()
+
+    def add(self, key: Hashable) -> None:
+        self.keys[key] = None
+        self.keys.move_to_end(key)
+
+    def touch(self, key: Hashable) -> None:
+        if key in self.keys:
+            self.keys.move_to_end(key)
+
+    def remove(self, key: Hashable) -> None:
+        self.keys.pop(key, None)
+
+    def victim(self) -> Optional[Hashable]:
+        return next(iter(self.keys), None)
+
+    def clear(self) -> None:
+        self.keys.clear()
+
+
+class LFUPolicy(EvictionPolicy):
+    """Least Frequently Used, O(1) on every operation.
+
+    Keys are grouped in buckets by access frequency. Inside a bucket, the
+    least recently used key is evicted first. Non-empty buckets are linked
+    in frequency order (prev/next), so the lowest frequency is known
+    without scanning after keys are removed."""
+
+    def __init__(self):
+        self.frequencies: Dict[Hashable, int] = {}
+        self.buckets: Dict[int, 'OrderedDict[Hashable, None]'] = {}
+        self.min_frequency = 0
+        self._prev: Dict[int, int] = {}
+        self._next: Dict[int, int] = {}
+
+    def _link(self, frequency: int, prev: int) -> None:
+        """Create the bucket of frequency after the bucket prev (0 = head)
+        """
+        following = self._next.get(prev, 0) if prev else self.min_frequency
+        self.buckets[frequency] = OrderedDict()
+        self._prev[frequency] = prev
+        self._next[frequency] = following
+        if prev:
+            self._next[prev] = frequency
+        else:
+            self.min_frequency = frequency
+        if following:
+            self._prev[following] = frequency
+
+    def _unlink(self, frequency: int) -> None:
+        del self.buckets[frequency]
+        prev = self._prev.pop(frequency)
+        following = self._next.pop(frequency)
+        if prev:
+            self._next[prev] = following
+        else:
+            self.min_frequency = following
+        if following:
+            self._prev[following] = prev
+
+    def add(self, key: Hashable) -> None:
+        if key in self.frequencies:
+            self.touch(key)
+            return
+        self.frequencies[key] = 1
+        if 1 not in self.buckets:
+            self._link(1, 0)
+        self.buckets[1][key] = None
+
+    def touch(self, key: Hashable) -> None:
+        frequency = self.frequencies.get(key)
+        if frequency is None:
+            return
+        if frequency + 1 not in self.buckets:
+            self._link(frequency + 1, frequency)
+        self.frequencies[key] = frequency + 1
+        self.buckets[frequency + 1][key] = None
+        self._discard(key, frequency)
+
+    def _discard(self, key: Hashable, frequency: int) -> None:
+        bucket = self.buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            self._unlink(frequency)
+
+    def remove(self, key: Hashable) -> None:
+        frequency = self.frequencies.pop(key, None)
+        if frequency is not None:
+            self._discard(key, frequency)
+
+    def victim(self) -> Optional[Hashable]:
+        if not self.min_frequency:
+            return None
+        return next(iter(self.buckets[self.min_frequency]))
+
+    def clear(self) -> None:
+        self.frequencies.clear()
+        self.buckets.clear()
+        self._prev.clear()
+        self._next.clear()
+        self.min_frequency = 0
+
+
+POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+}
+
+
+def create_policy(name: str) -> EvictionPolicy:
+    """Create eviction policy by name (lru, lfu)"""
+    try:
+        return POLICIES[name.lower()]()
+    except KeyError as exc:
+        raise ValueError(f'Unknown eviction policy {name!r}') from exc
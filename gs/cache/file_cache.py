@@ -1,60 +1,806 @@
 """File Cache"""
+import contextlib
 import datetime
 import hashlib
 import json
 import logging
 import os
-from typing import Union
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import (Dict, Iterable, Iterator, List, Optional, Set, Tuple,
+                    Union)
 
 from .cache_protocol import Cache
+from .options import parse_bool, parse_size, split_options
+from .serializers import Codec, codec_from_options, parse_counter
+from .stats import MetricsMixin
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
 
-class FileCache(Cache):
-    """File Cache"""
+NO_EXPIRATION = datetime.datetime(datetime.MAXYEAR, 1, 1).timestamp()
+LEGACY_PREFIX = 'cache_'
+TEMP_PREFIX = '.tmp-'
+# Entry file: FILE_MAGIC, valid_until (little endian double), encoded value
+FILE_MAGIC = b'GSC\x01'
+FILE_HEADER = struct.Struct('<4sd')
+# Seconds between access time updates of the same entry
+TOUCH_INTERVAL = 60
+# Temporary and lock files older than this (seconds) belong to crashed writers
+TEMP_MAX_AGE = 3600
+# Quota eviction frees space down to this fraction of the limits
+QUOTA_LOW_WATERMARK = 0.9
+LOCK_PREFIX = '.lock-'
+# Seconds atomic operations wait for an entry lock (then TimeoutError)
+LOCK_TIMEOUT = 10
+# In-process locks (lock files only exclude other holders by polling)
+LOCK_STRIPES = 64
 
-    def __init__(self) -> None:
+
+def _default_file_mode() -> int:
+    # The umask can only be read by setting it
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Mode of entry files (mkstemp creates 0600 files): as open() would create
+FILE_MODE = _default_file_mode()
+
+
+class FileCache(MetricsMixin, Cache):
+    """File Cache
+
+    Entries are spread in a fan-out directory tree: with levels=2 (default)
+    the entry for hash 'abcdef...' is stored in 'ab/cd/abcdef....json'.
+    levels=0 keeps the flat layout ('cache_<hash>.json'), used by previous
+    versions. Flat entries found in a sharded cache are moved to the tree
+    when read, or all at once by migrate() (migrate=1 option).
+
+    Writes go to a temporary file that is renamed over the entry, so readers
+    never see partial entries. Entry files hold a small binary header with
+    the expiration and the value encoded by codec (see serializers.Codec);
+    JSON entries written by previous versions are still read.
+
+    get_many reads files in parallel using up to read_workers threads.
+
+    Quota: with max_bytes and/or max_files, the least recently used entries
+    (by modification time, refreshed on reads at most every TOUCH_INTERVAL
+    seconds) are removed when the approximate usage goes over the limits.
+    Usage is measured by a janitor pass, which the first write (and every
+    write over the limits) starts in a background thread: writes never
+    wait for a directory scan.
+    The janitor (FileCacheJanitor) removes expired entries incrementally,
+    in-process (start_janitor or the janitor_interval option) or from the
+    command line (python -m gs.cache.janitor).
+
+    Key index (index=True, index=1 option): an in-process set of the stored
+    entries (FileCacheIndex) answers definite misses without touching the
+    file system. It is built in background: lookups never wait for it.
+    Entries written by other processes are missed until the index is
+    rebuilt (index_rebuild option or rebuild_index()).
+
+    Atomic operations (add, incr, cas) lock the entry between threads and
+    processes with flock on a lock file (released by the kernel when the
+    holder dies), and read the entry from the file system even when the
+    index misses it; they are atomic with respect to each other, not to
+    concurrent set calls. Waiting more than LOCK_TIMEOUT seconds for a lock
+    raises TimeoutError; incr raises OSError when the counter cannot be
+    written (add and cas return False). Without fcntl (Windows), lock
+    files are created with O_EXCL: those left by crashed processes are
+    removed by the janitor after TEMP_MAX_AGE.
+
+    Counters: expirations, evictions and errors (see also stats())."""
+
+    def __init__(self, read_workers: int = 8, levels: int = 2,
+                 max_bytes: int = 0, max_files: int = 0,
+                 index: bool = False) -> None:
         self.log = logging.getLogger(self.__class__.__name__)
-        self.log.info('Initialized')
         self.path = None
+        self.read_workers = read_workers
+        self.levels = levels
+        self.legacy = False
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.usage_bytes: Optional[int] = None
+        self.usage_files: Optional[int] = None
+        self.janitor = FileCacheJanitor(self)
+        self.index: Optional[FileCacheIndex] = \
+            FileCacheIndex(self) if index else None
+        self.codec = Codec()
+        self.expirations = 0
+        self.evictions = 0
+        self.errors = 0
+        self._executor: ThreadPoolExecutor = None
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._janitor_thread: threading.Thread = None
+        self._janitor_stop: threading.Event = None
+        self._quota_thread: threading.Thread = None
+        self._quota_lock = threading.Lock()
+
+    @property
+    def has_quota(self) -> bool:
+        """True if there is any limit on bytes or files"""
+        return bool(self.max_bytes or self.max_files)
+
+    def over_quota(self, ratio: float = 1.0) -> bool:
+        """True if the known usage is over ratio * limits"""
+        if self.usage_bytes is None:
+            return False
+        return bool(
+            (self.max_bytes and self.usage_bytes > self.max_bytes * ratio) or
+            (self.max_files and self.usage_files > self.max_files * ratio))
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _hash_filename(self, hash_name: str) -> str:
+        if not self.levels:
+            return os.path.join(self.path, f'{LEGACY_PREFIX}{hash_name}.json')
+        parts = [hash_name[i * 2:i * 2 + 2] for i in range(self.levels)]
+        return os.path.join(self.path, *parts, f'{hash_name}.json')
 
     def _filename(self, key: str) -> str:
-        hash_name = hashlib.sha1(key.encode('utf-8')).hexdigest()
-        return os.path.join(self.path, f'cache_{hash_name}.json')
+        return self._hash_filename(self._hash(key))
+
+    def _legacy_filename(self, hash_name: str) -> str:
+        return os.path.join(self.path, f'{LEGACY_PREFIX}{hash_name}.json')
+
+    def _locate(self, key: str, use_index: bool = True) -> Optional[str]:
+        """Filename of key, moving flat layout entries to the tree.
+        None if the index knows that key is missing."""
+        hash_name = self._hash(key)
+        if use_index and self.index is not None and \
+                hash_name not in self.index:
+            return None
+        filename = self._hash_filename(hash_name)
+        if self.legacy and self.levels and not os.path.isfile(filename):
+            self._move(self._legacy_filename(hash_name), filename)
+        return filename
+
+    def _move(self, source: str, destination: str) -> bool:
+        try:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(source, destination)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as exc:
+            self.log.error('Error moving cache file %s: %s', source, exc)
+            return False
+
+    def migrate(self) -> int:
+        """Move all flat layout entries to the directory tree.
+        Returns the number of moved entries."""
+        if not self.levels:
+            return 0
+        moved = 0
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if not self._is_legacy_entry(entry.name):
+                    continue
+                hash_name = entry.name[len(LEGACY_PREFIX):-len('.json')]
+                moved += self._move(entry.path,
+                                    self._hash_filename(hash_name))
+        self.legacy = False
+        return moved
+
+    @staticmethod
+    def _is_legacy_entry(name: str) -> bool:
+        return name.startswith(LEGACY_PREFIX) and name.endswith('.json')
+
+    def enable_index(self, rebuild_interval: float = 0) -> None:
+        """Keep a key index, rebuilt every rebuild_interval seconds
+        (0 = built once, for directories used by a single process)"""
+        if self.index is None:
+            self.index = FileCacheIndex(self)
+        self.index.rebuild_interval = rebuild_interval
+
+    def rebuild_index(self) -> int:
+        """Rebuild the key index from the directory (entries written by
+        other processes). Returns the number of indexed entries."""
+        if self.index is None:
+            return 0
+        return self.index.build()
+
+    def _has_legacy_entries(self) -> bool:
+        with os.scandir(self.path) as entries:
+            return any(self._is_legacy_entry(entry.name)
+                       for entry in entries)
 
     def get(self, key: str) -> Union[str, None]:
-        filename = self._filename(key)
+        return self._read(self._locate(key))
 
-        if not os.path.isfile(filename):
+    def _read(self, filename: str) -> Union[str, None]:
+        entry = self._read_entry(filename)
+        return None if entry is None else entry[0]
+
+    def _read_entry(self, filename: Optional[str]
+                    ) -> Optional[Tuple[str, float]]:
+        if filename is None:
             return None
         try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                value, valid_until = json.load(file)
-            if valid_until > datetime.datetime.now().timestamp():
-                return value
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        try:
+            with open(filename, 'rb') as file:
+                data = file.read()
+            value, valid_until = self._decode_entry(data)
+            now = time.time()
+            if valid_until > now:
+                if self.has_quota and now - stat.st_mtime > TOUCH_INTERVAL:
+                    # Access time for LRU eviction
+                    os.utime(filename)
+                return value, valid_until
+            expired = True
         except Exception as exc:
             self.log.error('Error reading cache file %s: %s', filename, exc)
+            self.errors += 1
+            expired = False
 
-        os.remove(filename)
+        if self._remove_entry(filename):
+            self._account(-stat.st_size, -1)
+            self.expirations += expired
         return None
 
+    def _decode_entry(self, data: bytes) -> Tuple[str, float]:
+        if data.startswith(FILE_MAGIC):
+            _, valid_until = FILE_HEADER.unpack_from(data)
+            return (self.codec.decode(data[FILE_HEADER.size:]),
+                    valid_until)
+        # JSON entry from previous versions
+        value, valid_until = json.loads(data)
+        return value, float(valid_until)
+
+    def read_valid_until(self, filename: str) -> Optional[float]:
+        """Expiration timestamp of an entry file, None if unreadable.
+        Only the header is read."""
+        try:
+            with open(filename, 'rb') as file:
+                header = file.read(FILE_HEADER.size)
+                if header.startswith(FILE_MAGIC):
+                    return FILE_HEADER.unpack(header)[1]
+                return float(json.loads(header + file.read())[1])
+        except Exception:  # pylint: disable=broad-except
+            return None
+
+    def _account(self, size: int, files: int) -> None:
+        if self.usage_bytes is not None:
+            self.usage_bytes += size
+            self.usage_files += files
+
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        entry = self._read_entry(self._locate(key))
+        if entry is None:
+            return None, None
+        value, valid_until = entry
+        if valid_until >= NO_EXPIRATION:
+            return value, datetime.timedelta(0)
+        return value, datetime.timedelta(
+            seconds=valid_until - datetime.datetime.now().timestamp())
+
     def set(self, key: str, value: str,
             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
-        valid_until = datetime.datetime(datetime.MAXYEAR, 1, 1) if ttl.total_seconds(
-        ) == 0 else datetime.datetime.now() + ttl
-        filename = self._filename(key)
+        self._write(self._filename(key), value, self._valid_until(ttl))
+
+    @staticmethod
+    def _valid_until(ttl: datetime.timedelta) -> float:
+        if ttl.total_seconds() == 0:
+            return NO_EXPIRATION
+        return (datetime.datetime.now() + ttl).timestamp()
+
+    def _write(self, filename: str, value: str, valid_until: float) -> bool:
+        directory = os.path.dirname(filename)
         try:
-            with open(filename, 'w', encoding='utf-8') as file:
-                json.dump((value, valid_until.timestamp()), file)
+            try:
+                handle, temp_name = tempfile.mkstemp(
+                    prefix=TEMP_PREFIX, dir=directory)
+            except FileNotFoundError:
+                os.makedirs(directory, exist_ok=True)
+                handle, temp_name = tempfile.mkstemp(
+                    prefix=TEMP_PREFIX, dir=directory)
+            try:
+                os.chmod(temp_name, FILE_MODE)
+                with open(handle, 'wb') as file:
+                    file.write(FILE_HEADER.pack(FILE_MAGIC, valid_until))
+                    file.write(self.codec.encode(value))
+                    size = file.tell()
+                replaced = self._file_size(filename) if self.has_quota \
+                    else None
+                os.replace(temp_name, filename)
+            except BaseException:
+                self._remove(temp_name)
+                raise
         except Exception as exc:
             self.log.error('Error writing cache file %s: %s', filename, exc)
+            self.errors += 1
+            return False
+        if self.index is not None:
+            self.index.add(_entry_hash(filename))
+        if self.has_quota:
+            # Approximate (concurrent writers), corrected by janitor passes
+            if replaced is None:
+                self._account(size, 1)
+            else:
+                self._account(size - replaced, 0)
+            if self.usage_bytes is None or self.over_quota():
+                self._start_quota_pass()
+        return True
+
+    @staticmethod
+    def _file_size(filename: str) -> Optional[int]:
+        try:
+            return os.stat(filename).st_size
+        except OSError:
+            return None
+
+    def _start_quota_pass(self) -> None:
+        """Measure usage and evict in a background janitor pass, unless one
+        is running"""
+        with self._quota_lock:
+            if self._quota_thread is not None and \
+                    self._quota_thread.is_alive():
+                return
+            self._quota_thread = threading.Thread(
+                target=self._quota_pass,
+                name=f'{self.__class__.__name__}-quota', daemon=True)
+            self._quota_thread.start()
+
+    def _quota_pass(self) -> None:
+        try:
+            self.janitor.run()
+        except Exception as exc:  # pylint: disable=broad-except
+            self.log.error('Janitor error: %s', exc)
+            self.errors += 1
+
+    @staticmethod
+    def _remove(filename: str) -> bool:
+        try:
+            os.remove(filename)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _remove_entry(self, filename: str) -> bool:
+        """Remove an entry file and forget it in the index"""
+        if self.index is not None:
+            self.index.discard(_entry_hash(filename))
+        return self._remove(filename)
+
+    def _map(self, func, items: list) -> list:
+        if len(items) < 2 or self.read_workers < 2:
+            return [func(item) for item in items]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.read_workers,
+                thread_name_prefix=self.__class__.__name__)
+        return list(self._executor.map(func, items))
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        keys = list(dict.fromkeys(keys))
+        filenames = [self._locate(key) for key in keys]
+        values = iter(self._map(
+            self._read, [name for name in filenames if name is not None]))
+        return {key: None if name is None else next(values)
+                for key, name in zip(keys, filenames)}
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        valid_until = self._valid_until(ttl)
+        for key, value in items.items():
+            self._write(self._filename(key), value, valid_until)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        deleted = 0
+        for key in dict.fromkeys(keys):
+            hash_name = self._hash(key)
+            if self.index is not None:
+                self.index.discard(hash_name)
+            removed = self._remove(self._hash_filename(hash_name))
+            if self.legacy and self.levels:
+                removed = self._remove(
+                    self._legacy_filename(hash_name)) or removed
+            deleted += removed
+        return deleted
+
+    def delete(self, key: str) -> bool:
+        return self.delete_many([key]) > 0
+
+    @contextlib.contextmanager
+    def _entry_lock(self, key: str) -> Iterator[str]:
+        """Lock the entry of key, yields its filename"""
+        hash_name = self._hash(key)
+        filename = self._hash_filename(hash_name)
+        lock_name = os.path.join(os.path.dirname(filename),
+                                 f'{LOCK_PREFIX}{hash_name}')
+        with self._locks[int(hash_name[:8], 16) % LOCK_STRIPES]:
+            fd = self._acquire(lock_name)
+            try:
+                yield filename
+            finally:
+                if fcntl is None:
+                    os.close(fd)
+                # Removed while flocked: waiters check they hold the file
+                self._remove(lock_name)
+                if fcntl is not None:
+                    os.close(fd)
+
+    def _acquire(self, lock_name: str) -> int:
+        """Descriptor of the locked lock file. Raises TimeoutError after
+        LOCK_TIMEOUT seconds."""
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        delay = 0.0005
+        while True:
+            fd = self._try_lock(lock_name)
+            if fd is not None:
+                return fd
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'Timeout waiting for lock {lock_name}')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def _try_lock(self, lock_name: str) -> Optional[int]:
+        flags = os.O_CREAT | os.O_WRONLY
+        if fcntl is None:
+            flags |= os.O_EXCL
+        try:
+            fd = os.open(lock_name, flags, 0o600)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(lock_name), exist_ok=True)
+            return None
+        except FileExistsError:
+            return None
+        if fcntl is None:
+            return fd
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # The previous holder may have removed the file meanwhile
+            if os.fstat(fd).st_ino == os.stat(lock_name).st_ino:
+                return fd
+        except OSError:
+            pass
+        os.close(fd)
+        return None
+
+    def _read_atomic(self, key: str) -> Optional[Tuple[str, float]]:
+        """Entry of key for atomic operations: read from the file system
+        even if the index misses it (written by another process)"""
+        entry = self._read_entry(self._locate(key, use_index=False))
+        if entry is not None and self.index is not None:
+            self.index.add(self._hash(key))
+        return entry
+
+    def add(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        with self._entry_lock(key) as filename:
+            if self._read_atomic(key) is not None:
+                return False
+            return self._write(filename, value, self._valid_until(ttl))
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        with self._entry_lock(key) as filename:
+            entry = self._read_atomic(key)
+            if entry is None:
+                value, valid_until = delta, self._valid_until(ttl)
+            else:
+                value = parse_counter(entry[0]) + delta
+                valid_until = entry[1]
+            if not self._write(filename, str(value), valid_until):
+                raise OSError(f'Error writing counter {key!r}')
+            return value
+
+    def cas(self, key: str, expected: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        with self._entry_lock(key) as filename:
+            entry = self._read_atomic(key)
+            if entry is None or entry[0] != expected:
+                return False
+            return self._write(filename, value, self._valid_until(ttl))
+
+    def compact(self) -> 'JanitorReport':
+        """Remove expired entries and enforce the quota (full pass)"""
+        return self.janitor.run()
+
+    def start_janitor(self, interval: float = 60.0,
+                      max_files: int = 1000) -> None:
+        """Start a daemon thread that runs a janitor step of max_files
+        entries every interval seconds."""
+        if self._janitor_thread:
+            return
+        self._janitor_stop = threading.Event()
+        self._janitor_thread = threading.Thread(
+            target=self._janitor_loop, args=(interval, max_files),
+            name=f'{self.__class__.__name__}-janitor', daemon=True)
+        self._janitor_thread.start()
+
+    def stop_janitor(self) -> None:
+        """Stop the background janitor"""
+        if not self._janitor_thread:
+            return
+        self._janitor_stop.set()
+        self._janitor_thread.join()
+        self._janitor_thread = None
+
+    def _janitor_loop(self, interval: float, max_files: int) -> None:
+        while not self._janitor_stop.wait(interval):
+            try:
+                self.janitor.step(max_files)
+            except Exception as exc:  # pylint: disable=broad-except
+                self.log.error('Janitor error: %s', exc)
+                self.errors += 1
 
     def parse(self, connection_string: str) -> 'Cache':
-        """path:str"""
+        """path:str[?read_workers=int&levels=int&migrate=1
+        &max_bytes=size&max_files=int&janitor_interval=seconds
+        &janitor_slice=int&serializer=name&compression=name
+        &compress_min=size&compress_level=int&index=1
+        &index_rebuild=seconds&metrics=1]"""
         words = connection_string.split(':', maxsplit=1)
         if len(words) != 2 or words[0] != 'path':
             return None
-        path = words[1]
+        path, options = split_options(words[1])
+        self.configure_metrics(options)
+        self.read_workers = int(options.get('read_workers',
+                                            self.read_workers))
+        self.levels = int(options.get('levels', self.levels))
+        self.max_bytes = parse_size(options.get('max_bytes', self.max_bytes))
+        self.max_files = int(options.get('max_files', self.max_files))
+        self.codec = codec_from_options(options)
         if not os.path.isdir(path):
             os.makedirs(path, exist_ok=True)
         self.path = path
+        if self.levels:
+            if parse_bool(options.get('migrate', '0')):
+                self.migrate()
+            else:
+                self.legacy = self._has_legacy_entries()
+        if parse_bool(options.get('index', '0')) or \
+                float(options.get('index_rebuild', 0)) > 0:
+            self.enable_index(float(options.get('index_rebuild', 0)))
+        if float(options.get('janitor_interval', 0)) > 0:
+            self.start_janitor(float(options['janitor_interval']),
+                               int(options.get('janitor_slice', 1000)))
+        self.log.info('Initialized')
         return self
+
+
+def walk_files(path: str) -> Iterator[os.DirEntry]:
+    """Files in path and its subdirectories"""
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from walk_files(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+    except FileNotFoundError:
+        return
+
+
+def _entry_hash(filename: str) -> str:
+    """Hash name of an entry file (tree or flat layout)"""
+    return os.path.basename(filename)[:-len('.json')][-40:]
+
+
+class FileCacheIndex:
+    """Hashes of the entries stored by a FileCache.
+
+    Built by walking the cache directory on the first lookup, then kept
+    current by the writes and removals of this process, so a hash missing
+    from the index is a definite miss. Hashes present may belong to entries
+    removed by other processes (the lookup just reads the file system).
+
+    The first lookup, and with rebuild_interval (seconds) the lookup after
+    the interval, start a build in a background thread (to see entries
+    written by other processes): lookups never wait for it, they use the
+    previous index, or the file system until the first build ends."""
+
+    def __init__(self, cache: FileCache, rebuild_interval: float = 0):
+        self.cache = cache
+        self.rebuild_interval = rebuild_interval
+        self.builds = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._hashes: Optional[Set[str]] = None
+        # Writes and removals while a build walks the directory
+        self._added: Optional[Set[str]] = None
+        self._built_at = 0.0
+        self._builder: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._hashes or ())
+
+    def __contains__(self, hash_name: str) -> bool:
+        """False only if there is no entry for hash_name"""
+        if self._hashes is None or (
+                self.rebuild_interval and
+                time.monotonic() - self._built_at > self.rebuild_interval):
+            self._start_build()
+        hashes = self._hashes
+        if hashes is None or hash_name in hashes:
+            return True
+        self.skipped += 1
+        return False
+
+    def _start_build(self) -> None:
+        with self._lock:
+            if self._added is not None:
+                return
+            self._added = set()
+            self._builder = threading.Thread(
+                target=self._background_build, daemon=True,
+                name=f'{self.__class__.__name__}-build')
+            self._builder.start()
+
+    def _background_build(self) -> None:
+        try:
+            self._build()
+        except Exception as exc:  # pylint: disable=broad-except
+            # Retried by the next lookup that needs a build
+            self.cache.log.error('Error building the key index: %s', exc)
+
+    def build(self) -> int:
+        """Walk the cache directory. Returns the number of entries (0 if
+        another thread is building)."""
+        with self._lock:
+            if self._added is not None:
+                return 0
+            self._added = set()
+        return self._build()
+
+    def join(self, timeout: float = None) -> None:
+        """Wait for a background build"""
+        builder = self._builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def _build(self) -> int:
+        try:
+            hashes = {_entry_hash(entry.name)
+                      for entry in walk_files(self.cache.path)
+                      if entry.name.endswith('.json')}
+        except BaseException:
+            with self._lock:
+                self._added = None
+            raise
+        with self._lock:
+            hashes |= self._added
+            self._hashes = hashes
+            self._added = None
+            self._built_at = time.monotonic()
+            self.builds += 1
+        return len(hashes)
+
+    def add(self, hash_name: str) -> None:
+        """Entry written"""
+        with self._lock:
+            if self._hashes is not None:
+                self._hashes.add(hash_name)
+            if self._added is not None:
+                self._added.add(hash_name)
+
+    def discard(self, hash_name: str) -> None:
+        """Entry removed"""
+        with self._lock:
+            if self._hashes is not None:
+                self._hashes.discard(hash_name)
+            if self._added is not None:
+                self._added.discard(hash_name)
+
+
+@dataclass
+class JanitorReport:
+    """Janitor work summary"""
+    scanned: int = 0
+    expired: int = 0
+    evicted: int = 0
+    bytes_reclaimed: int = 0
+    complete: bool = False
+
+    def as_dict(self) -> dict:
+        """Report as dict"""
+        return asdict(self)
+
+
+class FileCacheJanitor:
+    """Removes expired entries and enforces the quota of a FileCache.
+
+    step() scans up to max_files entries, continuing where the previous
+    step stopped. When a pass over the whole directory completes, the cache
+    usage is updated and, if it is over quota, the least recently used
+    entries are removed until usage is under QUOTA_LOW_WATERMARK of the
+    limits."""
+    # pylint: disable=protected-access
+
+    def __init__(self, cache: FileCache):
+        self.cache = cache
+        self.log = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.RLock()
+        self._iterator: Iterator[os.DirEntry] = None
+        self._live: List[Tuple[float, int, str]] = []
+
+    def run(self) -> JanitorReport:
+        """Complete the current pass (or run a full pass)"""
+        report = JanitorReport()
+        with self._lock:
+            while not report.complete:
+                step = self.step(0)
+                report.scanned += step.scanned
+                report.expired += step.expired
+                report.evicted += step.evicted
+                report.bytes_reclaimed += step.bytes_reclaimed
+                report.complete = step.complete
+        return report
+
+    def step(self, max_files: int = 1000) -> JanitorReport:
+        """Scan up to max_files entries (0 = until the pass completes)"""
+        report = JanitorReport()
+        with self._lock:
+            if self._iterator is None:
+                self._iterator = walk_files(self.cache.path)
+                self._live = []
+            now = time.time()
+            for entry in self._iterator:
+                self._check(entry, now, report)
+                if max_files and report.scanned >= max_files:
+                    return report
+            self._iterator = None
+            report.complete = True
+            self._finish_pass(report)
+        return report
+
+    def _check(self, entry: os.DirEntry, now: float,
+               report: JanitorReport) -> None:
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            return
+        report.scanned += 1
+        if entry.name.startswith((TEMP_PREFIX, LOCK_PREFIX)):
+            if now - stat.st_mtime > TEMP_MAX_AGE and \
+                    self.cache._remove(entry.path):
+                report.bytes_reclaimed += stat.st_size
+            return
+        if not entry.name.endswith('.json'):
+            return
+        valid_until = self.cache.read_valid_until(entry.path)
+        if valid_until is None or valid_until <= now:
+            if self.cache._remove_entry(entry.path):
+                report.expired += 1
+                self.cache.expirations += 1
+                report.bytes_reclaimed += stat.st_size
+            return
+        self._live.append((stat.st_mtime, stat.st_size, entry.path))
+
+    def _finish_pass(self, report: JanitorReport) -> None:
+        cache = self.cache
+        cache.usage_bytes = sum(size for _, size, _ in self._live)
+        cache.usage_files = len(self._live)
+        if cache.over_quota():
+            self._live.sort()
+            for _, size, path in self._live:
+                if not cache.over_quota(QUOTA_LOW_WATERMARK):
+                    break
+                if cache._remove_entry(path):
+                    report.evicted += 1
+                    cache.evictions += 1
+                    report.bytes_reclaimed += size
+                cache.usage_bytes -= size
+                cache.usage_files -= 1
+        self._live = []
+        if report.bytes_reclaimed:
+            self.log.info('Reclaimed %s bytes (%s expired, %s evicted)',
+                          report.bytes_reclaimed, report.expired,
+                          report.evicted)
@@ -0,0 +1,46 @@
+"""File cache janitor command line
+
+Usage:
+    python -m gs.cache.janitor path:/path/to/cache?max_bytes=1GB [--loop 60]
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import List
+
+from .file_cache import FileCache
+
+
+def main(args: List[str] = None) -> int:
+    """Run the janitor once (or every --loop seconds) and print the report
+    as JSON."""
+    parser = argparse.ArgumentParser(
+        prog='python -m gs.cache.janitor',
+        description='Remove expired entries and enforce the quota of a '
+        'file cache')
+    parser.add_argument('connection_string',
+                        help='path:/path/to/cache[?max_bytes=size'
+                        '&max_files=int]')
+    parser.add_argument('--loop', type=float, default=0,
+                        help='Run every LOOP seconds')
+    parser.add_argument('--verbose', action='store_true')
+    options = parser.parse_args(args)
+    logging.basicConfig(
+        level=logging.INFO if options.verbose else logging.WARNING)
+
+    cache = FileCache().parse(options.connection_string)
+    if not cache:
+        parser.error(f'Invalid file cache {options.connection_string!r}')
+
+    while True:
+        report = cache.compact()
+        print(json.dumps(report.as_dict()), flush=True)
+        if not options.loop:
+            return 0
+        time.sleep(options.loop)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,35 +1,375 @@
 """Memory Cache"""
 import datetime
+import heapq
 import logging
-from typing import Union
+import math
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 from .cache_protocol import Cache
+from .eviction import EvictionPolicy, create_policy
+from .options import parse_bool, parse_size, split_options
+from .serializers import (Codec, codec_from_options, has_codec_options,
+                          parse_counter)
+from .stats import MetricsMixin
 
+NO_EXPIRATION = math.inf
 
-class MemoryCache(Cache):
-    """Memory Cache"""
 
-    def __init__(self):
+class MemoryCache(MetricsMixin, Cache):
+    """Memory Cache
+
+    Unbounded by default. When max_items and/or max_bytes are set, the cache
+    evicts entries using the selected policy (lru or lfu) and keeps an
+    approximate size (sys.getsizeof of keys and values) in size_bytes.
+
+    Expiration uses time.monotonic() deadlines, indexed by a heap. Every set
+    reclaims up to sweep_slice expired entries, so keys that are never read
+    again are removed too. A background sweeper (start_sweeper or the
+    sweep_interval option) does the same work periodically.
+
+    Thread safety: methods are serialized by a lock only when thread_safe
+    is set (thread_safe=1 option) or while the sweeper runs. Otherwise the
+    cache must be used by one thread at a time (the GIL does not make a
+    get, which may expire the entry, atomic). For many threads, use
+    ConcurrentMemoryCache (memory?shards=N), which spreads keys over
+    independently locked shards. Atomic operations (add, incr, cas, delete)
+    always hold the cache lock, so they are atomic with respect to each
+    other from any thread; mixed with set or get from other threads they
+    need thread_safe.
+
+    Values are stored as they are (any object). With serializer or
+    compression options, values are encoded by codec (see
+    serializers.Codec): stored values are copies and size accounting
+    reflects the encoded size.
+
+    Counters: evictions, evicted_bytes and expirations (see also stats())."""
+
+    def __init__(self, max_items: int = 0, max_bytes: int = 0,
+                 policy: str = 'lru', sweep_slice: int = 32,
+                 thread_safe: bool = False):
         self.log = logging.getLogger(self.__class__.__name__)
         self.cache = {}
+        self.expiry_heap: List[Tuple[float, str]] = []
+        self.max_items = 0
+        self.max_bytes = 0
+        self.policy: EvictionPolicy = None
+        self.sweep_slice = sweep_slice
+        self.size_bytes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.expirations = 0
+        self.thread_safe = thread_safe
+        # One lock for the life of the cache: get/set take it only while
+        # _locking (thread_safe or sweeper running), but never swap it
+        self.lock = threading.RLock()
+        self._locking = thread_safe
+        self.codec: Codec = None
+        self._sweeper: threading.Thread = None
+        self._sweeper_stop: threading.Event = None
+        self.configure(max_items, max_bytes, policy)
+
+    def configure(self, max_items: int = 0, max_bytes: int = 0,
+                  policy: str = 'lru') -> None:
+        """Set limits (0 = unlimited) and eviction policy"""
+        self.max_items = max(0, int(max_items))
+        self.max_bytes = max(0, int(max_bytes))
+        if self.bounded:
+            self.policy = create_policy(policy)
+            self.size_bytes = 0
+            for key, (value, _) in self.cache.items():
+                self.policy.add(key)
+                self.size_bytes += self._entry_size(key, value)
+            self._evict()
+        else:
+            self.policy = None
+
+    @property
+    def bounded(self) -> bool:
+        """True if there is any limit on items or bytes"""
+        return bool(self.max_items or self.max_bytes)
+
+    @staticmethod
+    def _entry_size(key: str, value) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(value)
 
     def get(self, key: str) -> Union[str, None]:
-        if key in self.cache:
-            value, valid_until = self.cache[key]
-            if valid_until > datetime.datetime.now():
-                return value
-            del self.cache[key]
+        if self._locking:
+            with self.lock:
+                return self._get(key)
+        return self._get(key)
+
+    def _get(self, key: str) -> Union[str, None]:
+        entry = self._get_entry(key)
+        if entry is None:
+            return None
+        return entry[0] if self.codec is None else \
+            self.codec.decode(entry[0])
+
+    def _get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] > time.monotonic():
+            if self.policy:
+                self.policy.touch(key)
+            return entry
+        self._remove(key)
+        self.expirations += 1
         return None
 
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        if self._locking:
+            with self.lock:
+                entry = self._get_entry(key)
+        else:
+            entry = self._get_entry(key)
+        return self._with_ttl(entry)
+
+    def _with_ttl(self, entry: Optional[Tuple[str, float]]
+                  ) -> Tuple[Union[str, None],
+                             Union[datetime.timedelta, None]]:
+        if entry is None:
+            return None, None
+        value, valid_until = entry
+        if self.codec is not None:
+            value = self.codec.decode(value)
+        if valid_until == NO_EXPIRATION:
+            return value, datetime.timedelta(0)
+        return value, datetime.timedelta(
+            seconds=valid_until - time.monotonic())
+
     def set(self, key: str, value: str,
             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
-        valid_until = datetime.datetime(datetime.MAXYEAR, 1, 1) if ttl.total_seconds(
-        ) == 0 else datetime.datetime.now() + ttl
+        if self._locking:
+            with self.lock:
+                self._set(key, value, ttl)
+        else:
+            self._set(key, value, ttl)
 
+    def _set(self, key: str, value: str, ttl: datetime.timedelta) -> None:
+        seconds = ttl.total_seconds()
+        self._store(key, value, NO_EXPIRATION if seconds == 0
+                    else time.monotonic() + seconds)
+
+    def _store(self, key: str, value: str, valid_until: float) -> None:
+        if self.codec is not None:
+            value = self.codec.encode(value)
+        if self.expiry_heap:
+            self._sweep(self.sweep_slice)
+        if valid_until != NO_EXPIRATION:
+            heapq.heappush(self.expiry_heap, (valid_until, key))
+
+        if not self.policy:
+            self.cache[key] = (value, valid_until)
+            return
+
+        size = self._entry_size(key, value)
+        if self.max_bytes and size > self.max_bytes:
+            # Would evict everything else and still not fit
+            self._remove(key)
+            return
+        if key in self.cache:
+            self.size_bytes += size - \
+                self._entry_size(key, self.cache[key][0])
+            self.policy.touch(key)
+            self.cache[key] = (value, valid_until)
+            self._evict()
+            return
+        # Make room before adding, so the new key is never its own victim
+        self._evict(extra_items=1, extra_bytes=size)
+        self.policy.add(key)
         self.cache[key] = (value, valid_until)
+        self.size_bytes += size
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        if self._locking:
+            with self.lock:
+                return {key: self._get(key) for key in keys}
+        return {key: self._get(key) for key in keys}
+
+    def get_many_with_ttl(self, keys: Iterable[str]
+                          ) -> Dict[str, Tuple[Union[str, None],
+                                               Union[datetime.timedelta,
+                                                     None]]]:
+        if self._locking:
+            with self.lock:
+                entries = {key: self._get_entry(key) for key in keys}
+        else:
+            entries = {key: self._get_entry(key) for key in keys}
+        return {key: self._with_ttl(entry) for key, entry in entries.items()}
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        if self._locking:
+            with self.lock:
+                for key, value in items.items():
+                    self._set(key, value, ttl)
+        else:
+            for key, value in items.items():
+                self._set(key, value, ttl)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        if self._locking:
+            with self.lock:
+                return self._delete_many(keys)
+        return self._delete_many(keys)
+
+    def _delete_many(self, keys: Iterable[str]) -> int:
+        deleted = 0
+        for key in keys:
+            if key in self.cache:
+                self._remove(key)
+                deleted += 1
+        return deleted
+
+    def delete(self, key: str) -> bool:
+        with self.lock:
+            if self._get_entry(key) is None:
+                return False
+            self._remove(key)
+            return True
+
+    def add(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        with self.lock:
+            if self._get_entry(key) is not None:
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        with self.lock:
+            entry = self._get_entry(key)
+            if entry is None:
+                self._set(key, str(delta), ttl)
+                return delta
+            value, valid_until = entry
+            if self.codec is not None:
+                value = self.codec.decode(value)
+            value = parse_counter(value) + delta
+            self._store(key, str(value), valid_until)
+            return value
+
+    def cas(self, key: str, expected: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        with self.lock:
+            current = self._get(key)
+            if current is None or current != expected:
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def sweep(self, max_items: int = 0) -> int:
+        """Remove up to max_items expired entries (0 = all expired entries).
+        Returns the number of removed entries."""
+        if self._locking:
+            with self.lock:
+                return self._sweep(max_items)
+        return self._sweep(max_items)
+
+    def _sweep(self, max_items: int = 0) -> int:
+        heap = self.expiry_heap
+        now = time.monotonic()
+        removed = 0
+        popped = 0
+        while heap and heap[0][0] <= now and \
+                (not max_items or popped < max_items):
+            valid_until, key = heapq.heappop(heap)
+            popped += 1
+            entry = self.cache.get(key)
+            # Heap entries are not updated on overwrite: skip stale ones
+            if entry is not None and entry[1] == valid_until:
+                self._remove(key)
+                removed += 1
+        self.expirations += removed
+
+        # Overwritten keys leave stale heap entries behind
+        if len(heap) > 2 * len(self.cache) + 1024:
+            self.expiry_heap = [(entry[1], key)
+                                for key, entry in self.cache.items()
+                                if entry[1] != NO_EXPIRATION]
+            heapq.heapify(self.expiry_heap)
+        return removed
+
+    def start_sweeper(self, interval: float = 1.0) -> None:
+        """Start a daemon thread that sweeps expired entries every interval
+        seconds, in slices of sweep_slice entries."""
+        if self._sweeper:
+            return
+        self._locking = True
+        self._sweeper_stop = threading.Event()
+        self._sweeper = threading.Thread(
+            target=self._sweeper_loop, args=(interval,),
+            name=f'{self.__class__.__name__}-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        """Stop the background sweeper"""
+        if not self._sweeper:
+            return
+        self._sweeper_stop.set()
+        self._sweeper.join()
+        self._sweeper = None
+        self._locking = self.thread_safe
+
+    def _sweeper_loop(self, interval: float) -> None:
+        while not self._sweeper_stop.wait(interval):
+            # The lock is released between slices to keep get/set latency low
+            while self.sweep(self.sweep_slice or 32) and \
+                    not self._sweeper_stop.is_set():
+                ...
+
+    def _remove(self, key: str) -> None:
+        entry = self.cache.pop(key, None)
+        if entry is not None and self.policy:
+            self.policy.remove(key)
+            self.size_bytes -= self._entry_size(key, entry[0])
+
+    def _evict(self, extra_items: int = 0, extra_bytes: int = 0) -> None:
+        max_items = self.max_items - extra_items
+        max_bytes = self.max_bytes - extra_bytes
+        if self._over_limits(max_items, max_bytes) and self.expiry_heap:
+            # Expired entries go first, in a bounded slice
+            self._sweep(self.sweep_slice or 32)
+        while self._over_limits(max_items, max_bytes):
+            key = self.policy.victim()
+            if key is None:
+                break
+            size = self._entry_size(key, self.cache[key][0])
+            self._remove(key)
+            self.evictions += 1
+            self.evicted_bytes += size
+
+    def _over_limits(self, max_items: int, max_bytes: int) -> bool:
+        return bool((self.max_items and len(self.cache) > max_items) or
+                    (self.max_bytes and self.size_bytes > max_bytes))
 
     def parse(self, connection_string: str) -> "MemoryCache":
-        if connection_string == "memory":
-            self.log.info('Initialized')
-            return self
-        return False
+        """memory[?max_items=int&max_bytes=size&policy=lru|lfu
+        &sweep_slice=int&sweep_interval=seconds&serializer=name
+        &compression=name&compress_min=size&compress_level=int&metrics=1
+        &thread_safe=1]"""
+        base, options = split_options(connection_string)
+        if base != "memory":
+            return False
+        self.configure_metrics(options)
+        if parse_bool(options.get('thread_safe', '0')):
+            self.thread_safe = True
+            self._locking = True
+        self.sweep_slice = int(options.get('sweep_slice', self.sweep_slice))
+        if has_codec_options(options):
+            self.codec = codec_from_options(options)
+        self.configure(max_items=int(options.get('max_items', 0)),
+                       max_bytes=parse_size(options.get('max_bytes', 0)),
+                       policy=options.get('policy', 'lru'))
+        if float(options.get('sweep_interval', 0)) > 0:
+            self.start_sweeper(float(options['sweep_interval']))
+        self.log.info('Initialized')
+        return self
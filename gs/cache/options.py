@@ -0,0 +1,38 @@
+"""Connection string options"""
+from typing import Dict, Tuple
+from urllib.parse import parse_qsl
+
+_SIZE_UNITS = {
+    'B': 1,
+    'KB': 1024,
+    'MB': 1024 ** 2,
+    'GB': 1024 ** 3,
+    'TB': 1024 ** 4,
+}
+
+
+def split_options(connection_string: str) -> Tuple[str, Dict[str, str]]:
+    """Split 'base?key=value&...' into (base, {key: value})."""
+    base, _, query = connection_string.partition('?')
+    return base, dict(parse_qsl(query, keep_blank_values=True))
+
+
+def parse_size(value: str) -> int:
+    """Parse size strings like '1024', '64KB', '256MB' or '1.5GB' as bytes."""
+    text = str(value).strip().upper()
+    for unit in sorted(_SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            number = text[:-len(unit)].strip()
+            try:
+                return int(float(number) * _SIZE_UNITS[unit])
+            except ValueError as exc:
+                raise ValueError(f'Invalid size {value!r}') from exc
+    try:
+        return int(text)
+    except ValueError as exc:
+        raise ValueError(f'Invalid size {value!r}') from exc
+
+
+def parse_bool(value: str) -> bool:
+    """Parse boolean option values ('1', 'true', 'yes', 'on')."""
+    return str(value).strip().lower() in ('1', 't', 'true', 'y', 'yes', 'on')
@@ -1,40 +1,369 @@
 """Redis Cache"""
 import datetime
 import logging
-from typing import Union
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple, Union
+from urllib.parse import urlencode
 
-import redis.utils
+import redis
 
 from .cache_protocol import Cache
+from .options import parse_bool, split_options
+from .serializers import Codec, codec_from_options, parse_counter
+from .stats import MetricsMixin
 
+DEFAULT_MAX_CONNECTIONS = 50
 
-class RedisCache(Cache):
-    """Redis Cache"""
+# KEYS[1]: key, ARGV: expected, value, time to live in milliseconds (0: none)
+CAS_SCRIPT = '''
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+else
+    redis.call('SET', KEYS[1], ARGV[2])
+end
+return 1
+'''
+
+_POOLS: Dict[str, redis.ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_connection_pool(url: str) -> redis.ConnectionPool:
+    """Return the shared, size-limited connection pool for url.
+
+    Query parameters are parsed by redis (max_connections, socket_timeout,
+    socket_connect_timeout, health_check_interval, ...). Pools block up to
+    the timeout parameter (seconds) waiting for a free connection."""
+    with _POOLS_LOCK:
+        pool = _POOLS.get(url)
+        if pool is None:
+            base, options = split_options(url)
+            options.setdefault('max_connections',
+                               str(DEFAULT_MAX_CONNECTIONS))
+            pool = redis.BlockingConnectionPool.from_url(
+                f'{base}?{urlencode(options)}')
+            _POOLS[url] = pool
+        return pool
+
+
+def close_connection_pools() -> None:
+    """Disconnect and forget all shared connection pools"""
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.disconnect()
+        _POOLS.clear()
+
+
+class PipelineError(redis.RedisError):
+    """Writes of a background pipeline flush were lost"""
+
+
+class AutoPipeline:
+    """Merges concurrent writes into a single pipeline flush.
+
+    Commands are queued and sent when max_size commands are pending or
+    delay seconds after the first queued command, whichever comes first.
+    Flushes are serialized, so commands reach redis in queue order.
+
+    Delayed flushes run in one flusher thread per pipeline, started on the
+    first queued command. When a delayed flush fails, its commands are lost
+    and the next add or flush raises PipelineError (errors counts them)."""
+
+    def __init__(self, client: redis.Redis, max_size: int = 100,
+                 delay: float = 0.002):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.client = client
+        self.max_size = max_size
+        self.delay = delay
+        self.flushes = 0
+        self.errors = 0
+        self._pending: List[Tuple[str, tuple, dict]] = []
+        self._lock = threading.Lock()
+        self._queued = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._error: Exception = None
+        self._flusher: threading.Thread = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _raise_error(self) -> None:
+        """Report a failed background flush (call holding _lock)"""
+        error, self._error = self._error, None
+        if error is not None:
+            raise PipelineError(
+                f'Pipelined writes were lost: {error}') from error
+
+    def add(self, command: str, *args, **kwargs) -> None:
+        """Queue a command"""
+        with self._lock:
+            self._raise_error()
+            self._pending.append((command, args, kwargs))
+            # Closed pipelines send commands right away
+            full = len(self._pending) >= self.max_size or self._closed
+            if not full:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(
+                        target=self._run, daemon=True,
+                        name=f'{self.__class__.__name__}-flusher')
+                    self._flusher.start()
+                self._queued.notify()
+        if full:
+            self.flush()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._queued.wait()
+                if self._closed:
+                    return
+            time.sleep(self.delay)
+            try:
+                self._flush()
+            except Exception as exc:
+                self.log.error('Error flushing pipeline: %s', exc)
+                with self._lock:
+                    self.errors += 1
+                    self._error = exc
+
+    def flush(self) -> None:
+        """Send all pending commands in one round trip. Raises
+        PipelineError if a background flush failed since the last call."""
+        with self._lock:
+            self._raise_error()
+        self._flush()
+
+    def _flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            pipeline = self.client.pipeline(transaction=False)
+            for command, args, kwargs in pending:
+                getattr(pipeline, command)(*args, **kwargs)
+            pipeline.execute()
+            self.flushes += 1
+
+    def close(self) -> None:
+        """Flush pending commands and stop the flusher thread"""
+        with self._lock:
+            self._closed = True
+            self._queued.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+
+class RedisCache(MetricsMixin, Cache):
+    """Redis Cache
+
+    Instances for the same URL share one size-limited connection pool.
+    With auto_pipeline, writes are queued and merged into pipeline flushes
+    (see AutoPipeline); reads flush pending writes first, so a client
+    always reads its own writes.
+
+    Values are encoded by codec (see serializers.Codec).
+
+    Atomic operations run on the server: add is SET NX, incr is INCRBY
+    (in a MULTI with SET NX to apply the ttl of new counters) and cas is a
+    Lua script.
+
+    stats() errors include failed background pipeline flushes (the next
+    call raises PipelineError after one of them); expirations and
+    evictions happen on the server (see redis INFO stats)."""
 
     def __init__(self):
         self.log = logging.getLogger(self.__class__.__name__)
         self.redis: redis.Redis = None
+        self.pipeline: AutoPipeline = None
+        self.codec = Codec()
+
+    @property
+    def errors(self) -> int:
+        """Failed background pipeline flushes"""
+        return 0 if self.pipeline is None else self.pipeline.errors
 
     def get(self, key: str) -> Union[str, None]:
         """Return value or None if not found."""
-        value = self.redis.get(key)
-        if isinstance(value, bytes):
-            value = value.decode('utf-8')
-        return value
+        if self.pipeline is not None:
+            self.pipeline.flush()
+        return self.codec.decode(self.redis.get(key))
 
     def set(self, key: str, value: str,
             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
         """Set value with time to live"""
+        write = self._execute if self.pipeline is None \
+            else self.pipeline.add
+        value = self.codec.encode(value)
         if ttl.total_seconds() > 0:
-            self.redis.set(key, value, ex=int(ttl.total_seconds()))
+            write('set', key, value, ex=int(ttl.total_seconds()))
         elif ttl.total_seconds() == 0:
-            self.redis.set(key, value)
+            write('set', key, value)
+
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        """Return (value, remaining time to live) with GET and PTTL in a
+        single round trip."""
+        self.flush()
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.get(key)
+        pipeline.pttl(key)
+        return self._with_ttl(*pipeline.execute())
+
+    def _with_ttl(self, value: bytes, pttl: int
+                  ) -> Tuple[Union[str, None],
+                             Union[datetime.timedelta, None]]:
+        # PTTL -2: the key expired or was deleted after GET
+        if value is None or pttl == -2:
+            return None, None
+        value = self.codec.decode(value)
+        if pttl is None or pttl < 0:
+            # -1: no expiration
+            return value, datetime.timedelta(0)
+        return value, datetime.timedelta(milliseconds=pttl)
+
+    def _execute(self, command: str, *args, **kwargs):
+        return getattr(self.redis, command)(*args, **kwargs)
+
+    def flush(self) -> None:
+        """Send pending auto-pipelined writes"""
+        if self.pipeline is not None:
+            self.pipeline.flush()
+
+    def close(self) -> None:
+        """Flush pending writes and stop the auto pipeline flusher. The
+        shared connection pool stays open (see close_connection_pools)."""
+        if self.pipeline is not None:
+            self.pipeline.close()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        """Read all keys with a single MGET"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        self.flush()
+        return {key: self.codec.decode(value)
+                for key, value in zip(keys, self.redis.mget(keys))}
+
+    def get_many_with_ttl(self, keys: Iterable[str]
+                          ) -> Dict[str, Tuple[Union[str, None],
+                                               Union[datetime.timedelta,
+                                                     None]]]:
+        """GET and PTTL of all keys in a single pipeline round trip"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        self.flush()
+        pipeline = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.get(key)
+            pipeline.pttl(key)
+        results = pipeline.execute()
+        return {key: self._with_ttl(value, pttl)
+                for key, value, pttl in zip(keys, results[::2], results[1::2])}
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        """Write all values in a single pipeline round trip"""
+        seconds = ttl.total_seconds()
+        if seconds < 0 or not items:
+            return
+        self.flush()
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, value in items.items():
+            value = self.codec.encode(value)
+            if seconds > 0:
+                pipeline.set(key, value, ex=int(seconds))
+            else:
+                pipeline.set(key, value)
+        pipeline.execute()
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Delete all keys with a single DEL"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return 0
+        self.flush()
+        return self.redis.delete(*keys)
+
+    @staticmethod
+    def _milliseconds(ttl: datetime.timedelta) -> int:
+        """PX argument of a positive ttl (0 for no expiration)"""
+        seconds = ttl.total_seconds()
+        return max(1, int(seconds * 1000)) if seconds > 0 else 0
+
+    def delete(self, key: str) -> bool:
+        self.flush()
+        return bool(self.redis.delete(key))
+
+    def add(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        """SET NX"""
+        if ttl.total_seconds() < 0:
+            return False
+        self.flush()
+        return bool(self.redis.set(key, self.codec.encode(value), nx=True,
+                                   px=self._milliseconds(ttl) or None))
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        """INCRBY"""
+        self.flush()
+        milliseconds = self._milliseconds(ttl)
+        try:
+            if not milliseconds:
+                return parse_counter(self.redis.incrby(key, delta))
+            pipeline = self.redis.pipeline(transaction=True)
+            pipeline.set(key, 0, nx=True, px=milliseconds)
+            pipeline.incrby(key, delta)
+            return parse_counter(pipeline.execute()[1])
+        except redis.ResponseError as exc:
+            raise ValueError(f'Value of {key!r} is not an integer') from exc
+
+    def cas(self, key: str, expected: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        """Compares encoded values in a Lua script"""
+        if ttl.total_seconds() < 0:
+            return False
+        self.flush()
+        return bool(self.redis.eval(
+            CAS_SCRIPT, 1, key, self.codec.encode(expected),
+            self.codec.encode(value), self._milliseconds(ttl)))
 
     def parse(self, connection_string: str) -> 'Cache':
-        """Parse connection string and return instance of Cache if valid."""
+        """redis://host:port/db_number[?options]
+
+        Pool options: max_connections, socket_timeout, timeout, ...
+        Pipeline options: auto_pipeline=1, pipeline_size (default 100),
+        pipeline_delay (seconds, default 0.002)
+        Value options: serializer, compression, compress_min,
+        compress_level
+        Metrics: metrics=1 (see stats())"""
         if not connection_string.startswith('redis://'):
             return None
 
-        self.redis = redis.utils.from_url(connection_string)
+        base, options = split_options(connection_string)
+        self.configure_metrics(options)
+        auto_pipeline = parse_bool(options.pop('auto_pipeline', '0'))
+        pipeline_size = int(options.pop('pipeline_size', 100))
+        pipeline_delay = float(options.pop('pipeline_delay', 0.002))
+        self.codec = codec_from_options(options)
+        url = f'{base}?{urlencode(sorted(options.items()))}' \
+            if options else base
+
+        self.redis = redis.Redis(connection_pool=get_connection_pool(url))
+        if auto_pipeline:
+            self.pipeline = AutoPipeline(
+                self.redis, pipeline_size, pipeline_delay)
         self.log.info('Initialized')
         return self
@@ -0,0 +1,224 @@
+"""Refreshing Cache (stale-while-revalidate and refresh-ahead)"""
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Set, Tuple, Union
+
+from .cache_protocol import Cache
+from .cached import _as_timedelta
+from .single_flight import SingleFlight
+
+# Access counters kept for keys close to expiration
+MAX_TRACKED_KEYS = 10000
+# Counters aged (halved) per tracked key over the limit
+AGING_SLICE = 8
+
+Loader = Callable[[str], Any]
+
+
+class RefreshingCache(Cache):
+    """Serves stale values while a loader refreshes them in background.
+
+    Entries have a soft TTL (ttl) and a hard TTL (ttl + stale_ttl): they
+    are stored in cache with the hard TTL, and the remaining time tells
+    whether they are fresh. Works with every backend.
+
+    - fresh: returned
+    - stale (soft TTL elapsed, hard TTL not): returned at once, and
+      loader(key) runs in background to replace it
+    - missing or expired: loader(key) runs in the caller (concurrent
+      callers for the same key wait for a single load)
+    - refresh-ahead: fresh entries read at least refresh_hits times when
+      less than refresh_ahead * ttl of their soft TTL remains are refreshed
+      early (refresh_ahead=0.2: during the last 20% of ttl)
+
+    Loader errors in background refreshes are logged and the stale value
+    is kept. loader returning None means "no value" (nothing is stored).
+    stats() reports hits, stale hits, misses and refreshes.
+
+    Access counts are kept for up to MAX_TRACKED_KEYS keys: past the limit,
+    each new key ages a few of the least recently read counters (halving
+    them, dropping one), so hot keys keep their counts."""
+
+    def __init__(self, cache: Cache, loader: Loader = None,
+                 ttl: Union[datetime.timedelta, float] = 60,
+                 stale_ttl: Union[datetime.timedelta, float] = 300,
+                 refresh_ahead: float = 0.0, refresh_hits: int = 2,
+                 refresh_workers: int = 4):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.cache = cache
+        self.loader = loader
+        self.ttl = _as_timedelta(ttl)
+        self.stale_ttl = _as_timedelta(stale_ttl)
+        self.refresh_ahead = refresh_ahead
+        self.refresh_hits = refresh_hits
+        self.refresh_workers = refresh_workers
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.early_refreshes = 0
+        self.refresh_errors = 0
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._refreshing: Set[str] = set()
+        self._accesses: 'OrderedDict[str, int]' = OrderedDict()
+        self._executor: ThreadPoolExecutor = None
+
+    def _hard_ttl(self, ttl: datetime.timedelta) -> datetime.timedelta:
+        # timedelta(0): no expiration, never stale
+        return ttl + self.stale_ttl if ttl else ttl
+
+    def get(self, key: str, loader: Loader = None) -> Any:
+        """Value of key, loaded by loader (default: the cache loader) when
+        missing, refreshed in background when stale"""
+        return self.get_with_ttl(key, loader)[0]
+
+    def get_with_ttl(self, key: str, loader: Loader = None
+                     ) -> Tuple[Any, Union[datetime.timedelta, None]]:
+        """(value, remaining soft TTL), negative for stale values"""
+        loader = loader or self.loader
+        value, remaining = self.cache.get_with_ttl(key)
+        if value is None:
+            self._count('misses')
+            if loader is None:
+                return None, None
+            value = self._flight.do(key, self._load, key, loader)
+            return value, None if value is None else self.ttl
+        if not remaining:
+            self._count('hits')
+            return value, remaining
+        fresh = remaining - self.stale_ttl
+        if fresh <= datetime.timedelta(0):
+            self._count('stale_hits')
+            if loader is not None:
+                self._schedule(key, loader)
+            return value, fresh
+        self._count('hits')
+        if loader is not None and self.refresh_ahead and \
+                fresh <= self.ttl * self.refresh_ahead and \
+                self._hot(key):
+            self._count('early_refreshes')
+            self._schedule(key, loader)
+        return value, fresh
+
+    def _count(self, counter: str) -> None:
+        # Called from callers and refresh workers
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _hot(self, key: str) -> bool:
+        with self._lock:
+            count = self._accesses.pop(key, 0) + 1
+            if not count - 1 and len(self._accesses) >= MAX_TRACKED_KEYS:
+                self._age()
+            self._accesses[key] = count
+            return count >= self.refresh_hits
+
+    def _age(self) -> None:
+        """Halve the least recently read counters, until one is dropped or
+        AGING_SLICE were halved (call holding _lock)"""
+        for _ in range(AGING_SLICE):
+            oldest, count = self._accesses.popitem(last=False)
+            if count < 2:
+                return
+            self._accesses[oldest] = count // 2
+        self._accesses.popitem(last=False)
+
+    def _load(self, key: str, loader: Loader) -> Any:
+        value = loader(key)
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def _schedule(self, key: str, loader: Loader) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._accesses.pop(key, None)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.refresh_workers,
+                    thread_name_prefix=self.__class__.__name__)
+            executor = self._executor
+        executor.submit(self._refresh, key, loader)
+
+    def _refresh(self, key: str, loader: Loader) -> None:
+        try:
+            self._flight.do(key, self._load, key, loader)
+            self._count('refreshes')
+        except Exception as exc:  # pylint: disable=broad-except
+            self._count('refresh_errors')
+            self.log.error('Error refreshing %s: %s', key, exc)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def set(self, key: str, value: Any,
+            ttl: datetime.timedelta = None) -> None:
+        """Store value, fresh for ttl (default: the cache ttl)"""
+        self.cache.set(key, value,
+                       self._hard_ttl(self.ttl if ttl is None else ttl))
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        return {key: self.get(key) for key in keys}
+
+    def set_many(self, items: Dict[str, Any],
+                 ttl: datetime.timedelta = None) -> None:
+        self.cache.set_many(
+            items, self._hard_ttl(self.ttl if ttl is None else ttl))
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        return self.cache.delete_many(keys)
+
+    def delete(self, key: str) -> bool:
+        return self.cache.delete(key)
+
+    def add(self, key: str, value: Any,
+            ttl: datetime.timedelta = None) -> bool:
+        """Store value if key is missing, fresh for ttl (default: the cache
+        ttl)"""
+        return self.cache.add(
+            key, value, self._hard_ttl(self.ttl if ttl is None else ttl))
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = None) -> int:
+        return self.cache.incr(
+            key, delta, self._hard_ttl(self.ttl if ttl is None else ttl))
+
+    def cas(self, key: str, expected: Any, value: Any,
+            ttl: datetime.timedelta = None) -> bool:
+        return self.cache.cas(
+            key, expected, value,
+            self._hard_ttl(self.ttl if ttl is None else ttl))
+
+    def close(self) -> None:
+        """Wait for scheduled refreshes and release the worker threads
+        (they are created again by the next refresh)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Hits (fresh), stale hits, misses and refreshes"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'early_refreshes': self.early_refreshes,
+            'refresh_errors': self.refresh_errors,
+            'hit_ratio': (self.hits + self.stale_hits) / lookups
+            if lookups else 0.0,
+        }
+
+    def parse(self, connection_string: str) -> 'Cache':
+        """Refreshing caches need a loader: build them with the
+        constructor"""
+        return None
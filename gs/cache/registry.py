@@ -0,0 +1,115 @@
+"""Cache backend registry"""
+import importlib
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from .options import split_options
+
+SCHEME_PATTERN = re.compile(r'^([A-Za-z][A-Za-z0-9+.-]*)(?=[:?]|$)')
+
+# Backend class or 'package.module:Class' (imported on first use)
+Backend = Union[type, str]
+
+
+def scheme_of(connection_string: str) -> Optional[str]:
+    """Scheme of a connection string: 'redis' for redis://host,
+    'memory' for memory?max_items=10, 'path' for path:/tmp/cache"""
+    match = SCHEME_PATTERN.match(connection_string)
+    return match.group(1).lower() if match else None
+
+
+class BackendRegistry:
+    """Maps connection string schemes to backend classes.
+
+    Backends are instantiated without arguments and configured by
+    parse(connection_string). A backend registered with option is selected
+    only when the connection string has that query option (memory?shards=4).
+    Backends registered later for the same scheme take precedence; a backend
+    whose parse returns None passes the connection string to the next one."""
+
+    def __init__(self):
+        self._backends: Dict[str, List[Tuple[Optional[str], Backend]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, scheme: str, backend: Backend,
+                 option: str = None) -> None:
+        """Register backend for scheme"""
+        with self._lock:
+            self._backends.setdefault(scheme.lower(), []).insert(
+                0, (option, backend))
+
+    @property
+    def schemes(self) -> List[str]:
+        """Registered schemes"""
+        return sorted(self._backends)
+
+    def _matching(self, connection_string: str) -> Iterator[type]:
+        """Backend classes for connection string, by precedence"""
+        options = None
+        for option, backend in self._backends.get(
+                scheme_of(connection_string), ()):
+            if option is not None:
+                if options is None:
+                    _, options = split_options(connection_string)
+                if option not in options:
+                    continue
+            yield _import(backend) if isinstance(backend, str) else backend
+
+    def create(self, connection_string: str):
+        """New backend instance configured by connection string"""
+        for backend in self._matching(connection_string):
+            instance = backend().parse(connection_string)
+            if instance:
+                return instance
+        raise Exception("Cache not found")
+
+
+def _import(path: str) -> type:
+    module, _, name = path.partition(':')
+    # import_module returns sys.modules entries after the first import
+    return getattr(importlib.import_module(module), name)
+
+
+class InstanceCache:
+    """Instances by connection string"""
+
+    def __init__(self, registry: BackendRegistry):
+        self.registry = registry
+        self._instances: Dict[str, object] = {}
+        # Reentrant: backends may get other caches while parsing
+        self._lock = threading.RLock()
+
+    def get(self, connection_string: str):
+        """Shared instance for connection string"""
+        instance = self._instances.get(connection_string)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(connection_string)
+            if instance is None:
+                instance = self.registry.create(connection_string)
+                self._instances[connection_string] = instance
+            return instance
+
+    def clear(self) -> None:
+        """Forget all instances"""
+        with self._lock:
+            self._instances.clear()
+
+
+SYNC_BACKENDS = BackendRegistry()
+ASYNC_BACKENDS = BackendRegistry()
+INSTANCES = InstanceCache(SYNC_BACKENDS)
+
+
+def register_backend(scheme: str, backend: Backend, option: str = None,
+                     asynchronous: bool = False) -> None:
+    """Make get_cache (or get_async_cache) accept scheme:... connection
+    strings.
+
+    backend: class with parse(connection_string), or 'module:Class' to
+    import it only when used.
+    option: select backend only if the connection string has this option."""
+    registry = ASYNC_BACKENDS if asynchronous else SYNC_BACKENDS
+    registry.register(scheme, backend, option)
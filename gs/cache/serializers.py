@@ -0,0 +1,216 @@
+"""Value serializers and compression"""
+import json
+import pickle
+import zlib
+from typing import Any, Dict, Union
+
+from .options import parse_size
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+# Encoded values start with MAGIC and a flags byte, except plain strings,
+# which are stored as UTF-8, as in previous versions (and readable by other
+# clients of the same redis/database).
+MAGIC = b'\x00gs'
+HEADER_SIZE = len(MAGIC) + 1
+
+FORMAT_MASK = 0x0F
+FORMAT_STR = 0
+FORMAT_BYTES = 1
+FORMAT_JSON = 2
+FORMAT_PICKLE = 3
+FORMAT_MSGPACK = 4
+
+COMPRESSION_ZLIB = 0x10
+COMPRESSION_LZ4 = 0x20
+
+DEFAULT_COMPRESS_MIN = 1024
+
+
+class Serializer:
+    """Serializer base class"""
+    name = ''
+
+    def dumps(self, value: Any) -> Union[bytes, str]:
+        """Serialize value (str values are UTF-8 encoded by Codec)"""
+        raise NotImplementedError
+
+    def format(self, value: Any) -> int:  # pylint: disable=unused-argument
+        """Format flag of value"""
+        raise NotImplementedError
+
+
+class RawSerializer(Serializer):
+    """str and bytes values, stored as they are"""
+    name = 'raw'
+
+    def dumps(self, value: Union[str, bytes]) -> Union[bytes, str]:
+        if not isinstance(value, (str, bytes, bytearray, memoryview)):
+            raise TypeError(
+                f'raw serializer accepts str or bytes, not {type(value)}')
+        return value
+
+    def format(self, value: Any) -> int:
+        return FORMAT_STR if isinstance(value, str) else FORMAT_BYTES
+
+
+class JSONSerializer(Serializer):
+    """JSON serializable values"""
+    name = 'json'
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def format(self, value: Any) -> int:
+        return FORMAT_JSON
+
+
+class PickleSerializer(Serializer):
+    """Any picklable value. Only read caches written by trusted code:
+    unpickling runs arbitrary code."""
+    name = 'pickle'
+
+    def dumps(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def format(self, value: Any) -> int:
+        return FORMAT_PICKLE
+
+
+class MsgpackSerializer(Serializer):
+    """msgpack serializable values (requires the msgpack package)"""
+    name = 'msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError('msgpack serializer requires msgpack package')
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def format(self, value: Any) -> int:
+        return FORMAT_MSGPACK
+
+
+SERIALIZERS = {
+    serializer.name: serializer
+    for serializer in (RawSerializer, JSONSerializer, PickleSerializer,
+                       MsgpackSerializer)
+}
+
+
+def _loads(value_format: int, payload: bytes) -> Any:
+    if value_format == FORMAT_STR:
+        return payload.decode('utf-8')
+    if value_format == FORMAT_BYTES:
+        return payload
+    if value_format == FORMAT_JSON:
+        return json.loads(payload)
+    if value_format == FORMAT_PICKLE:
+        return pickle.loads(payload)
+    if value_format == FORMAT_MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack value requires msgpack package')
+        return msgpack.unpackb(payload, raw=False)
+    raise ValueError(f'Unknown value format {value_format}')
+
+
+class Codec:
+    """Encodes values to bytes and back.
+
+    serializer: raw (str/bytes, default), json, pickle or msgpack
+    compression: None, zlib or lz4 (requires lz4 package), applied to
+    payloads of compress_min bytes or more.
+
+    decode() reads values written with any serializer or compression, and
+    plain strings from previous versions."""
+
+    def __init__(self, serializer: str = 'raw', compression: str = None,
+                 compress_min: int = DEFAULT_COMPRESS_MIN,
+                 compress_level: int = -1):
+        try:
+            self.serializer: Serializer = SERIALIZERS[serializer]()
+        except KeyError as exc:
+            raise ValueError(f'Unknown serializer {serializer!r}') from exc
+        if compression not in (None, '', 'none', 'zlib', 'lz4'):
+            raise ValueError(f'Unknown compression {compression!r}')
+        if compression == 'lz4' and lz4 is None:
+            raise ValueError('lz4 compression requires lz4 package')
+        self.compression = compression if compression not in (
+            '', 'none') else None
+        self.compress_min = compress_min
+        self.compress_level = compress_level
+
+    def encode(self, value: Any) -> bytes:
+        """Encode value"""
+        value_format = self.serializer.format(value)
+        payload = self.serializer.dumps(value)
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        flags = value_format
+        if self.compression and len(payload) >= self.compress_min:
+            if self.compression == 'zlib':
+                payload = zlib.compress(payload, self.compress_level)
+                flags |= COMPRESSION_ZLIB
+            else:
+                payload = lz4.frame.compress(payload)
+                flags |= COMPRESSION_LZ4
+        if flags == FORMAT_STR and not payload.startswith(MAGIC):
+            return payload
+        return MAGIC + bytes((flags,)) + bytes(payload)
+
+    def decode(self, data: Union[bytes, str, None]) -> Any:
+        """Decode value (None stays None)"""
+        if data is None or isinstance(data, str):
+            return data
+        data = bytes(data)
+        if not data.startswith(MAGIC) or len(data) < HEADER_SIZE:
+            try:
+                return data.decode('utf-8')
+            except UnicodeDecodeError:
+                return data
+        flags = data[len(MAGIC)]
+        payload = data[HEADER_SIZE:]
+        if flags & COMPRESSION_ZLIB:
+            payload = zlib.decompress(payload)
+        elif flags & COMPRESSION_LZ4:
+            if lz4 is None:
+                raise ValueError('lz4 value requires lz4 package')
+            payload = lz4.frame.decompress(payload)
+        return _loads(flags & FORMAT_MASK, payload)
+
+
+def parse_counter(value: Union[str, bytes, int]) -> int:
+    """Integer value of a counter (stored as decimal text by incr)"""
+    try:
+        return int(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f'Value is not an integer: {value!r}') from exc
+
+
+CODEC_OPTIONS = ('serializer', 'compression', 'compress_min',
+                 'compress_level')
+
+
+def codec_from_options(options: Dict[str, str]) -> Codec:
+    """Build a Codec from connection string options, removing them from
+    options (serializer, compression, compress_min, compress_level)"""
+    return Codec(
+        serializer=options.pop('serializer', 'raw'),
+        compression=options.pop('compression', None),
+        compress_min=parse_size(
+            options.pop('compress_min', DEFAULT_COMPRESS_MIN)),
+        compress_level=int(options.pop('compress_level', -1)))
+
+
+def has_codec_options(options: Dict[str, str]) -> bool:
+    """True if options configure a Codec"""
+    return any(option in options for option in CODEC_OPTIONS)
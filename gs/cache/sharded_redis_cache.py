@@ -0,0 +1,298 @@
+"""Sharded Redis Cache"""
+import bisect
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import (Callable, Dict, Iterable, List, Set, Tuple, TypeVar,
+                    Union)
+from urllib.parse import urlencode
+
+import redis
+
+from .cache_protocol import Cache
+from .options import split_options
+from .redis_cache import RedisCache
+from .stats import MetricsMixin
+
+DEFAULT_VNODES = 160
+DEFAULT_RETRY_INTERVAL = 30.0
+# Errors that take a node out of the ring
+NODE_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+Result = TypeVar('Result')
+
+
+def _point(text: str) -> int:
+    # Stable between processes, unlike hash()
+    return int.from_bytes(
+        hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(),
+        'little')
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Each node owns vnodes points of the ring; a key belongs to the node of
+    the first point after the key hash. Adding or removing a node only
+    moves the keys of its points (about 1/n of the keys)."""
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = DEFAULT_VNODES):
+        points = sorted((_point(f'{node}#{index}'), node)
+                        for node in nodes for index in range(vnodes))
+        self.nodes = sorted({node for _, node in points})
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node_of(self, key: str) -> str:
+        """Node of key"""
+        index = bisect.bisect(self._points, _point(key))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardedRedisCache(MetricsMixin, Cache):
+    """Cache spread over several redis servers by consistent hashing.
+
+    Every node is a RedisCache (with its own shared connection pool); keys
+    are mapped to nodes by a HashRing. Batch operations send one MGET,
+    pipeline or DEL per node.
+
+    A node failing with a connection or timeout error is taken out of the
+    ring for retry_interval seconds: reads and writes of its keys move to
+    the next nodes of the ring and the failed operation is retried there.
+    Keys written or deleted meanwhile are remembered: when the node comes
+    back, they are deleted on it before it rejoins the ring, so it never
+    serves the values it had before the outage.
+
+    Atomic operations (add, incr, cas) never move: they raise
+    redis.ConnectionError while the node of the key is out of the ring
+    (a counter or lock moved to another node would restart from scratch).
+
+    errors counts node failures."""
+
+    def __init__(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.nodes: Dict[str, RedisCache] = {}
+        self.vnodes = DEFAULT_VNODES
+        self.retry_interval = DEFAULT_RETRY_INTERVAL
+        self.errors = 0
+        self.ring: HashRing = None
+        # Ring of all nodes: where keys live when every node is up
+        self._owners: HashRing = None
+        self._down: Dict[str, float] = {}
+        # Keys written or deleted elsewhere while their node was down
+        self._moved: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def add_node(self, name: str, node: RedisCache) -> None:
+        """Add a node to the ring"""
+        with self._lock:
+            self.nodes[name] = node
+            self._owners = HashRing(self.nodes, self.vnodes)
+            self._build_ring()
+
+    def _build_ring(self) -> None:
+        self.ring = HashRing(
+            [name for name in self.nodes if name not in self._down],
+            self.vnodes)
+
+    def _mark_down(self, name: str, exc: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+            if name in self._down:
+                return
+            self._down[name] = time.monotonic() + self.retry_interval
+            self._build_ring()
+        self.log.warning('Node %s out of the ring for %ss: %s',
+                         name, self.retry_interval, exc)
+
+    def _current_ring(self) -> HashRing:
+        if self._down and min(self._down.values()) <= time.monotonic():
+            with self._lock:
+                now = time.monotonic()
+                back = [name for name, until in self._down.items()
+                        if until <= now]
+                for name in back:
+                    # Claimed by this thread until its moved keys are gone
+                    self._down[name] = math.inf
+            for name in back:
+                self._restore(name)
+        return self.ring
+
+    def _restore(self, name: str) -> None:
+        """Delete the keys moved off node name, then put it back in the
+        ring (or out for another retry_interval if it still fails)"""
+        while True:
+            with self._lock:
+                keys = self._moved.pop(name, None)
+                if not keys:
+                    del self._down[name]
+                    self._build_ring()
+                    break
+            try:
+                self.nodes[name].delete_many(keys)
+            except NODE_ERRORS as exc:
+                with self._lock:
+                    self.errors += 1
+                    self._moved.setdefault(name, set()).update(keys)
+                    self._down[name] = time.monotonic() + self.retry_interval
+                self.log.warning('Node %s still failing: %s', name, exc)
+                return
+        self.log.info('Node %s back in the ring', name)
+
+    def _track_moved(self, keys: Iterable[str]) -> None:
+        """Remember written or deleted keys whose node is out of the ring"""
+        if not self._down:
+            return
+        with self._lock:
+            for key in keys:
+                name = self._owners.node_of(key)
+                if name in self._down:
+                    self._moved.setdefault(name, set()).add(key)
+
+    def _on_owner(self, key: str,
+                  operation: Callable[[RedisCache], Result]) -> Result:
+        """Run operation on the node of key in the full ring, without
+        failover"""
+        self._current_ring()
+        name = self._owners.node_of(key)
+        if name in self._down:
+            raise redis.ConnectionError(
+                f'Redis node {name} is out of the ring')
+        try:
+            return operation(self.nodes[name])
+        except NODE_ERRORS as exc:
+            self._mark_down(name, exc)
+            raise
+
+    @property
+    def healthy_nodes(self) -> List[str]:
+        """Nodes in the ring"""
+        return list(self._current_ring().nodes)
+
+    def _dispatch(self, keys: List[str],
+                  operation: Callable[[RedisCache, List[str]], Result]
+                  ) -> List[Result]:
+        """Run operation with the keys of each node. Keys of failing nodes
+        are sent again to their new nodes."""
+        results = []
+        while keys:
+            ring = self._current_ring()
+            if not ring:
+                raise redis.ConnectionError('No healthy redis node')
+            groups: Dict[str, List[str]] = {}
+            for key in keys:
+                groups.setdefault(ring.node_of(key), []).append(key)
+            keys = []
+            for name, node_keys in groups.items():
+                try:
+                    results.append(operation(self.nodes[name], node_keys))
+                except NODE_ERRORS as exc:
+                    self._mark_down(name, exc)
+                    keys.extend(node_keys)
+        return results
+
+    def get(self, key: str) -> Union[str, None]:
+        return self._dispatch([key], lambda node, _: node.get(key))[0]
+
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        return self._dispatch(
+            [key], lambda node, _: node.get_with_ttl(key))[0]
+
+    def set(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
+        try:
+            self._dispatch([key], lambda node, _: node.set(key, value, ttl))
+        finally:
+            self._track_moved([key])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for values in self._dispatch(keys, RedisCache.get_many):
+            found.update(values)
+        return {key: found[key] for key in keys}
+
+    def get_many_with_ttl(self, keys: Iterable[str]
+                          ) -> Dict[str, Tuple[Union[str, None],
+                                               Union[datetime.timedelta,
+                                                     None]]]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for values in self._dispatch(keys, RedisCache.get_many_with_ttl):
+            found.update(values)
+        return {key: found[key] for key in keys}
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        try:
+            self._dispatch(list(items), lambda node, keys: node.set_many(
+                {key: items[key] for key in keys}, ttl))
+        finally:
+            self._track_moved(items)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        keys = list(dict.fromkeys(keys))
+        try:
+            return sum(self._dispatch(keys, RedisCache.delete_many))
+        finally:
+            self._track_moved(keys)
+
+    def delete(self, key: str) -> bool:
+        try:
+            return self._dispatch(
+                [key], lambda node, _: node.delete(key))[0]
+        finally:
+            self._track_moved([key])
+
+    def add(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        return self._on_owner(key, lambda node: node.add(key, value, ttl))
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        return self._on_owner(key, lambda node: node.incr(key, delta, ttl))
+
+    def cas(self, key: str, expected: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        return self._on_owner(
+            key, lambda node: node.cas(key, expected, value, ttl))
+
+    def flush(self) -> None:
+        """Send pending auto-pipelined writes of every node"""
+        for node in self.nodes.values():
+            node.flush()
+
+    def parse(self, connection_string: str) -> 'Cache':
+        """redis://host:port/db,redis://host:port/db[,...][?options]
+
+        Ring options: vnodes (points per node, default 160),
+        retry_interval (seconds out of the ring after a failure, default
+        30). Other options (pool, pipeline, value) apply to every node.
+        Metrics: metrics=1 (see stats())"""
+        if not connection_string.startswith('redis://'):
+            return None
+        base, options = split_options(connection_string)
+        urls = [url.strip() for url in base.split(',') if url.strip()]
+        if len(urls) < 2:
+            return None
+        for url in urls:
+            if not url.startswith('redis://'):
+                raise ValueError(f'Invalid redis node {url!r}')
+        self.configure_metrics(options)
+        self.vnodes = int(options.pop('vnodes', self.vnodes))
+        self.retry_interval = float(
+            options.pop('retry_interval', self.retry_interval))
+        query = f'?{urlencode(sorted(options.items()))}' if options else ''
+        for url in urls:
+            self.add_node(url, RedisCache().parse(f'{url}{query}'))
+        self.log.info('Initialized with %s nodes', len(self.nodes))
+        return self
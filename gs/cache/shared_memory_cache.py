@@ -0,0 +1,424 @@
+"""Shared Memory Cache"""
+import contextlib
+import datetime
+import hashlib
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from .cache_protocol import Cache
+from .options import parse_size, split_options
+from .serializers import Codec, codec_from_options, parse_counter
+from .stats import MetricsMixin
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+NO_EXPIRATION = math.inf
+
+FILE_MAGIC = b'GSSHM\x01'
+# magic, slot size, slot count
+FILE_HEADER = struct.Struct('<6s2xQQ')
+HEADER_SIZE = 4096
+# used, key hash, valid until (wall clock), key length, value length
+SLOT_HEADER = struct.Struct('<BQdHI')
+
+# Slots per bucket: a key can only live in the WAYS slots of its bucket
+WAYS = 8
+# In-process locks (byte range locks do not exclude threads)
+LOCK_STRIPES = 64
+
+DEFAULT_SIZE = 64 * 1024 * 1024
+DEFAULT_SLOT_SIZE = 1024
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+class _SharedFile:
+    """Descriptor and in-process locks of a cache file, shared by all the
+    instances of a process: lockf locks belong to the process, so
+    instances with their own descriptors would not exclude each other (and
+    closing any descriptor of the file releases all of them)."""
+
+    def __init__(self, fd: int, file_id: Tuple[int, int]):
+        self.fd = fd
+        self.file_id = file_id
+        self.users = 0
+        self.locks = []
+        self.reset_locks()
+
+    def reset_locks(self) -> None:
+        """Create new in-process locks"""
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+# Open cache files by (st_dev, st_ino)
+_FILES: Dict[Tuple[int, int], _SharedFile] = {}
+_FILES_LOCK = threading.Lock()
+
+
+def _open_file(filename: str) -> _SharedFile:
+    """Shared file of filename, opened (or created) if needed. Call
+    holding _FILES_LOCK."""
+    try:
+        stat = os.stat(filename)
+        shared = _FILES.get((stat.st_dev, stat.st_ino))
+    except FileNotFoundError:
+        shared = None
+    if shared is None:
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+        stat = os.fstat(fd)
+        shared = _SharedFile(fd, (stat.st_dev, stat.st_ino))
+        _FILES[shared.file_id] = shared
+    shared.users += 1
+    return shared
+
+
+def _close_file(shared: _SharedFile) -> None:
+    """Release a shared file, closed by its last user"""
+    with _FILES_LOCK:
+        shared.users -= 1
+        if shared.users:
+            return
+        if _FILES.get(shared.file_id) is shared:
+            del _FILES[shared.file_id]
+    os.close(shared.fd)
+
+
+def _reset_locks() -> None:
+    # Locks held by other threads at fork time would never be released
+    global _FILES_LOCK  # pylint: disable=global-statement
+    _FILES_LOCK = threading.Lock()
+    for shared in _FILES.values():
+        shared.reset_locks()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks)
+
+
+def default_directory() -> str:
+    """/dev/shm (memory backed) if available, else the temp directory"""
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+class SharedMemoryCache(MetricsMixin, Cache):
+    """Cache shared by the processes of a host.
+
+    Entries live in a memory mapped file (in /dev/shm by default) laid out
+    as a fixed-slot hash table: each key hashes to a bucket of WAYS slots of
+    slot_size bytes. Entries (key, encoded value and header) larger than a
+    slot are not stored. When a bucket is full, the entry closest to
+    expiration is replaced (entries without expiration last).
+
+    Buckets are locked with byte range locks (fcntl.lockf) between
+    processes and striped locks between threads, so workers of any process
+    model (fork, spawn, unrelated processes) share entries safely. Requires
+    a POSIX system. Atomic operations (add, incr, cas) hold the bucket lock
+    while reading and writing. Instances of a process on the same file
+    share its descriptor and thread locks (byte range locks belong to the
+    process), so they exclude each other too.
+
+    Counters (expirations, evictions) count the events of this process."""
+
+    def __init__(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.filename: str = None
+        self.slot_size = 0
+        self.slot_count = 0
+        self.buckets = 0
+        self.codec = Codec()
+        self.expirations = 0
+        self.evictions = 0
+        self._file: _SharedFile = None
+        self._map: mmap.mmap = None
+
+    def reset_locks(self) -> None:
+        """Create new in-process locks (of every instance on the file)"""
+        if self._file is not None:
+            self._file.reset_locks()
+
+    def open(self, filename: str, size: int = DEFAULT_SIZE,
+             slot_size: int = DEFAULT_SLOT_SIZE) -> None:
+        """Open (or create with size bytes) the cache file. An existing
+        cache keeps its own size and slot_size."""
+        if fcntl is None:  # pragma: no cover
+            raise ValueError('Shared memory cache requires a POSIX system')
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError(f'Invalid slot_size {slot_size}')
+        # Threads of this process are excluded by _FILES_LOCK
+        with _FILES_LOCK:
+            shared = _open_file(filename)
+            fd = shared.fd
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+                try:
+                    if os.fstat(fd).st_size == 0:
+                        self._create(fd, size, slot_size)
+                    magic, slot_size_, slot_count = FILE_HEADER.unpack(
+                        os.pread(fd, FILE_HEADER.size, 0))
+                finally:
+                    fcntl.lockf(fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+                if magic != FILE_MAGIC:
+                    raise ValueError(
+                        f'{filename} is not a shared memory cache')
+                memory = mmap.mmap(fd, HEADER_SIZE + slot_count * slot_size_)
+            except BaseException:
+                shared.users -= 1
+                if not shared.users:
+                    del _FILES[shared.file_id]
+                    os.close(fd)
+                raise
+        if slot_size_ != slot_size:
+            self.log.info('Using existing slot_size %s', slot_size_)
+        self.close()
+        self._map = memory
+        self._file = shared
+        self.filename = filename
+        self.slot_size = slot_size_
+        self.slot_count = slot_count
+        self.buckets = slot_count // WAYS
+
+    @staticmethod
+    def _create(fd: int, size: int, slot_size: int) -> None:
+        slot_count = (size - HEADER_SIZE) // slot_size // WAYS * WAYS
+        if slot_count < WAYS:
+            raise ValueError(f'Shared memory cache size {size} is too small')
+        os.ftruncate(fd, HEADER_SIZE + slot_count * slot_size)
+        os.pwrite(fd, FILE_HEADER.pack(FILE_MAGIC, slot_size, slot_count), 0)
+
+    def close(self) -> None:
+        """Unmap the cache (entries stay available to other processes).
+        The file is closed with its last instance in this process."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            _close_file(self._file)
+            self._file = None
+
+    def unlink(self) -> None:
+        """Close and remove the cache file"""
+        self.close()
+        if self.filename:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.filename)
+
+    @staticmethod
+    def _hash(key: bytes) -> int:
+        # Stable between processes, unlike hash()
+        return int.from_bytes(
+            hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+    @contextlib.contextmanager
+    def _locked(self, bucket: int) -> Iterator[int]:
+        """Lock bucket, yields the offset of its first slot"""
+        length = WAYS * self.slot_size
+        start = HEADER_SIZE + bucket * length
+        shared = self._file
+        with shared.locks[bucket % LOCK_STRIPES]:
+            fcntl.lockf(shared.fd, fcntl.LOCK_EX, length, start)
+            try:
+                yield start
+            finally:
+                fcntl.lockf(shared.fd, fcntl.LOCK_UN, length, start)
+
+    def _find(self, start: int, key_hash: int, key: bytes
+              ) -> Optional[Tuple[int, float, int]]:
+        """(offset, valid_until, value length) of key in the bucket"""
+        memory = self._map
+        for offset in range(start, start + WAYS * self.slot_size,
+                            self.slot_size):
+            used, slot_hash, valid_until, key_length, value_length = \
+                SLOT_HEADER.unpack_from(memory, offset)
+            if used and slot_hash == key_hash:
+                key_start = offset + SLOT_HEADER.size
+                if memory[key_start:key_start + key_length] == key:
+                    return offset, valid_until, value_length
+        return None
+
+    @contextlib.contextmanager
+    def _locked_key(self, key: str) -> Iterator[Tuple[int, int, bytes]]:
+        """Lock the bucket of key, yields (bucket offset, key hash,
+        encoded key)"""
+        key_bytes = key.encode('utf-8')
+        key_hash = self._hash(key_bytes)
+        with self._locked(key_hash % self.buckets) as start:
+            yield start, key_hash, key_bytes
+
+    def _live(self, start: int, key_hash: int, key_bytes: bytes
+              ) -> Optional[Tuple[bytes, float]]:
+        """(encoded value, valid_until) of a live entry (bucket locked)"""
+        found = self._find(start, key_hash, key_bytes)
+        if found is None:
+            return None
+        offset, valid_until, value_length = found
+        if valid_until <= time.time():
+            self._map[offset] = 0
+            self.expirations += 1
+            return None
+        value_start = offset + SLOT_HEADER.size + len(key_bytes)
+        return (self._map[value_start:value_start + value_length],
+                valid_until)
+
+    def _read(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._locked_key(key) as slot:
+            return self._live(*slot)
+
+    def get(self, key: str) -> Union[str, None]:
+        entry = self._read(key)
+        return None if entry is None else self.codec.decode(entry[0])
+
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        entry = self._read(key)
+        if entry is None:
+            return None, None
+        data, valid_until = entry
+        if valid_until == NO_EXPIRATION:
+            return self.codec.decode(data), datetime.timedelta(0)
+        return self.codec.decode(data), datetime.timedelta(
+            seconds=valid_until - time.time())
+
+    def set(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
+        self._write(key, self.codec.encode(value), self._valid_until(ttl))
+
+    @staticmethod
+    def _valid_until(ttl: datetime.timedelta) -> float:
+        seconds = ttl.total_seconds()
+        return NO_EXPIRATION if seconds == 0 else time.time() + seconds
+
+    def _write(self, key: str, data: bytes, valid_until: float) -> None:
+        with self._locked_key(key) as slot:
+            self._store(*slot, data, valid_until)
+
+    def _store(self, start: int, key_hash: int, key_bytes: bytes,
+               data: bytes, valid_until: float) -> bool:
+        """Write the entry in its bucket (locked). False if too large."""
+        found = self._find(start, key_hash, key_bytes)
+        if len(key_bytes) > 0xFFFF or \
+                SLOT_HEADER.size + len(key_bytes) + len(data) > self.slot_size:
+            # Do not keep serving the previous value
+            if found is not None:
+                self._map[found[0]] = 0
+            return False
+        offset = found[0] if found is not None else self._free_slot(start)
+        memory = self._map
+        key_start = offset + SLOT_HEADER.size
+        memory[key_start:key_start + len(key_bytes)] = key_bytes
+        value_start = key_start + len(key_bytes)
+        memory[value_start:value_start + len(data)] = data
+        SLOT_HEADER.pack_into(memory, offset, 1, key_hash, valid_until,
+                              len(key_bytes), len(data))
+        return True
+
+    def _free_slot(self, start: int) -> int:
+        """Empty or expired slot of the bucket, else the slot closest to
+        expiration (evicted)"""
+        now = time.time()
+        victim, victim_until = start, math.inf
+        for offset in range(start, start + WAYS * self.slot_size,
+                            self.slot_size):
+            used, _, valid_until, _, _ = SLOT_HEADER.unpack_from(
+                self._map, offset)
+            if not used:
+                return offset
+            if valid_until <= now:
+                self.expirations += 1
+                return offset
+            if valid_until < victim_until:
+                victim, victim_until = offset, valid_until
+        self.evictions += 1
+        return victim
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        return {key: self.get(key) for key in keys}
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        valid_until = self._valid_until(ttl)
+        for key, value in items.items():
+            self._write(key, self.codec.encode(value), valid_until)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        deleted = 0
+        for key in dict.fromkeys(keys):
+            with self._locked_key(key) as (start, key_hash, key_bytes):
+                found = self._find(start, key_hash, key_bytes)
+                if found is not None:
+                    self._map[found[0]] = 0
+                    deleted += found[1] > time.time()
+        return deleted
+
+    def delete(self, key: str) -> bool:
+        return self.delete_many([key]) > 0
+
+    def add(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        with self._locked_key(key) as slot:
+            if self._live(*slot) is not None:
+                return False
+            return self._store(*slot, self.codec.encode(value),
+                               self._valid_until(ttl))
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        with self._locked_key(key) as slot:
+            entry = self._live(*slot)
+            if entry is None:
+                value, valid_until = delta, self._valid_until(ttl)
+            else:
+                value = parse_counter(self.codec.decode(entry[0])) + delta
+                valid_until = entry[1]
+            self._store(*slot, self.codec.encode(str(value)), valid_until)
+            return value
+
+    def cas(self, key: str, expected: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        with self._locked_key(key) as slot:
+            entry = self._live(*slot)
+            if entry is None or self.codec.decode(entry[0]) != expected:
+                return False
+            return self._store(*slot, self.codec.encode(value),
+                               self._valid_until(ttl))
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        for bucket in range(self.buckets):
+            with self._locked(bucket) as start:
+                for offset in range(start, start + WAYS * self.slot_size,
+                                    self.slot_size):
+                    self._map[offset] = 0
+
+    def parse(self, connection_string: str) -> 'Cache':
+        """shm:name[?size=size&slot_size=size&dir=path&serializer=name
+        &compression=name&compress_min=size&compress_level=int&metrics=1]
+
+        size (default 64MB) and slot_size (default 1KB) apply when the
+        cache is created by the first process."""
+        words = connection_string.split(':', maxsplit=1)
+        if len(words) != 2 or words[0] != 'shm':
+            return None
+        name, options = split_options(words[1])
+        if not NAME_PATTERN.match(name):
+            raise ValueError(f'Invalid shared memory cache name {name!r}')
+        self.configure_metrics(options)
+        self.codec = codec_from_options(options)
+        directory = options.get('dir') or default_directory()
+        self.open(os.path.join(directory, f'gs-cache-{name}'),
+                  size=parse_size(options.get('size', DEFAULT_SIZE)),
+                  slot_size=parse_size(options.get('slot_size',
+                                                   DEFAULT_SLOT_SIZE)))
+        self.log.info('Initialized')
+        return self
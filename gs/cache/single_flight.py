@@ -0,0 +1,89 @@
+"""Single flight: merge concurrent calls for the same key"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """In-flight call"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time.
+
+    Callers that arrive while a call for the same key is running wait for it
+    and get its result (or exception) instead of running func again."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def do(self, key: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs), unless there is a call for key running
+        already, in this case wait for its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """Runs at most one coroutine per key at a time, in the event loop."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, func: Callable[..., Awaitable[Any]],
+                 *args, **kwargs) -> Any:
+        """Await func(*args, **kwargs), unless there is a call for key
+        running already, in this case wait for its result."""
+        future = self._calls.get(key)
+        if future is not None:
+            # shield: a cancelled follower must not cancel the leader
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Avoid "exception was never retrieved" when nobody waits
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
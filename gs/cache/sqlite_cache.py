@@ -0,0 +1,298 @@
+"""SQLite Cache"""
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .cache_protocol import Cache
+from .file_cache import NO_EXPIRATION
+from .options import split_options
+from .serializers import Codec, codec_from_options, parse_counter
+from .stats import MetricsMixin
+
+# Keep IN (...) lists under SQLITE_MAX_VARIABLE_NUMBER of old sqlite builds
+MAX_VARIABLES = 500
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value,
+    valid_until REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_valid_until ON cache (valid_until);
+'''
+
+
+class SQLiteCache(MetricsMixin, Cache):
+    """SQLite Cache
+
+    All entries live in a single database file, indexed by key and by
+    expiration. The database uses WAL journaling, so many processes can
+    read while one writes. Each thread has its own connection; close()
+    closes the connections of all threads (connections of finished threads
+    are closed when the next one is opened).
+
+    Expired entries are never returned; they are deleted (using the
+    expiration index) at most every purge_interval seconds, during writes,
+    or by purge().
+
+    Values are encoded by codec (see serializers.Codec).
+
+    Atomic operations (add, incr, cas) read and write in one BEGIN
+    IMMEDIATE transaction, so they are atomic between processes.
+
+    Counters: expirations (purged entries, see also stats())."""
+
+    def __init__(self, purge_interval: float = 60.0,
+                 busy_timeout: float = 5.0):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.filename = None
+        self.purge_interval = purge_interval
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._connections_lock = threading.Lock()
+        self._next_purge = 0.0
+        self.codec = Codec()
+        self.expirations = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the current thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Used by one thread, but closed by close() in any thread
+            connection = sqlite3.connect(
+                self.filename, timeout=self.busy_timeout,
+                isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._register(connection)
+            self._local.connection = connection
+        return connection
+
+    def _register(self, connection: sqlite3.Connection) -> None:
+        with self._connections_lock:
+            for thread in [thread for thread in self._connections
+                           if not thread.is_alive()]:
+                self._connections.pop(thread).close()
+            self._connections[threading.current_thread()] = connection
+
+    def close(self) -> None:
+        """Close the connections of all threads. Call it when no other
+        thread is using the cache: threads reconnect on their next call."""
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+            self._local = threading.local()
+        for connection in connections:
+            connection.close()
+
+    def close_thread(self) -> None:
+        """Close the connection of the current thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            return
+        with self._connections_lock:
+            self._connections.pop(threading.current_thread(), None)
+        connection.close()
+        self._local.connection = None
+
+    @staticmethod
+    def _valid_until(ttl: datetime.timedelta) -> float:
+        if ttl.total_seconds() == 0:
+            return NO_EXPIRATION
+        return time.time() + ttl.total_seconds()
+
+    def get(self, key: str) -> Union[str, None]:
+        row = self.connection.execute(
+            'SELECT value FROM cache WHERE key = ? AND valid_until > ?',
+            (key, time.time())).fetchone()
+        return None if row is None else self.codec.decode(row[0])
+
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        now = time.time()
+        row = self.connection.execute(
+            'SELECT value, valid_until FROM cache '
+            'WHERE key = ? AND valid_until > ?', (key, now)).fetchone()
+        if row is None:
+            return None, None
+        value, valid_until = self.codec.decode(row[0]), row[1]
+        if valid_until >= NO_EXPIRATION:
+            return value, datetime.timedelta(0)
+        return value, datetime.timedelta(seconds=valid_until - now)
+
+    def set(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
+        self._write({key: value}, ttl)
+
+    @staticmethod
+    def _chunks(keys: List[str]) -> Iterable[List[str]]:
+        for start in range(0, len(keys), MAX_VARIABLES):
+            yield keys[start:start + MAX_VARIABLES]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        keys = list(dict.fromkeys(keys))
+        values = dict.fromkeys(keys)
+        now = time.time()
+        for chunk in self._chunks(keys):
+            marks = ','.join('?' * len(chunk))
+            values.update(
+                (key, self.codec.decode(value))
+                for key, value in self.connection.execute(
+                    f'SELECT key, value FROM cache WHERE key IN ({marks}) '
+                    'AND valid_until > ?', (*chunk, now)))
+        return values
+
+    def get_many_with_ttl(self, keys: Iterable[str]
+                          ) -> Dict[str, Tuple[Union[str, None],
+                                               Union[datetime.timedelta,
+                                                     None]]]:
+        keys = list(dict.fromkeys(keys))
+        values = dict.fromkeys(keys, (None, None))
+        now = time.time()
+        for chunk in self._chunks(keys):
+            marks = ','.join('?' * len(chunk))
+            for key, value, valid_until in self.connection.execute(
+                    f'SELECT key, value, valid_until FROM cache '
+                    f'WHERE key IN ({marks}) AND valid_until > ?',
+                    (*chunk, now)):
+                values[key] = (self.codec.decode(value),
+                               datetime.timedelta(0)
+                               if valid_until >= NO_EXPIRATION else
+                               datetime.timedelta(seconds=valid_until - now))
+        return values
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        """Write all items in a single transaction"""
+        self._write(items, ttl)
+
+    def _write(self, items: Dict[str, str], ttl: datetime.timedelta) -> None:
+        valid_until = self._valid_until(ttl)
+        connection = self.connection
+        with _Transaction(connection):
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, valid_until) '
+                'VALUES (?, ?, ?)',
+                ((key, self.codec.encode(value), valid_until)
+                 for key, value in items.items()))
+            if time.monotonic() >= self._next_purge:
+                self._purge(connection)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        keys = list(dict.fromkeys(keys))
+        deleted = 0
+        connection = self.connection
+        with _Transaction(connection):
+            for chunk in self._chunks(keys):
+                marks = ','.join('?' * len(chunk))
+                deleted += connection.execute(
+                    f'DELETE FROM cache WHERE key IN ({marks}) '
+                    'AND valid_until > ?', (*chunk, time.time())).rowcount
+        return deleted
+
+    def delete(self, key: str) -> bool:
+        return self.delete_many([key]) > 0
+
+    @staticmethod
+    def _live_row(connection: sqlite3.Connection, key: str
+                  ) -> Optional[Tuple[bytes, float]]:
+        return connection.execute(
+            'SELECT value, valid_until FROM cache '
+            'WHERE key = ? AND valid_until > ?',
+            (key, time.time())).fetchone()
+
+    def _replace(self, connection: sqlite3.Connection, key: str,
+                 value: str, valid_until: float) -> None:
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, valid_until) '
+            'VALUES (?, ?, ?)', (key, self.codec.encode(value), valid_until))
+
+    def add(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        connection = self.connection
+        with _Transaction(connection):
+            if self._live_row(connection, key) is not None:
+                return False
+            self._replace(connection, key, value, self._valid_until(ttl))
+            return True
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        connection = self.connection
+        with _Transaction(connection):
+            row = self._live_row(connection, key)
+            if row is None:
+                value, valid_until = delta, self._valid_until(ttl)
+            else:
+                value = parse_counter(self.codec.decode(row[0])) + delta
+                valid_until = row[1]
+            self._replace(connection, key, str(value), valid_until)
+            return value
+
+    def cas(self, key: str, expected: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        connection = self.connection
+        with _Transaction(connection):
+            row = self._live_row(connection, key)
+            if row is None or self.codec.decode(row[0]) != expected:
+                return False
+            self._replace(connection, key, value, self._valid_until(ttl))
+            return True
+
+    def purge(self) -> int:
+        """Delete expired entries, returns the number of deleted entries"""
+        connection = self.connection
+        with _Transaction(connection):
+            return self._purge(connection)
+
+    def _purge(self, connection: sqlite3.Connection) -> int:
+        self._next_purge = time.monotonic() + self.purge_interval
+        purged = connection.execute(
+            'DELETE FROM cache WHERE valid_until <= ?',
+            (time.time(),)).rowcount
+        self.expirations += purged
+        return purged
+
+    def parse(self, connection_string: str) -> 'Cache':
+        """sqlite:/path/to/cache.db[?purge_interval=seconds
+        &busy_timeout=seconds&serializer=name&compression=name
+        &compress_min=size&compress_level=int&metrics=1]"""
+        words = connection_string.split(':', maxsplit=1)
+        if len(words) != 2 or words[0] != 'sqlite':
+            return None
+        filename, options = split_options(words[1])
+        self.configure_metrics(options)
+        self.purge_interval = float(options.get('purge_interval',
+                                                self.purge_interval))
+        self.busy_timeout = float(options.get('busy_timeout',
+                                              self.busy_timeout))
+        self.codec = codec_from_options(options)
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.filename = filename
+        self.connection.executescript(_SCHEMA)
+        self.log.info('Initialized')
+        return self
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK (connections use autocommit)"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
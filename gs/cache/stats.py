@@ -0,0 +1,238 @@
+"""Cache metrics"""
+import functools
+import math
+import socket
+import time
+from typing import Callable, Dict, Protocol
+
+from .options import parse_bool
+
+# Latency buckets: bucket i counts operations that took less than
+# 2 ** i microseconds (the last bucket is unbounded)
+LATENCY_BUCKETS = 25
+
+COUNTERS = ('hits', 'misses', 'expirations', 'evictions', 'errors',
+            'bytes_read', 'bytes_written')
+
+
+class MetricsSink(Protocol):
+    """Receives metrics as they happen (StatsD/Prometheus style)"""
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Increment counter name"""
+
+    def timing(self, name: str, seconds: float) -> None:
+        """Record a latency of operation name"""
+
+
+class StatsDSink(MetricsSink):
+    """Sends metrics to a StatsD server over UDP"""
+
+    def __init__(self, host: str = 'localhost', port: int = 8125,
+                 prefix: str = 'gs.cache'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, data: str) -> None:
+        try:
+            self.socket.sendto(data.encode('ascii'), self.address)
+        except OSError:
+            # Metrics must never break the cache
+            ...
+
+    def increment(self, name: str, value: int = 1) -> None:
+        self._send(f'{self.prefix}.{name}:{value}|c')
+
+    def timing(self, name: str, seconds: float) -> None:
+        self._send(f'{self.prefix}.{name}:{seconds * 1000:.3f}|ms')
+
+
+class LatencyHistogram:
+    """Log2 latency histogram, in microseconds"""
+
+    def __init__(self):
+        self.buckets = [0] * LATENCY_BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Record an operation latency"""
+        microseconds = seconds * 1_000_000
+        index = 0 if microseconds < 1 else \
+            min(int(math.log2(microseconds)) + 1, LATENCY_BUCKETS - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound (seconds) of the bucket holding the percentile"""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return (2 ** index) / 1_000_000
+        return (2 ** (LATENCY_BUCKETS - 1)) / 1_000_000
+
+    def snapshot(self) -> dict:
+        """Histogram summary: count, mean, p50, p90, p99 (seconds) and
+        buckets ({upper bound in microseconds: count})"""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': {2 ** index: count
+                        for index, count in enumerate(self.buckets)
+                        if count},
+        }
+
+
+class CacheMetrics:
+    """Counters and latency histograms of a cache"""
+
+    def __init__(self, sink: MetricsSink = None):
+        self.sink = sink
+        self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.latency: Dict[str, LatencyHistogram] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Increment counter"""
+        if value:
+            self.counters[name] += value
+            if self.sink is not None:
+                self.sink.increment(name, value)
+
+    def observe(self, operation: str, seconds: float) -> None:
+        """Record operation latency"""
+        histogram = self.latency.get(operation)
+        if histogram is None:
+            histogram = self.latency[operation] = LatencyHistogram()
+        histogram.record(seconds)
+        if self.sink is not None:
+            self.sink.timing(operation, seconds)
+
+
+def _size(value) -> int:
+    return len(value) if isinstance(value, (str, bytes)) else 0
+
+
+def _on_get(metrics: CacheMetrics, _, value) -> None:
+    if value is None:
+        metrics.increment('misses')
+    else:
+        metrics.increment('hits')
+        metrics.increment('bytes_read', _size(value))
+
+
+def _on_get_with_ttl(metrics: CacheMetrics, _, result) -> None:
+    _on_get(metrics, None, result[0])
+
+
+def _on_get_many(metrics: CacheMetrics, _, values: dict) -> None:
+    hits = [value for value in values.values() if value is not None]
+    metrics.increment('hits', len(hits))
+    metrics.increment('misses', len(values) - len(hits))
+    metrics.increment('bytes_read', sum(_size(value) for value in hits))
+
+
+def _on_set(metrics: CacheMetrics, args: tuple, _) -> None:
+    metrics.increment('bytes_written', _size(args[1]))
+
+
+def _on_set_many(metrics: CacheMetrics, args: tuple, _) -> None:
+    metrics.increment('bytes_written',
+                      sum(_size(value) for value in args[0].values()))
+
+
+INSTRUMENTED_METHODS: Dict[str, Callable] = {
+    'get': _on_get,
+    'get_with_ttl': _on_get_with_ttl,
+    'get_many': _on_get_many,
+    'set': _on_set,
+    'set_many': _on_set_many,
+    'delete_many': None,
+    'delete': None,
+    'add': None,
+    'incr': None,
+    'cas': None,
+}
+
+
+class MetricsMixin:
+    """stats() and opt-in instrumentation for cache backends.
+
+    Backends count expirations, evictions and errors in attributes of the
+    same name. Hits, misses, bytes and latency histograms are collected
+    while metrics are enabled (enable_metrics or the metrics=1 option):
+    enabling wraps the public methods of the instance, so disabled metrics
+    cost nothing on the hot paths."""
+
+    metrics: CacheMetrics = None
+    expirations = 0
+    evictions = 0
+    errors = 0
+
+    def enable_metrics(self, sink: MetricsSink = None) -> CacheMetrics:
+        """Start collecting metrics, optionally sent to sink"""
+        if self.metrics is None:
+            self.metrics = CacheMetrics(sink)
+            for name, on_result in INSTRUMENTED_METHODS.items():
+                method = getattr(self, name, None)
+                if method is not None:
+                    setattr(self, name,
+                            _instrument(self.metrics, name, method,
+                                        on_result))
+        elif sink is not None:
+            self.metrics.sink = sink
+        return self.metrics
+
+    def disable_metrics(self) -> None:
+        """Stop collecting metrics (collected values are discarded)"""
+        if self.metrics is None:
+            return
+        for name in INSTRUMENTED_METHODS:
+            self.__dict__.pop(name, None)
+        self.metrics = None
+
+    def configure_metrics(self, options: Dict[str, str]) -> None:
+        """Enable metrics if options has metrics=1 (removes the option)"""
+        if parse_bool(options.pop('metrics', '0')):
+            self.enable_metrics()
+
+    def stats(self) -> dict:
+        """Counters (hits, misses, expirations, evictions, errors,
+        bytes_read, bytes_written) and latency histograms per operation"""
+        stats = dict.fromkeys(COUNTERS, 0)
+        if self.metrics is not None:
+            stats.update(self.metrics.counters)
+        stats['expirations'] += self.expirations
+        stats['evictions'] += self.evictions
+        stats['errors'] += self.errors
+        stats['metrics_enabled'] = self.metrics is not None
+        stats['latency'] = {} if self.metrics is None else {
+            operation: histogram.snapshot()
+            for operation, histogram in self.metrics.latency.items()}
+        return stats
+
+
+def _instrument(metrics: CacheMetrics, name: str, method: Callable,
+                on_result: Callable) -> Callable:
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            metrics.increment('errors')
+            raise
+        finally:
+            metrics.observe(name, time.perf_counter() - start)
+        if on_result is not None:
+            on_result(metrics, args, result)
+        return result
+    return wrapper
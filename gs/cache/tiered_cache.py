@@ -0,0 +1,167 @@
+"""Tiered Cache"""
+import datetime
+import logging
+from typing import Dict, Iterable, Tuple, Union
+
+from .cache_protocol import Cache
+from .options import split_options
+
+DEFAULT_L1_TTL = datetime.timedelta(seconds=60)
+
+
+class TieredCache(Cache):
+    """Two-tier cache: a fast local L1 (usually memory) in front of a shared
+    L2 (redis or files).
+
+    - get, get_many: L1 first; on L2 hits, L1 is filled with the remaining
+      L2 TTL (get_many_with_ttl reads them in batch)
+    - set: writes L2, then L1
+    - L1 entries never live longer than l1_ttl, which bounds staleness when
+      other processes update L2 (timedelta(0) = no cap)
+    - delete, add, incr and cas run on L2 (atomic there) and remove the key
+      from L1
+
+    stats() reports hits per tier and hit ratios."""
+
+    def __init__(self, l1: Cache = None, l2: Cache = None,
+                 l1_ttl: datetime.timedelta = DEFAULT_L1_TTL):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.l1 = l1
+        self.l2 = l2
+        self.l1_ttl = l1_ttl
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+
+    def _l1_ttl(self, ttl: datetime.timedelta) -> datetime.timedelta:
+        if not self.l1_ttl or ttl < datetime.timedelta(0):
+            return ttl
+        if not ttl:
+            return self.l1_ttl
+        return min(ttl, self.l1_ttl)
+
+    def get(self, key: str) -> Union[str, None]:
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key: str
+                     ) -> Tuple[Union[str, None],
+                                Union[datetime.timedelta, None]]:
+        value, ttl = self.l1.get_with_ttl(key)
+        if value is not None:
+            self.l1_hits += 1
+            return value, ttl
+        value, ttl = self.l2.get_with_ttl(key)
+        if value is None:
+            self.misses += 1
+            return None, None
+        self.l2_hits += 1
+        self.l1.set(key, value, self._l1_ttl(ttl))
+        return value, ttl
+
+    def set(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> None:
+        self.l2.set(key, value, ttl)
+        self.l1.set(key, value, self._l1_ttl(ttl))
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Union[str, None]]:
+        return {key: value for key, (value, _)
+                in self.get_many_with_ttl(keys).items()}
+
+    def get_many_with_ttl(self, keys: Iterable[str]
+                          ) -> Dict[str, Tuple[Union[str, None],
+                                               Union[datetime.timedelta,
+                                                     None]]]:
+        """L1 first, then one L2 batch read for the missing keys. L1 is
+        filled with the remaining L2 TTL of each key."""
+        values = self.l1.get_many_with_ttl(keys)
+        missing = [key for key, (value, _) in values.items() if value is None]
+        self.l1_hits += len(values) - len(missing)
+        if not missing:
+            return values
+        found = {key: entry
+                 for key, entry in self.l2.get_many_with_ttl(missing).items()
+                 if entry[0] is not None}
+        self.l2_hits += len(found)
+        self.misses += len(missing) - len(found)
+        # One L1 batch write per TTL
+        batches: Dict[datetime.timedelta, Dict[str, str]] = {}
+        for key, (value, ttl) in found.items():
+            batches.setdefault(self._l1_ttl(ttl), {})[key] = value
+        for ttl, items in batches.items():
+            self.l1.set_many(items, ttl)
+        values.update(found)
+        return values
+
+    def set_many(self, items: Dict[str, str],
+                 ttl: datetime.timedelta = datetime.timedelta(seconds=0)
+                 ) -> None:
+        self.l2.set_many(items, ttl)
+        self.l1.set_many(items, self._l1_ttl(ttl))
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        self.l1.delete_many(keys)
+        return self.l2.delete_many(keys)
+
+    def delete(self, key: str) -> bool:
+        self.l1.delete(key)
+        return self.l2.delete(key)
+
+    def add(self, key: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        added = self.l2.add(key, value, ttl)
+        self.l1.delete(key)
+        return added
+
+    def incr(self, key: str, delta: int = 1,
+             ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> int:
+        value = self.l2.incr(key, delta, ttl)
+        self.l1.delete(key)
+        return value
+
+    def cas(self, key: str, expected: str, value: str,
+            ttl: datetime.timedelta = datetime.timedelta(seconds=0)) -> bool:
+        swapped = self.l2.cas(key, expected, value, ttl)
+        self.l1.delete(key)
+        return swapped
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Hits per tier and hit ratios.
+
+        l1_hit_ratio: L1 hits / lookups
+        l2_hit_ratio: L2 hits / lookups that reached L2
+        hit_ratio: (L1 + L2 hits) / lookups"""
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        l2_lookups = self.l2_hits + self.misses
+        return {
+            'l1_hits': self.l1_hits,
+            'l2_hits': self.l2_hits,
+            'misses': self.misses,
+            'l1_hit_ratio': self.l1_hits / lookups if lookups else 0.0,
+            'l2_hit_ratio': self.l2_hits / l2_lookups if l2_lookups else 0.0,
+            'hit_ratio': (self.l1_hits + self.l2_hits) / lookups
+            if lookups else 0.0,
+        }
+
+    def parse(self, connection_string: str) -> 'Cache':
+        """tiered:<L1 connection string>|<L2 connection string>[|l1_ttl=60]
+
+        l1_ttl: maximum L1 time to live in seconds (0 = no cap)"""
+        words = connection_string.split(':', maxsplit=1)
+        if len(words) != 2 or words[0] != 'tiered':
+            return None
+        tiers = words[1].split('|')
+        if len(tiers) not in (2, 3):
+            raise ValueError(
+                f'Invalid tiered connection string {connection_string!r}')
+        if len(tiers) == 3:
+            _, options = split_options('?' + tiers[2])
+            self.l1_ttl = datetime.timedelta(
+                seconds=float(options.get('l1_ttl', 0)))
+
+        # get_cache imports this module
+        from . import get_cache  # pylint: disable=import-outside-toplevel
+        self.l1 = get_cache(tiers[0], reuse=False)
+        self.l2 = get_cache(tiers[1], reuse=False)
+        self.log.info('Initialized')
+        return self
@@ -1,3 +1,4 @@
-__all__ = ['BaseConfig']
+__all__ = ['BaseConfig', 'Env', 'config_lazy', 'config_slots']
 
-from .base_config import BaseConfig
+from .base_config import BaseConfig, config_lazy, config_slots
+from .class_properties import Env
@@ -1,61 +1,186 @@
 """Base Configuration module"""
 
-import json
+import inspect
 import os
 from datetime import date, datetime, timedelta
-
-import yaml
+from typing import Any, Callable, Dict
 
 from .class_properties import get_envs, get_fields_default_values, get_types
+from .parsers import parse_content, parse_file
 
 
-def _create_config_field(internal_name: str, field_type: type,
-                         is_list: bool, default_value: any, field_name: str):
-    if not field_type:
-        if default_value is None:
-            raise ValueError(f'No type specified for {internal_name}')
-        field_type = type(default_value)
-    if default_value is None:
-        default_value = field_type()
-    if not field_name:
-        field_name = internal_name
-
-    def __parse_value_type(value, value_type):
-        if value_type in (int, float, bool, str):
-            return value_type(value)
-
-        if value_type == datetime:
-            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
-        if value_type == date:
-            return date.strptime(value, '%Y-%m-%d')
-        if value_type == timedelta:
-            return timedelta(**value)
-        if issubclass(value_type, BaseConfig):
-            return value_type(value)
-        if isinstance(value_type, list):
-            return [__parse_value_type(v, value_type[0]) for v in value]
-
+def _unknown_type(value_type) -> Callable[[Any], Any]:
+    def convert(value):
         raise TypeError(f'Unknown type {value_type}')
-
-    def load(source: dict, returns_field_name: bool = False) -> any:
-        if returns_field_name:
-            return field_name
-        if field_name in source:
-            source_value = source[field_name]
-            if not is_list:
-                source_value = __parse_value_type(source_value, field_type)
-            else:
-                source_value = [__parse_value_type(v, field_type)
-                                for v in source_value]
+    return convert
+
+
+def _config_converter(config_class: type) -> Callable[[Any], Any]:
+    if config_class.__init__ is not BaseConfig.__init__:
+        return config_class
+
+    def convert(value):
+        # dicts skip the file/content checks of __init__
+        if isinstance(value, dict):
+            return config_class.from_dict(value)
+        return config_class(value)
+    return convert
+
+
+def _converter(value_type) -> Callable[[Any], Any]:
+    """Function converting source values to value_type, resolved once"""
+    if value_type in (int, float, bool, str):
+        return value_type
+    if value_type == datetime:
+        return lambda value: datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    if value_type == date:
+        return lambda value: date.strptime(value, '%Y-%m-%d')
+    if value_type == timedelta:
+        return lambda value: timedelta(**value)
+    if inspect.isclass(value_type) and issubclass(value_type, BaseConfig):
+        return _config_converter(value_type)
+    if isinstance(value_type, list):
+        item_converter = _converter(value_type[0])
+        return lambda value: [item_converter(item) for item in value]
+    return _unknown_type(value_type)
+
+
+class ConfigField:
+    """Field of a configuration class: source key (field name or
+    environment name), type converter and default value"""
+
+    __slots__ = ('name', 'key', 'field_type', 'is_list', 'default',
+                 'converter')
+
+    def __init__(self, name: str, field_type: type, is_list: bool,
+                 default: Any, key: str = None):
+        if not field_type:
+            if default is None:
+                raise ValueError(f'No type specified for {name}')
+            field_type = type(default)
+        self.name = name
+        self.key = key or name
+        self.field_type = field_type
+        self.is_list = is_list
+        self.default = default
+        self.converter = _converter(field_type)
+
+    def default_value(self) -> Any:
+        """Default value (a new instance of the type if there is none)"""
+        value = self.field_type() if self.default is None else self.default
+        if self.is_list and not isinstance(value, list):
+            return [value]
+        return value
+
+    def load(self, source: dict) -> Any:
+        """Value of the field in source, or the default value"""
+        if self.key not in source:
+            return self.default_value()
+        if self.is_list:
+            return [self.converter(item) for item in source[self.key]]
+        return self.converter(source[self.key])
+
+
+def _compile_loader(schema: Dict[str, ConfigField]
+                    ) -> Callable[[Any, dict], None]:
+    """Generate the function setting all fields of an instance from a
+    source dict, with converters and defaults bound ahead of time"""
+    namespace = {}
+    lines = ['def __config_load__(self, source):']
+    for index, field in enumerate(schema.values()):
+        namespace[f'key_{index}'] = field.key
+        namespace[f'convert_{index}'] = field.converter
+        namespace[f'field_{index}'] = field
+        value = f'source[key_{index}]'
+        if field.is_list:
+            value = f'[convert_{index}(item) for item in {value}]'
         else:
-            if not is_list or isinstance(default_value, list):
-                source_value = default_value
-            else:
-                source_value = [default_value]
-
-        return source_value
-
-    return load
+            value = f'convert_{index}({value})'
+        if field.default is None:
+            default = f'field_{index}.default_value()'
+        else:
+            namespace[f'default_{index}'] = field.default
+            default = f'default_{index}'
+            if field.is_list and not isinstance(field.default, list):
+                default = f'[{default}]'
+        lines.extend([
+            f'    if key_{index} in source:',
+            f'        self.{field.name} = {value}',
+            '    else:',
+            f'        self.{field.name} = {default}',
+        ])
+    if len(lines) == 1:
+        lines.append('    pass')
+    exec('\n'.join(lines), namespace)  # pylint: disable=exec-used
+    return namespace['__config_load__']
+
+
+def config_slots(cls: type) -> type:
+    """Class decorator storing the fields of a BaseConfig subclass in
+    __slots__ (no per-instance __dict__ if all bases have __slots__).
+
+    Returns a new class, like dataclass(slots=True). Field defaults move
+    from the class to its schema."""
+    schema = cls.config_schema()
+    inherited = {name for base in cls.__mro__[1:]
+                 for name in base.__dict__.get('__slots__', ())}
+    namespace = {name: value for name, value in cls.__dict__.items()
+                 if name not in schema and
+                 name not in ('__dict__', '__weakref__')}
+    namespace['__slots__'] = tuple(name for name in schema
+                                   if name not in inherited)
+    namespace['__config_slots__'] = True
+    slotted = type(cls)(cls.__name__, cls.__bases__, namespace)
+    slotted.__qualname__ = cls.__qualname__
+    return slotted
+
+
+# Instance attribute with the raw source values of config_lazy classes
+RAW_VALUES = '__config_raw__'
+
+
+class LazyField:
+    """Non-data descriptor converting a field of a config_lazy instance on
+    first access. The value is memoized in the instance __dict__, which
+    takes precedence over the descriptor on the next accesses."""
+
+    __slots__ = ('field',)
+
+    def __init__(self, field: ConfigField):
+        self.field = field
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.field.default
+        value = self.field.load(instance.__dict__.get(RAW_VALUES, {}))
+        instance.__dict__[self.field.name] = value
+        return value
+
+
+def _compile_lazy_loader(schema: Dict[str, ConfigField]
+                         ) -> Callable[[Any, dict], None]:
+    keys = [field.key for field in schema.values()]
+
+    def __config_load__(self, source):
+        # Only the keys of the fields: large sources (os.environ) are
+        # not kept alive
+        self.__dict__[RAW_VALUES] = {key: source[key] for key in keys
+                                     if key in source}
+    return __config_load__
+
+
+def config_lazy(cls: type) -> type:
+    """Class decorator converting the fields of a BaseConfig subclass on
+    first access, instead of on load. Conversion errors are raised on
+    access, or by validate_all()."""
+    if cls.__dict__.get('__config_slots__'):
+        raise TypeError(f'{cls.__name__} fields are in __slots__')
+    schema = cls.config_schema()
+    for name, field in schema.items():
+        setattr(cls, name, LazyField(field))
+    cls.__config_loader__ = _compile_lazy_loader(schema)
+    cls.__config_lazy__ = True
+    return cls
 
 
 class BaseConfig:
@@ -71,13 +196,94 @@ class BaseConfig:
     - datetime.timedelta
     - BaseConfig inherited classes
     - list (of types above)
+
+    Fields (defaults, types and environment names) are read once per class
+    and cached, see config_schema(). Fields may also be assigned in a
+    subclass __init__ before calling super().__init__() (with an optional
+    '# ENV:NAME' comment): the first instance that assigns them adds them
+    to the class schema, with the assigned values as defaults (not
+    supported by config_slots and config_lazy classes, whose schema is
+    fixed). Instances are loaded by a function
+    generated for each class (see from_dict), and can keep their fields in
+    __slots__ (see config_slots) or convert them on access (see
+    config_lazy).
     """
 
+    __slots__ = ()
+
     def __init__(self, source=None, **dict_source):
-        self.__fields = self.__parse_fields()
         self.__load(source or dict_source)
         self.after_load()
 
+    @classmethod
+    def config_schema(cls) -> Dict[str, ConfigField]:
+        """Fields by member name, built on the first call for each class"""
+        # Looked up in the class itself: subclasses have their own schema
+        schema = cls.__dict__.get('__config_schema__')
+        if schema is None:
+            schema = cls.__build_schema(cls)
+        return schema
+
+    @classmethod
+    def __build_schema(cls, source) -> Dict[str, ConfigField]:
+        """Schema of the fields of source (the class, or an instance with
+        fields assigned in __init__)"""
+        schema = cls.__parse_fields(source)
+        cls.__config_loader__ = _compile_loader(schema)
+        cls.__config_schema__ = schema
+        return schema
+
+    def __init_fields(self) -> bool:
+        """True if __init__ assigned fields missing from the class schema
+        """
+        members = getattr(self, '__dict__', None)
+        if not members:
+            return False
+        schema = self.config_schema()
+        return any(name not in schema and not name.startswith('__') and
+                   not callable(value) for name, value in members.items())
+
+    @classmethod
+    def reset_schema(cls) -> None:
+        """Forget the cached schema of this class and its subclasses.
+        Call it after changing class fields at runtime. Classes decorated
+        by config_slots or config_lazy keep their schema."""
+        if '__config_schema__' in cls.__dict__ and \
+                not cls.__dict__.get('__config_slots__') and \
+                not cls.__dict__.get('__config_lazy__'):
+            del cls.__config_schema__
+            del cls.__config_loader__
+        for subclass in cls.__subclasses__():
+            subclass.reset_schema()
+
+    @classmethod
+    def __loader(cls) -> Callable[[Any, dict], None]:
+        loader = cls.__dict__.get('__config_loader__')
+        if loader is None:
+            cls.config_schema()
+            loader = cls.__dict__['__config_loader__']
+        return loader
+
+    def __instance_loader(self) -> Callable[[Any, dict], None]:
+        cls = self.__class__
+        if self.__init_fields():
+            if cls.__dict__.get('__config_slots__') or \
+                    cls.__dict__.get('__config_lazy__'):
+                raise TypeError(f'{cls.__name__} fields assigned in __init__'
+                                ' are not supported by config_slots and '
+                                'config_lazy')
+            cls.__build_schema(self)
+        return cls.__loader()
+
+    @classmethod
+    def from_dict(cls, source: dict) -> 'BaseConfig':
+        """Load configuration from a dict, skipping the file and content
+        checks of the constructor (which is not called)"""
+        config = cls.__new__(cls)
+        cls.__loader()(config, source)
+        config.after_load()
+        return config
+
     @classmethod
     def load_from_env(cls) -> 'BaseConfig':
         """Load configuration from environment variables"""
@@ -85,24 +291,32 @@ class BaseConfig:
 
     @classmethod
     def load_from_file(cls, filename: str) -> 'BaseConfig':
-        """Load configuration from file"""
+        """Load configuration from a json, yaml or toml file (see
+        parsers.parse_file)"""
         return cls(filename)
 
-    def __parse_fields(self):
-
-        default_values = get_fields_default_values(self)
-        types = get_types(self)
-        envs = get_envs(self)
+    @classmethod
+    def __parse_fields(cls, source):
+
+        default_values = get_fields_default_values(source)
+        # Defaults of fields of config_slots classes live in their schema
+        for base in cls.__mro__[1:]:
+            if base.__dict__.get('__config_slots__'):
+                for name, field in base.__config_schema__.items():
+                    if inspect.ismemberdescriptor(default_values.get(name)):
+                        default_values[name] = field.default
+        types = get_types(source)
+        envs = get_envs(source)
 
         all_field_names = set(default_values.keys()) | set(types.keys())
 
         data = {
-            field: _create_config_field(field,
-                                        *types.get(field, (None, False)),
-                                        default_values.get(field, None),
-                                        envs.get(field, field))
+            field: ConfigField(field,
+                               *types.get(field, (None, False)),
+                               default_values.get(field, None),
+                               envs.get(field, field))
 
-            for field in all_field_names
+            for field in sorted(all_field_names)
         }
 
         return data
@@ -113,60 +327,18 @@ class BaseConfig:
 
         if isinstance(source, str):
             if os.path.isfile(source):
-                source = self.__parse_file(source)
+                source = parse_file(source)
             else:
-                source = self.__parse_content(source)
+                source = parse_content(source)
 
         if not isinstance(source, dict):
             return
 
-        for member, field in self.__fields.items():
-            setattr(self, member, field(source))
-
-    def __parse_value_type(self, value_type, value):
-        if value_type in (int, float, str):
-            return value_type(value)
-        if value_type == bool:
-            return value.lower()[0] in ('t', '1', 'y')
-
-        if value_type == datetime:
-            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
-        if value_type == date:
-            return date.strptime(value, '%Y-%m-%d')
-        if value_type == timedelta:
-            return timedelta(**value)
-        if issubclass(value_type, BaseConfig):
-            return value_type(value)
-        if isinstance(value_type, list):
-            return [self.__parse_value_type(value_type[0], v) for v in value]
-
-        raise TypeError(f'Unknown type {value_type}')
-
-    def __parse_file(self, path):
-        try:
-            with open(path, 'r', encoding='utf-8') as file:
-                content = file.read()
-        except Exception as exc:
-            raise ValueError(f'Error reading file {path}: {exc}') from exc
-
-        return self.__parse_content(content)
-
-    def __parse_content(self, content):
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            # Pass to yaml parser
-            ...
-        except Exception as exc:
-            raise ValueError(f'Error parsing content {exc}') from exc
-        try:
-            return yaml.load(content, yaml.SafeLoader)
-        except Exception as exc:
-            raise ValueError(f'Error parsing content {exc}') from exc
+        self.__instance_loader()(self, source)
 
     def __repr__(self) -> str:
         fields = ", ".join(
-            f"{k}={repr(getattr(self,k))}" for k in self.__fields)
+            f"{k}={repr(getattr(self,k))}" for k in self.config_schema())
         return f'{self.__class__.__name__}({fields})'
 
     def sample_dict(self) -> dict:
@@ -179,8 +351,8 @@ class BaseConfig:
             return obj
 
         return {
-            field({}, True): _sample_dict(field({}))
-            for _, field in self.__fields.items()
+            field.key: _sample_dict(field.default_value())
+            for field in self.config_schema().values()
         }
 
     def to_dict(self) -> dict:
@@ -192,10 +364,19 @@ class BaseConfig:
                 return [_to_dict(v) for v in obj]
             return obj
         return {
-            field({}, True): _to_dict(getattr(self, member))
-            for member, field in self.__fields.items()
+            field.key: _to_dict(getattr(self, member))
+            for member, field in self.config_schema().items()
         }
 
+    def validate_all(self) -> None:
+        """Convert all fields now, raising conversion errors of config_lazy
+        fields (nested configs included) at once"""
+        for member in self.config_schema():
+            value = getattr(self, member)
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, BaseConfig):
+                    item.validate_all()
+
     def after_load(self):
         """Called after load
         Override this method to add custom logic or validation after load"""
@@ -1,8 +1,33 @@
 """Class Properties functions"""
 
+import ast
 import inspect
+import io
+import sys
+import tokenize
+from typing import Any, Dict, Tuple
 
-from typing import Dict, Tuple
+
+class Env:
+    """Environment variable name of a config field, declared in its
+    annotation (typing.Annotated, or typing_extensions.Annotated before
+    Python 3.9):
+
+        NAME: Annotated[str, Env('APP_NAME')] = 'default'
+    """
+
+    def __init__(self, name: str):
+        if not name:
+            raise ValueError('Env name must not be empty')
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f'Env({self.name!r})'
+
+
+# Class and __init__ field comments by module, then by class qualified name
+ClassComments = Tuple[Dict[str, str], Dict[str, str]]
+_MODULE_COMMENTS: Dict[str, Dict[str, ClassComments]] = {}
 
 
 def get_fields_default_values(cls) -> Dict[str, any]:
@@ -13,12 +38,32 @@ def get_fields_default_values(cls) -> Dict[str, any]:
     return data
 
 
-def get_types(cls) -> Dict[str, Tuple[type, bool]]:
-    """Returns dict with fields (key) and (type, is_list)"""
+def get_annotations(cls) -> Dict[str, Any]:
+    """Returns dict with fields (key) and annotation, including the fields
+    annotated by parent classes"""
+    if not inspect.isclass(cls):
+        cls = cls.__class__
+    annotations = {}
+    for klass in reversed(cls.__mro__):
+        annotations.update(klass.__dict__.get('__annotations__', {}))
+    return annotations
+
 
-    annotations = getattr(cls, '__annotations__', {})
+def unwrap_annotation(annotation) -> Tuple[Any, tuple]:
+    """(type, metadata) of Annotated[type, *metadata], else (annotation, ())
+    """
+    metadata = getattr(annotation, '__metadata__', None)
+    if metadata is None:
+        return annotation, ()
+    return annotation.__origin__, tuple(metadata)
+
+
+def get_types(cls) -> Dict[str, Tuple[type, bool]]:
+    """Returns dict with fields (key) and (type, is_list), including the
+    fields annotated by parent classes"""
     data = {}
-    for member, member_type in annotations.items():
+    for member, annotation in get_annotations(cls).items():
+        member_type, _ = unwrap_annotation(annotation)
         if member_type is list:
             raise TypeError(f'{cls}.{member} must be declared List[type]')
         if getattr(member_type, '_name', 'NONE') == 'List':
@@ -29,6 +74,70 @@ def get_types(cls) -> Dict[str, Tuple[type, bool]]:
     return data
 
 
+def parse_comments(source: str) -> Dict[str, ClassComments]:
+    """Returns dict with class qualified names (key) and (class field
+    comments, __init__ field comments) found in source, in a single
+    tokenize and AST pass"""
+    readline = io.StringIO(source).readline
+    comments = {token.start[0]: token.string[1:].strip()
+                for token in tokenize.generate_tokens(readline)
+                if token.type == tokenize.COMMENT}
+    data: Dict[str, ClassComments] = {}
+    if comments:
+        _collect_comments(ast.parse(source), '', comments, data)
+    return data
+
+
+def _assigned_names(node: ast.AST):
+    if isinstance(node, ast.Assign):
+        return node.targets
+    if isinstance(node, ast.AnnAssign):
+        return [node.target]
+    return []
+
+
+def _collect_comments(node: ast.AST, prefix: str, comments: Dict[int, str],
+                      data: Dict[str, ClassComments]) -> None:
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, ast.ClassDef):
+            qualname = prefix + child.name
+            class_fields, init_fields = data.setdefault(qualname, ({}, {}))
+            for statement in child.body:
+                comment = comments.get(statement.lineno)
+                for target in _assigned_names(statement):
+                    if comment and isinstance(target, ast.Name):
+                        class_fields[target.id] = comment
+                if isinstance(statement, ast.FunctionDef) and \
+                        statement.name == '__init__':
+                    for inner in ast.walk(statement):
+                        comment = comments.get(getattr(inner, 'lineno', 0))
+                        for target in _assigned_names(inner):
+                            if comment and \
+                                    isinstance(target, ast.Attribute) and \
+                                    isinstance(target.value, ast.Name) and \
+                                    target.value.id == 'self':
+                                init_fields[target.attr] = comment
+            _collect_comments(child, qualname + '.', comments, data)
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            _collect_comments(child, f'{prefix}{child.name}.<locals>.',
+                              comments, data)
+        elif isinstance(child, ast.stmt):
+            _collect_comments(child, prefix, comments, data)
+
+
+def get_module_comments(module_name: str) -> Dict[str, ClassComments]:
+    """parse_comments of a module source, parsed once. Empty when the
+    source is not available (zipapps, frozen or .pyc only deployments)."""
+    data = _MODULE_COMMENTS.get(module_name)
+    if data is None:
+        try:
+            data = parse_comments(inspect.getsource(sys.modules[module_name]))
+        except (KeyError, OSError, TypeError, SyntaxError):
+            data = {}
+        _MODULE_COMMENTS[module_name] = data
+    return data
+
+
 def get_comments(cls) -> Dict[str, str]:
     """Returns dict with fields (key) and comment"""
     ret = {}
@@ -39,49 +148,22 @@ def get_comments(cls) -> Dict[str, str]:
         if parent != object:
             ret.update(get_comments(parent))
 
+    class_fields, init_fields = get_module_comments(cls.__module__).get(
+        cls.__qualname__, ({}, {}))
     # get class field names
     fields = set(member for member, default_value in inspect.getmembers(cls)
-                 if not member.startswith('__') and not callable(default_value)) | \
-        set(member for member, _ in getattr(cls, '__annotations__', {}).items())
-
-    # get all lines
-    lines = [line
-             for line in inspect.getsourcelines(cls)[0]
-             if line.strip() and not '"""' in line and not "'''" in line]
-    first_line = lines[1]
-    indent_root = lines[1][0:len(first_line)-len(first_line.lstrip())]
-
-    # get lines from root indentation with FIELD definition with comments
-    field_lines = [line
-                   for line in lines
-                   if line.startswith(indent_root) and line[len(indent_root)] != ' '
-                   and ('=' in line or ':' in line)
-                   and '#' in line
-                   ]
-    for line in field_lines:
-        sep = ':' if ':' in line else '='
-        field_name = line.split(sep)[0].strip()
-
-        if field_name not in fields:
-            continue
-
-        comment = line.split('#', maxsplit=1)[1].strip()
-        ret[field_name] = comment
-
-    # get lines from __init__ with FIELD definition with comments
-    for line in inspect.getsourcelines(cls.__init__)[0][1:]:
-        line = line.strip()
-        if not (line.startswith('self.') and '=' in line and '#' in line):
-            continue
-        field_name = line[5:].split('=')[0].strip()
-        comment = line.split('#')[1].strip()
-        ret[field_name] = comment
-
+                 if not member.startswith('__') and
+                 not callable(default_value)) | \
+        set(getattr(cls, '__annotations__', {}))
+    ret.update((field, comment) for field, comment in class_fields.items()
+               if field in fields)
+    ret.update(init_fields)
     return ret
 
 
 def get_envs(cls) -> Dict[str, str]:
-    """Get environment variable definitions for fields"""
+    """Get environment variable definitions for fields: Env annotations,
+    or '# ENV:NAME' comments"""
 
     comments = get_comments(cls)
     envs = {}
@@ -90,4 +172,8 @@ def get_envs(cls) -> Dict[str, str]:
             env = comment.split('ENV:')[1].strip()
             if env:
                 envs[field] = env
+    for field, annotation in get_annotations(cls).items():
+        for metadata in unwrap_annotation(annotation)[1]:
+            if isinstance(metadata, Env):
+                envs[field] = metadata.name
     return envs
@@ -0,0 +1,128 @@
+"""Configuration content parsers"""
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+import yaml
+
+try:
+    import tomllib
+except ImportError:  # pragma: no cover
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# libyaml loader, when PyYAML was built with it
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+EXTENSIONS = {
+    '.json': 'json',
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.toml': 'toml',
+}
+
+# First significant line of TOML documents: [table] or key = value
+_TOML_LINE = re.compile(r'^(\[\[?[\w.\-" ]+\]\]?|[\w.\-"]+\s*=)')
+
+# Parsed files by path, with the (mtime_ns, size) they were parsed with
+_FILES: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+_FILES_LOCK = threading.Lock()
+
+
+def _parse_toml(content: str) -> Any:
+    if tomllib is None:
+        raise ValueError('TOML needs Python 3.11 or the tomli package')
+    return tomllib.loads(content)
+
+
+PARSERS: Dict[str, Callable[[str], Any]] = {
+    'json': json.loads,
+    'yaml': lambda content: yaml.load(content, YamlLoader),
+    'toml': _parse_toml,
+}
+
+
+def _is_json(content: str) -> bool:
+    try:
+        json.loads(content)
+        return True
+    except ValueError:
+        return False
+
+
+def sniff_format(content: str) -> str:
+    """Format of content, from its first significant line. A line that is
+    both a TOML table header and a JSON array (["a"]) is json when the
+    whole content parses as json."""
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if _TOML_LINE.match(line):
+            if line[0] == '[' and _is_json(content):
+                return 'json'
+            return 'toml'
+        if line[0] in '{[':
+            return 'json'
+        break
+    return 'yaml'
+
+
+def parse_content(content: str, content_format: str = None) -> Any:
+    """Parse json, yaml or toml content. Without content_format, the format
+    is sniffed; sniffed json or toml content failing to parse is read as
+    yaml, as yaml accepts most json and some key = value documents.
+    Sniffed toml without a toml parser (tomllib or tomli) raises, instead
+    of loading the whole document as a yaml string."""
+    sniffed = content_format is None
+    if sniffed:
+        content_format = sniff_format(content)
+    parser = PARSERS.get(content_format)
+    if parser is None:
+        raise ValueError(f'Unknown format {content_format}')
+    try:
+        return parser(content)
+    except Exception as exc:
+        if not sniffed or content_format == 'yaml' or \
+                (content_format == 'toml' and tomllib is None):
+            raise ValueError(f'Error parsing content {exc}') from exc
+    try:
+        return PARSERS['yaml'](content)
+    except Exception as exc:
+        raise ValueError(f'Error parsing content {exc}') from exc
+
+
+def parse_file(path: str) -> Any:
+    """Parse file, with the format of its extension (sniffed if unknown).
+    Files are parsed again only when their mtime or size change: the
+    returned data is shared and must not be modified."""
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError as exc:
+        raise ValueError(f'Error reading file {path}: {exc}') from exc
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _FILES.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            content = file.read()
+    except Exception as exc:
+        raise ValueError(f'Error reading file {path}: {exc}') from exc
+    data = parse_content(
+        content, EXTENSIONS.get(os.path.splitext(path)[1].lower()))
+    with _FILES_LOCK:
+        _FILES[path] = (stamp, data)
+    return data
+
+
+def clear_file_cache() -> None:
+    """Forget the parsed files"""
+    with _FILES_LOCK:
+        _FILES.clear()
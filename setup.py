@@ -81,6 +81,11 @@ setup(
         'redis>=4.3.3',
         'PyYAML==6.0'
     ],
+    extras_require={
+        'msgpack': ['msgpack'],
+        'lz4': ['lz4'],
+        'toml': ['tomli; python_version < "3.11"'],
+    },
     zip_safe=True,
     python_requires='>=3.8.*'
 )
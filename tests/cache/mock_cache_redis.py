@@ -1,17 +1,132 @@
 """Mocking redis"""
+import time
+
+import redis
+
+from gs.cache.redis_cache import CAS_SCRIPT
 
 
 class FakeRedis():
-    """Fake redis class"""
+    """Fake redis class, backed by a dict"""
+
+    def __init__(self, *args, **kwargs):
+        self.data = {}
+
+    def _alive(self, key: str):
+        value, valid_until = self.data.get(key, (None, None))
+        if valid_until is not None and valid_until <= time.time():
+            del self.data[key]
+            return None
+        return value
 
     def get(self, key: str):
-        return {'test_key': b'test_value',
-                'test_key2': None}.get(key)
+        return self._alive(key)
+
+    def set(self, key: str, value, ex: int = None, px: int = None,
+            nx: bool = False, **kwargs):
+        if nx and self._alive(key) is not None:
+            return None
+        if isinstance(value, (str, int)):
+            value = str(value).encode('utf-8')
+        seconds = ex or (px / 1000 if px else None)
+        self.data[key] = (value, time.time() + seconds if seconds else None)
+        return True
+
+    def incrby(self, key: str, amount: int):
+        value = self._alive(key)
+        try:
+            number = int(value or 0) + amount
+        except ValueError as exc:
+            raise redis.ResponseError(
+                'value is not an integer or out of range') from exc
+        valid_until = None if value is None else self.data[key][1]
+        self.data[key] = (str(number).encode('utf-8'), valid_until)
+        return number
+
+    def eval(self, script: str, numkeys: int, *args):
+        if script != CAS_SCRIPT:
+            raise NotImplementedError(script)
+        key, expected, value, milliseconds = args
+        if self._alive(key) != expected:
+            return 0
+        self.set(key, value, px=milliseconds or None)
+        return 1
+
+    def pttl(self, key: str):
+        if self._alive(key) is None:
+            return -2
+        valid_until = self.data[key][1]
+        if valid_until is None:
+            return -1
+        return int((valid_until - time.time()) * 1000)
+
+    def mget(self, keys):
+        return [self._alive(key) for key in keys]
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def flushdb(self):
+        self.data.clear()
+        return True
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+
+class FakePipeline():
+    """Fake redis pipeline: commands are executed on execute()"""
 
-    def set(self, *args, **kwargs):
-        ...
+    def __init__(self, fake_redis: FakeRedis):
+        self.fake_redis = fake_redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+    def execute(self):
+        results = [getattr(self.fake_redis, name)(*args, **kwargs)
+                   for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
 
 
 def fake_from_url(*args, **kwargs):
     """Fake from_url function"""
     return FakeRedis()
+
+
+class FakeAsyncRedis():
+    """Fake redis.asyncio class, wrapping FakeRedis"""
+
+    def __init__(self, *args, **kwargs):
+        self.fake_redis = FakeRedis()
+        self.closed = False
+
+    def __getattr__(self, name):
+        method = getattr(self.fake_redis, name)
+
+        async def command(*args, **kwargs):
+            return method(*args, **kwargs)
+        return command
+
+    def pipeline(self, transaction: bool = True):
+        return FakeAsyncPipeline(self.fake_redis)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeAsyncPipeline(FakePipeline):
+    """Fake redis.asyncio pipeline"""
+
+    async def execute(self):
+        return super().execute()
+
+
+def fake_async_from_url(*args, **kwargs):
+    """Fake redis.asyncio.from_url function"""
+    return FakeAsyncRedis()
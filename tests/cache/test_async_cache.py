@@ -0,0 +1,57 @@
+"""Test async caches"""
+import datetime
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from gs.cache import (AsyncCache, AsyncFileCache, AsyncMemoryCache,
+                      AsyncRedisCache, get_async_cache)
+
+from .mock_cache_redis import fake_async_from_url
+
+
+class TestAsyncCache(unittest.IsolatedAsyncioTestCase):
+    """Test async caches"""
+
+    def test_unknown_cache(self):
+        """Asserts uknown cache type raises exception"""
+        with self.assertRaises(Exception):
+            get_async_cache('unknown')
+
+    async def test_memory_cache(self):
+        """Test async memory cache"""
+        cache = get_async_cache('memory?max_items=100')
+        self.assertEqual(100, cache.cache.max_items)
+        await self._test_cache(cache, AsyncMemoryCache)
+
+    async def test_file_cache(self):
+        """Test async file cache"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = get_async_cache(f'path:{tmpdir}?max_workers=2')
+            self.assertEqual(2, cache.max_workers)
+            await self._test_cache(cache, AsyncFileCache)
+            self.assertIsNone(cache._executor)
+
+    @patch('redis.asyncio.from_url', fake_async_from_url)
+    async def test_redis_cache(self):
+        """Test async redis cache"""
+        cache = get_async_cache('redis://localhost:6379/0')
+        await self._test_cache(cache, AsyncRedisCache)
+        self.assertTrue(cache.redis.closed)
+
+    async def _test_cache(self, cache: AsyncCache, class_type):
+        self.assertIsInstance(cache, class_type)
+        await cache.set('test_key', 'test_value')
+        self.assertEqual('test_value', await cache.get('test_key'))
+
+        await cache.set('test_key2', 'test_value2',
+                        datetime.timedelta(seconds=-1))
+        self.assertIsNone(await cache.get('test_key2'))
+
+        await cache.set_many({'a': '1', 'b': '2'},
+                             datetime.timedelta(seconds=60))
+        self.assertEqual({'a': '1', 'b': '2', 'c': None},
+                         await cache.get_many(['a', 'b', 'c']))
+        self.assertEqual(1, await cache.delete_many(['a', 'c']))
+        self.assertIsNone(await cache.get('a'))
+        await cache.close()
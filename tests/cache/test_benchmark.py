@@ -0,0 +1,76 @@
+"""Test cache benchmark"""
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from gs.cache import benchmark, get_cache
+
+from .mock_cache_redis import FakeRedis
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test cache benchmark"""
+
+    def test_run(self):
+        """Every scenario reports set and get results"""
+        report = benchmark.run(['memory', 'path', 'sqlite'], [16], [20],
+                               [1.0, 0.5], [1, 2], operations=50)
+        results = report['results']
+        self.assertEqual(3 * 2 * 2 * 2, len(results))
+        for result in results:
+            self.assertEqual(50, result['operations'])
+            self.assertGreater(result['ops_per_second'], 0)
+            self.assertLessEqual(result['p50_us'], result['p99_us'])
+        gets = [result for result in results if result['operation'] == 'get'
+                and result['hit_ratio'] == 1.0]
+        self.assertTrue(all(result['hits'] == 50 for result in gets))
+        self.assertIsNone(report['meta']['redis'])
+
+    def test_reproducible(self):
+        """Same seed, same workload"""
+        first = benchmark.run(['memory'], [8], [100], [0.5], [1], 200, seed=1)
+        second = benchmark.run(['memory'], [8], [100], [0.5], [1], 200,
+                               seed=1)
+        self.assertEqual(first['results'][1]['hits'],
+                         second['results'][1]['hits'])
+
+    def test_private_caches(self):
+        """Benchmark caches are not shared with get_cache callers"""
+        shared = get_cache('memory', reuse=True)
+        with tempfile.TemporaryDirectory() as directory:
+            cache = benchmark.create_cache('memory', directory, None)
+        self.assertIsNot(shared, cache)
+        self.assertIs(shared, get_cache('memory', reuse=True))
+
+    @patch('redis.Redis', FakeRedis)
+    def test_redis_url(self):
+        """Redis runs against --redis-url"""
+        report = benchmark.run(['redis'], [8], [10], [1.0], [1], 20,
+                               redis_url='redis://localhost:6379/15')
+        self.assertEqual(['set', 'get'],
+                         [result['operation']
+                          for result in report['results']])
+        self.assertEqual('redis://localhost:6379/15', report['meta']['redis'])
+
+    def test_percentile(self):
+        """Nearest rank percentile"""
+        samples = [float(value) for value in range(1, 101)]
+        self.assertEqual(50.0, benchmark.percentile(samples, 50))
+        self.assertEqual(99.0, benchmark.percentile(samples, 99))
+        self.assertEqual(0.0, benchmark.percentile([], 50))
+
+    def test_main(self):
+        """Command line writes JSON"""
+        with tempfile.TemporaryDirectory() as path:
+            output = os.path.join(path, 'results.json')
+            self.assertEqual(0, benchmark.main(
+                ['--backends', 'memory', '--value-sizes', '8', '--keys', '10',
+                 '--hit-ratios', '1', '--threads', '1', '--operations', '10',
+                 '--output', output]))
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+        self.assertEqual('memory/value=8/keys=10/hit=1/threads=1',
+                         report['results'][0]['scenario'])
+        self.assertIn('version', report['meta'])
@@ -1,12 +1,14 @@
 """Test Caches"""
 import datetime
 import tempfile
+import threading
 import unittest
 from unittest.mock import patch
 
-from gs.cache import Cache, FileCache, MemoryCache, RedisCache, get_cache
+from gs.cache import (Cache, FileCache, MemoryCache, RedisCache, SQLiteCache,
+                      SharedMemoryCache, get_cache)
 
-from .mock_cache_redis import fake_from_url
+from .mock_cache_redis import FakeRedis
 
 
 class TestCache(unittest.TestCase):
@@ -28,7 +30,21 @@ class TestCache(unittest.TestCase):
             cache = get_cache(f'path://{tmpdir}')
             self._test_cache(cache, FileCache)
 
-    @patch('redis.utils.from_url', fake_from_url)
+    def test_sqlite_cache(self):
+        """Test sqlite cache"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = get_cache(f'sqlite:{tmpdir}/cache.db')
+            self._test_cache(cache, SQLiteCache)
+            cache.close()
+
+    def test_shared_memory_cache(self):
+        """Test shared memory cache"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = get_cache(f'shm:test?size=1MB&dir={tmpdir}')
+            self._test_cache(cache, SharedMemoryCache)
+            cache.close()
+
+    @patch('redis.Redis', FakeRedis)
     def test_redis_cache(self):
         """Test redis cache"""
         cache = get_cache('redis://localhost:6379/0')
@@ -41,3 +57,133 @@ class TestCache(unittest.TestCase):
 
         cache.set('test_key2', 'test_value2', datetime.timedelta(seconds=-1))
         self.assertIsNone(cache.get('test_key2'))
+
+        self._test_batch(cache)
+        self._test_ttl(cache)
+        self._test_atomic(cache)
+
+        cache.set('test_bytes', b'\x00\xffbinary')
+        self.assertEqual(b'\x00\xffbinary', cache.get('test_bytes'))
+
+    def _test_ttl(self, cache: Cache):
+        self.assertEqual((None, None), cache.get_with_ttl('ttl_missing'))
+        cache.set('ttl_forever', 'value')
+        self.assertEqual(('value', datetime.timedelta(0)),
+                         cache.get_with_ttl('ttl_forever'))
+        cache.set('ttl_key', 'value', datetime.timedelta(seconds=60))
+        value, ttl = cache.get_with_ttl('ttl_key')
+        self.assertEqual('value', value)
+        self.assertGreater(ttl, datetime.timedelta(seconds=55))
+        self.assertLessEqual(ttl, datetime.timedelta(seconds=60))
+
+    def _test_batch(self, cache: Cache):
+        cache.set_many({f'batch_{i}': f'value_{i}' for i in range(10)},
+                       datetime.timedelta(seconds=60))
+        values = cache.get_many(
+            [f'batch_{i}' for i in range(10)] + ['batch_missing'])
+        self.assertEqual(11, len(values))
+        self.assertIsNone(values['batch_missing'])
+        self.assertEqual('value_9', values['batch_9'])
+        self.assertEqual({}, cache.get_many([]))
+
+        self.assertEqual(2, cache.delete_many(
+            ['batch_0', 'batch_1', 'batch_missing']))
+        values = cache.get_many(['batch_0', 'batch_2'])
+        self.assertEqual({'batch_0': None, 'batch_2': 'value_2'}, values)
+
+    def _test_atomic(self, cache: Cache):
+        self.assertTrue(cache.add('atomic_add', 'first'))
+        self.assertFalse(cache.add('atomic_add', 'second'))
+        self.assertEqual('first', cache.get('atomic_add'))
+        cache.set('atomic_expired', 'old', datetime.timedelta(seconds=-1))
+        self.assertTrue(cache.add('atomic_expired', 'new'))
+        self.assertEqual('new', cache.get('atomic_expired'))
+
+        self.assertTrue(cache.delete('atomic_add'))
+        self.assertFalse(cache.delete('atomic_add'))
+        self.assertIsNone(cache.get('atomic_add'))
+
+        self.assertEqual(1, cache.incr('atomic_counter'))
+        self.assertEqual(6, cache.incr('atomic_counter', 5))
+        self.assertEqual(4, cache.incr('atomic_counter', -2))
+        self.assertEqual('4', cache.get('atomic_counter'))
+        cache.incr('atomic_ttl', ttl=datetime.timedelta(seconds=60))
+        cache.incr('atomic_ttl')
+        value, ttl = cache.get_with_ttl('atomic_ttl')
+        self.assertEqual('2', value)
+        self.assertGreater(ttl, datetime.timedelta(seconds=55))
+        cache.set('atomic_text', 'text')
+        with self.assertRaises(ValueError):
+            cache.incr('atomic_text')
+
+        self.assertFalse(cache.cas('atomic_cas', 'a', 'b'))
+        cache.set('atomic_cas', 'a')
+        self.assertFalse(cache.cas('atomic_cas', 'x', 'b'))
+        self.assertTrue(cache.cas('atomic_cas', 'a', 'b'))
+        self.assertEqual('b', cache.get('atomic_cas'))
+
+
+class TestAtomicCounters(unittest.TestCase):
+    """Test atomic operations from many threads"""
+
+    THREADS = 8
+    INCREMENTS = 50
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _race(self, caches):
+        winners = []
+
+        def work(cache):
+            for _ in range(self.INCREMENTS):
+                cache.incr('counter')
+            if cache.add('lock', 'owner'):
+                winners.append(cache)
+
+        threads = [threading.Thread(target=work,
+                                    args=(caches[i % len(caches)],))
+                   for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(str(self.THREADS * self.INCREMENTS),
+                         caches[0].get('counter'))
+        self.assertEqual(1, len(winners))
+
+    def test_memory(self):
+        """Memory counters are exact without thread_safe"""
+        self._race([get_cache('memory', reuse=False)])
+
+    def test_concurrent_memory(self):
+        """Sharded memory counters are exact"""
+        self._race([get_cache('memory?shards=4', reuse=False)])
+
+    def test_file(self):
+        """File counters are exact between instances (lock files)"""
+        self._race([get_cache(f'path:{self.path}', reuse=False)
+                    for _ in range(4)])
+
+    def test_sqlite(self):
+        """SQLite counters are exact"""
+        self._race([get_cache(f'sqlite:{self.path}/cache.db', reuse=False)])
+
+    def test_shared_memory(self):
+        """Shared memory counters are exact"""
+        cache = get_cache(f'shm:atomic?size=1MB&dir={self.path}',
+                          reuse=False)
+        self._race([cache])
+        cache.close()
+
+    def test_shared_memory_instances(self):
+        """Shared memory counters are exact between instances"""
+        connection_string = f'shm:atomic?size=1MB&dir={self.path}'
+        caches = [get_cache(connection_string) for _ in range(2)]
+        self._race(caches)
+        for cache in caches:
+            cache.close()
@@ -0,0 +1,162 @@
+"""Test cached decorator"""
+import asyncio
+import threading
+import time
+import unittest
+
+from gs.cache import AsyncMemoryCache, MemoryCache, cached
+from gs.cache.cached import make_key
+from gs.cache.single_flight import SingleFlight
+
+
+class TestCached(unittest.TestCase):
+    """Test cached decorator"""
+
+    def test_cached(self):
+        """Results are cached by arguments"""
+        calls = []
+
+        @cached(ttl=60)
+        def add(a, b=1):
+            calls.append((a, b))
+            return {'sum': a + b}
+
+        self.assertEqual({'sum': 3}, add(2))
+        self.assertEqual({'sum': 3}, add(2, 1))
+        self.assertEqual({'sum': 3}, add(a=2, b=1))
+        self.assertEqual({'sum': 4}, add(2, 2))
+        self.assertEqual([(2, 1), (2, 2)], calls)
+        self.assertIsInstance(add.cache, MemoryCache)
+        self.assertTrue(add.cache.thread_safe)
+
+        self.assertTrue(add.invalidate(2))
+        add(2)
+        self.assertEqual(3, len(calls))
+
+    def test_none_result_is_cached(self):
+        """None results are cached too"""
+        calls = []
+
+        @cached()
+        def nothing():
+            calls.append(1)
+
+        self.assertIsNone(nothing())
+        self.assertIsNone(nothing())
+        self.assertEqual(1, len(calls))
+
+    def test_make_key(self):
+        """Keys are stable and depend on function and arguments"""
+        def func(a, b=2):
+            return a + b
+
+        self.assertEqual(make_key(func, 1), make_key(func, a=1, b=2))
+        self.assertNotEqual(make_key(func, 1), make_key(func, 2))
+        self.assertTrue(make_key(func, 1).startswith(
+            f'{__name__}.TestCached.test_make_key.<locals>.func:'))
+
+    def test_make_key_objects(self):
+        """Objects are not embedded in keys by repr"""
+        class Service:
+            """Service with a cached method"""
+
+            def __init__(self, name):
+                self.name = name
+
+            @cached()
+            def method(self, value):
+                return value
+
+            @cached(key=lambda self, value: f'{self.name}:{value}')
+            def keyed(self, value):
+                return value
+
+        with self.assertRaises(TypeError):
+            make_key(Service.method, Service('a'), 1)
+        with self.assertRaises(TypeError):
+            Service('a').method(1)
+        self.assertEqual(1, Service('a').keyed(1))
+        self.assertEqual('1', Service.keyed.cache.get('a:1'))
+
+    def test_custom_key_and_cache(self):
+        """Custom key function and connection string"""
+        @cached('memory', key=lambda user_id: f'user:{user_id}')
+        def user(user_id):
+            return {'id': user_id}
+
+        user(10)
+        self.assertEqual('{"id": 10}', user.cache.get('user:10'))
+
+    def test_single_flight(self):
+        """Concurrent misses run the function once"""
+        calls = []
+        barrier = threading.Barrier(10)
+
+        @cached(ttl=60)
+        def slow(value):
+            calls.append(value)
+            time.sleep(0.1)
+            return value * 2
+
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(slow(21))
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([42] * 10, results)
+        self.assertEqual([21], calls)
+
+    def test_single_flight_errors(self):
+        """Errors are raised to every waiting caller"""
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('fail')
+
+        with self.assertRaises(ValueError):
+            flight.do('key', fail)
+        self.assertEqual(0, len(flight))
+
+
+class TestCachedAsync(unittest.IsolatedAsyncioTestCase):
+    """Test cached decorator on coroutines"""
+
+    async def test_async_single_flight(self):
+        """Concurrent awaits run the coroutine once"""
+        calls = []
+
+        @cached(AsyncMemoryCache(), ttl=60)
+        async def slow(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return [value]
+
+        results = await asyncio.gather(*(slow(1) for _ in range(10)))
+        self.assertEqual([[1]] * 10, results)
+        self.assertEqual([1], calls)
+        self.assertEqual([1], await slow(1))
+        self.assertTrue(await slow.invalidate(1))
+        await slow(1)
+        self.assertEqual([1, 1], calls)
+
+    async def test_async_with_sync_cache(self):
+        """Coroutines may use sync caches"""
+        @cached(MemoryCache())
+        async def double(value):
+            return value * 2
+
+        self.assertEqual(4, await double(2))
+        self.assertEqual('4', double.cache.get(double.cache_key(2)))
+
+    def test_async_cache_on_sync_function(self):
+        """AsyncCache requires coroutines"""
+        with self.assertRaises(TypeError):
+            @cached(AsyncMemoryCache())
+            def func():
+                ...
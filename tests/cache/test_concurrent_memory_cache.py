@@ -0,0 +1,134 @@
+"""Test concurrent memory cache"""
+import datetime
+import random
+import sys
+import threading
+import unittest
+
+from gs.cache import ConcurrentMemoryCache, MemoryCache, get_cache
+
+THREADS = 8
+OPERATIONS = 3000
+
+
+def stress(cache, seed: int, errors: list, barrier: threading.Barrier):
+    """Random mix of reads, writes, deletes and short lived entries"""
+    rng = random.Random(seed)
+    barrier.wait()
+    try:
+        for _ in range(OPERATIONS):
+            key = f'key{rng.randrange(200)}'
+            action = rng.random()
+            if action < 0.4:
+                cache.get(key)
+            elif action < 0.5:
+                cache.get_with_ttl(key)
+            elif action < 0.75:
+                # Expired or about to expire entries race with readers
+                cache.set(key, 'v' * rng.randrange(1, 64),
+                          datetime.timedelta(
+                              microseconds=rng.choice([-1, 1, 0, 200])))
+            elif action < 0.85:
+                cache.set_many({f'key{rng.randrange(200)}': 'many'
+                                for _ in range(5)})
+            elif action < 0.95:
+                cache.get_many([f'key{rng.randrange(200)}'
+                                for _ in range(5)])
+            else:
+                cache.delete_many([key])
+    except Exception as exc:  # pylint: disable=broad-except
+        errors.append(exc)
+
+
+def run_stress(cache) -> list:
+    """Run stress on THREADS threads, returns raised exceptions"""
+    errors = []
+    barrier = threading.Barrier(THREADS)
+    threads = [threading.Thread(target=stress,
+                                args=(cache, seed, errors, barrier))
+               for seed in range(THREADS)]
+    switch_interval = sys.getswitchinterval()
+    # Switch threads often, to interleave operations
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    return errors
+
+
+def check_shard(testcase: unittest.TestCase, shard: MemoryCache):
+    """Accounting of a bounded shard matches its entries"""
+    testcase.assertEqual(
+        sum(shard._entry_size(key, value)
+            for key, (value, _) in shard.cache.items()),
+        shard.size_bytes)
+    if shard.max_items:
+        testcase.assertLessEqual(len(shard.cache), shard.max_items)
+
+
+class TestConcurrentMemoryCache(unittest.TestCase):
+    """Test concurrent memory cache"""
+
+    def test_parse(self):
+        """shards option selects the concurrent cache"""
+        cache = get_cache('memory?shards=8&max_items=800&policy=lfu')
+        self.assertIsInstance(cache, ConcurrentMemoryCache)
+        self.assertEqual(8, len(cache.shards))
+        self.assertEqual(100, cache.shards[0].max_items)
+        self.assertTrue(all(shard.thread_safe for shard in cache.shards))
+        self.assertIsInstance(get_cache('memory'), MemoryCache)
+
+    def test_operations(self):
+        """Keys are spread over shards transparently"""
+        cache = ConcurrentMemoryCache(shards=4)
+        items = {f'key{index}': str(index) for index in range(100)}
+        cache.set_many(items)
+        self.assertEqual(100, len(cache))
+        self.assertGreater(min(len(shard.cache) for shard in cache.shards),
+                           0)
+        self.assertEqual(items, cache.get_many(list(items)))
+        self.assertEqual('5', cache.get('key5'))
+        cache.set('ttl', 'x', datetime.timedelta(seconds=60))
+        self.assertGreater(cache.get_with_ttl('ttl')[1].total_seconds(), 59)
+        self.assertEqual(2, cache.delete_many(['key1', 'key2', 'key1']))
+        self.assertIsNone(cache.get('key1'))
+
+    def test_limits(self):
+        """Limits are split between shards"""
+        cache = ConcurrentMemoryCache(shards=4, max_items=40)
+        cache.set_many({f'key{index}': 'value' for index in range(1000)})
+        self.assertLessEqual(len(cache), 40)
+        self.assertEqual(1000 - len(cache), cache.evictions)
+        with self.assertRaises(ValueError):
+            ConcurrentMemoryCache(shards=16, max_items=8)
+
+    def test_expirations(self):
+        """Expired entries are counted across shards"""
+        cache = ConcurrentMemoryCache(shards=2)
+        cache.set_many({'a': '1', 'b': '2'}, datetime.timedelta(seconds=-1))
+        cache.sweep()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(2, cache.stats()['expirations'])
+
+    def test_stress_concurrent(self):
+        """Many threads: no errors, consistent accounting"""
+        cache = ConcurrentMemoryCache(shards=4, max_items=100,
+                                      max_bytes=64 * 1024)
+        cache.start_sweeper(0.001)
+        try:
+            self.assertEqual([], run_stress(cache))
+        finally:
+            cache.stop_sweeper()
+        for shard in cache.shards:
+            check_shard(self, shard)
+
+    def test_stress_thread_safe_memory_cache(self):
+        """thread_safe MemoryCache survives the same stress"""
+        cache = get_cache('memory?thread_safe=1&max_items=50&policy=lfu')
+        self.assertTrue(cache.thread_safe)
+        self.assertEqual([], run_stress(cache))
+        check_shard(self, cache)
@@ -0,0 +1,379 @@
+"""Test file cache layout and quota"""
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from gs.cache import FileCache, file_cache, get_cache, janitor
+from gs.cache.file_cache import walk_files
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+class TestFileCacheLayout(unittest.TestCase):
+    """Test file cache layout and writes"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _files(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.path)
+                      for root, _, names in os.walk(self.path)
+                      for name in names)
+
+    def test_sharded_layout(self):
+        """Entries are stored in a fan-out tree"""
+        cache = get_cache(f'path:{self.path}')
+        cache.set('key', 'value')
+        hash_name = FileCache._hash('key')
+        self.assertEqual(
+            [os.path.join(hash_name[:2], hash_name[2:4],
+                          f'{hash_name}.json')],
+            self._files())
+        self.assertEqual('value', cache.get('key'))
+
+    def test_flat_layout(self):
+        """levels=0 keeps the flat layout"""
+        cache = get_cache(f'path:{self.path}?levels=0')
+        cache.set('key', 'value')
+        self.assertEqual([f'cache_{FileCache._hash("key")}.json'],
+                         self._files())
+
+    def test_lazy_migration(self):
+        """Flat entries are moved to the tree when read"""
+        flat = get_cache(f'path:{self.path}?levels=0')
+        flat.set('a', '1')
+        flat.set('b', '2')
+
+        cache = get_cache(f'path:{self.path}')
+        self.assertTrue(cache.legacy)
+        self.assertEqual('1', cache.get('a'))
+        self.assertEqual(
+            1, len([f for f in self._files() if f.startswith('cache_')]))
+        self.assertEqual(1, cache.delete_many(['b']))
+        self.assertEqual([], [f for f in self._files()
+                              if f.startswith('cache_')])
+
+    def test_migrate(self):
+        """migrate=1 moves all flat entries"""
+        flat = get_cache(f'path:{self.path}?levels=0')
+        flat.set_many({'a': '1', 'b': '2'})
+
+        cache = get_cache(f'path:{self.path}?migrate=1&levels=1')
+        self.assertFalse(cache.legacy)
+        self.assertEqual(2, len(self._files()))
+        self.assertTrue(all(len(f.split(os.sep)) == 2
+                            for f in self._files()))
+        self.assertEqual({'a': '1', 'b': '2'}, cache.get_many(['a', 'b']))
+
+    def test_atomic_write(self):
+        """Failed writes leave neither partial entries nor temp files"""
+        cache = get_cache(f'path:{self.path}')
+        cache.set('key', 'value')
+        with patch('os.replace', side_effect=OSError('disk full')):
+            with self.assertLogs('FileCache', level='ERROR'):
+                cache.set('key', 'new value')
+        self.assertEqual('value', cache.get('key'))
+        self.assertEqual(1, len(self._files()))
+
+    @unittest.skipIf(os.name == 'nt', 'POSIX permissions')
+    def test_file_mode(self):
+        """Entries get the umask permissions, not the 0600 of mkstemp"""
+        cache = get_cache(f'path:{self.path}', reuse=False)
+        with patch('gs.cache.file_cache.FILE_MODE', 0o664):
+            cache.set('key', 'value')
+        mode = os.stat(cache._filename('key')).st_mode & 0o777
+        self.assertEqual(0o664, mode)
+
+    def test_legacy_json_entries(self):
+        """JSON entries of previous versions are read"""
+        cache = get_cache(f'path:{self.path}?levels=0')
+        with open(cache._filename('key'), 'w', encoding='utf-8') as file:
+            json.dump(['value', time.time() + 60], file)
+        self.assertEqual('value', cache.get('key'))
+        self.assertGreater(cache.read_valid_until(cache._filename('key')),
+                           time.time())
+
+
+class TestFileCacheQuota(unittest.TestCase):
+    """Test file cache quota and janitor"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _age(self, cache: FileCache, key: str, seconds: float):
+        filename = cache._filename(key)
+        mtime = time.time() - seconds
+        os.utime(filename, (mtime, mtime))
+
+    @staticmethod
+    def _wait_quota_pass(cache: FileCache):
+        if cache._quota_thread is not None:
+            cache._quota_thread.join(5)
+
+    def test_max_files(self):
+        """Least recently used entries are evicted"""
+        cache = get_cache(f'path:{self.path}?max_files=10')
+        cache.compact()
+        for i in range(10):
+            cache.set(f'key{i}', 'value')
+            self._age(cache, f'key{i}', 1000 - i)
+        self.assertEqual(10, cache.usage_files)
+        self.assertEqual('value', cache.get('key0'))  # touched
+        cache.set('key10', 'value')
+        self._wait_quota_pass(cache)
+        self.assertLessEqual(cache.usage_files, 9)
+        self.assertEqual('value', cache.get('key0'))
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual('value', cache.get('key10'))
+
+    def test_max_bytes(self):
+        """Usage in bytes is bounded"""
+        cache = get_cache(f'path:{self.path}?max_bytes=2KB')
+        for i in range(50):
+            cache.set(f'key{i}', 'x' * 100)
+            self._wait_quota_pass(cache)
+        self.assertLessEqual(cache.usage_bytes, 2048)
+        report = cache.compact()
+        self.assertTrue(report.complete)
+        self.assertLessEqual(cache.usage_bytes, 2048)
+
+    def test_writes_do_not_scan(self):
+        """Usage is measured in background; overwrites replace their size"""
+        cache = get_cache(f'path:{self.path}?max_files=100')
+        with patch.object(cache.janitor, 'run',
+                          wraps=cache.janitor.run) as run:
+            cache.set('key', 'x' * 100)
+            self._wait_quota_pass(cache)
+            self.assertEqual(1, run.call_count)
+            self.assertNotEqual(threading.get_ident(),
+                                cache._quota_thread.ident)
+        self.assertEqual(1, cache.usage_files)
+        size = cache.usage_bytes
+        for _ in range(10):
+            cache.set('key', 'x' * 100)
+        self.assertEqual(1, cache.usage_files)
+        self.assertEqual(size, cache.usage_bytes)
+        cache.set('key', 'x' * 50)
+        self.assertEqual(size - 50, cache.usage_bytes)
+
+    def test_janitor_steps(self):
+        """Janitor removes expired entries incrementally"""
+        cache = get_cache(f'path:{self.path}')
+        cache.set_many({f'key{i}': 'value' for i in range(10)},
+                       datetime.timedelta(seconds=-1))
+        cache.set('alive', 'value')
+        with tempfile.NamedTemporaryFile(
+                prefix='.tmp-', dir=self.path, delete=False) as tmp:
+            tmp.write(b'partial')
+        os.utime(tmp.name, (0, 0))
+
+        first = cache.janitor.step(5)
+        self.assertEqual(5, first.scanned)
+        self.assertFalse(first.complete)
+        rest = cache.janitor.step(0)
+        self.assertTrue(rest.complete)
+        self.assertEqual(10, first.expired + rest.expired)
+        self.assertGreater(first.bytes_reclaimed + rest.bytes_reclaimed, 0)
+        self.assertFalse(os.path.exists(tmp.name))
+        self.assertEqual(1, cache.usage_files)
+        self.assertEqual('value', cache.get('alive'))
+
+    def test_background_janitor(self):
+        """Background janitor runs in slices"""
+        cache = get_cache(
+            f'path:{self.path}?janitor_interval=0.01&janitor_slice=2')
+        try:
+            cache.set_many({f'key{i}': 'value' for i in range(6)},
+                           datetime.timedelta(seconds=-1))
+            deadline = time.monotonic() + 2
+            while cache.usage_files is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            cache.stop_janitor()
+        self.assertEqual(0, cache.usage_files)
+
+    def test_cli(self):
+        """Janitor command line prints the report"""
+        cache = get_cache(f'path:{self.path}')
+        cache.set('key', 'value', datetime.timedelta(seconds=-1))
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(0, janitor.main([f'path:{self.path}']))
+        report = json.loads(output.getvalue())
+        self.assertEqual(1, report['expired'])
+        self.assertTrue(report['complete'])
+
+
+class TestFileCacheIndex(unittest.TestCase):
+    """Test file cache key index"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_misses_skip_file_system(self):
+        """Keys missing from the index are not looked up"""
+        get_cache(f'path:{self.path}', reuse=False).set('old', 'value')
+        cache = get_cache(f'path:{self.path}?index=1', reuse=False)
+        self.assertEqual('value', cache.get('old'))
+        cache.index.join(5)
+        self.assertEqual(1, cache.index.builds)
+        cache.set('new', 'value')
+        with patch('os.stat', side_effect=AssertionError('stat')):
+            self.assertIsNone(cache.get('missing'))
+            self.assertEqual((None, None), cache.get_with_ttl('missing'))
+            self.assertEqual({'a': None, 'b': None},
+                             cache.get_many(['a', 'b']))
+        self.assertEqual(4, cache.index.skipped)
+        self.assertEqual({'old': 'value', 'new': 'value', 'x': None},
+                         cache.get_many(['old', 'new', 'x']))
+
+    def test_removals(self):
+        """Deleted and expired entries leave the index"""
+        cache = get_cache(f'path:{self.path}?index=1', reuse=False)
+        cache.set_many({'a': '1', 'b': '2'})
+        cache.set('c', '3', datetime.timedelta(seconds=-1))
+        self.assertEqual(3, cache.rebuild_index())
+        self.assertEqual(1, cache.delete_many(['a']))
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(1, len(cache.index))
+        self.assertEqual('2', cache.get('b'))
+
+    def test_rebuild_interval(self):
+        """Entries of other processes are seen after a rebuild"""
+        cache = get_cache(f'path:{self.path}?index_rebuild=0.05',
+                          reuse=False)
+        other = get_cache(f'path:{self.path}', reuse=False)
+        self.assertIsNone(cache.get('key'))
+        cache.index.join(5)
+        other.set('key', 'value')
+        self.assertIsNone(cache.get('key'))
+        time.sleep(0.1)
+        # The lookup starting the rebuild still uses the old index
+        self.assertIsNone(cache.get('key'))
+        cache.index.join(5)
+        self.assertEqual('value', cache.get('key'))
+        self.assertEqual(2, cache.index.builds)
+
+    def test_lookups_do_not_wait_for_builds(self):
+        """Builds run in background; lookups use the file system meanwhile
+        """
+        cache = FileCache(index=True).parse(f'path:{self.path}')
+        cache.set('key', 'value')
+        release = threading.Event()
+
+        def walk(path):
+            release.wait(5)
+            yield from walk_files(path)
+
+        with patch('gs.cache.file_cache.walk_files', walk):
+            self.assertEqual('value', cache.get('key'))
+            self.assertIsNone(cache.get('missing'))
+            self.assertEqual(0, cache.index.builds)
+            release.set()
+            cache.index.join(5)
+        self.assertEqual(1, cache.index.builds)
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(1, cache.index.skipped)
+
+    def test_writes_during_build(self):
+        """Writes while the index is being built are kept"""
+        cache = FileCache(index=True).parse(f'path:{self.path}')
+
+        def walk(path):
+            entries = list(walk_files(path))
+            cache.set('during', 'value')
+            yield from entries
+
+        with patch('gs.cache.file_cache.walk_files', walk):
+            cache.rebuild_index()
+        self.assertIn(FileCache._hash('during'), cache.index)
+        self.assertEqual('value', cache.get('during'))
+
+
+class TestFileCacheAtomic(unittest.TestCase):
+    """Test file cache atomic operations"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @staticmethod
+    def _lock_name(cache: FileCache, key: str) -> str:
+        return os.path.join(os.path.dirname(cache._filename(key)),
+                            f'{file_cache.LOCK_PREFIX}{cache._hash(key)}')
+
+    def test_index_does_not_hide_entries(self):
+        """Atomic operations see entries missing from the index"""
+        cache = get_cache(f'path:{self.path}?index=1')
+        cache.rebuild_index()
+        other = get_cache(f'path:{self.path}')
+        self.assertTrue(other.add('lock', 'other'))
+        self.assertEqual(5, other.incr('counter', 5))
+        self.assertFalse(cache.add('lock', 'mine'))
+        self.assertEqual(6, cache.incr('counter'))
+        self.assertTrue(cache.cas('lock', 'other', 'mine'))
+        self.assertEqual('mine', cache.get('lock'))
+        self.assertIn(cache._hash('counter'), cache.index)
+
+    @unittest.skipIf(fcntl is None, 'needs fcntl')
+    def test_live_holder_keeps_lock(self):
+        """Locks of live holders are never broken: waiters time out"""
+        cache = get_cache(f'path:{self.path}')
+        cache.set('counter', '1')
+        lock_name = self._lock_name(cache, 'counter')
+        fd = os.open(lock_name, os.O_CREAT | os.O_WRONLY, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.utime(lock_name, (0, 0))
+            with patch.object(file_cache, 'LOCK_TIMEOUT', 0.1):
+                with self.assertRaises(TimeoutError):
+                    cache.incr('counter')
+        finally:
+            os.close(fd)
+        self.assertEqual(2, cache.incr('counter'))
+        self.assertFalse(os.path.exists(lock_name))
+
+    @unittest.skipIf(fcntl is None, 'needs fcntl')
+    def test_crashed_holder(self):
+        """Lock files left by crashed processes are not locked"""
+        cache = get_cache(f'path:{self.path}')
+        cache.set('counter', '1')
+        lock_name = self._lock_name(cache, 'counter')
+        with open(lock_name, 'w', encoding='utf-8'):
+            pass
+        self.assertEqual(2, cache.incr('counter'))
+
+    def test_incr_write_error(self):
+        """incr raises when the counter cannot be stored"""
+        cache = get_cache(f'path:{self.path}')
+        self.assertEqual(1, cache.incr('counter'))
+        with patch('os.replace', side_effect=OSError(28, 'No space')):
+            with self.assertLogs('FileCache', 'ERROR'):
+                with self.assertRaises(OSError):
+                    cache.incr('counter')
+        self.assertEqual('1', cache.get('counter'))
@@ -0,0 +1,188 @@
+"""Test bounded memory cache"""
+import datetime
+import time
+import unittest
+
+from gs.cache import MemoryCache, get_cache
+from gs.cache.eviction import LFUPolicy, LRUPolicy, create_policy
+from gs.cache.options import parse_size
+
+
+class TestMemoryCache(unittest.TestCase):
+    """Test bounded memory cache"""
+
+    def test_parse_options(self):
+        """Connection string options configure limits and policy"""
+        cache = get_cache('memory?max_items=10&max_bytes=1MB&policy=lfu')
+        self.assertIsInstance(cache, MemoryCache)
+        self.assertEqual(10, cache.max_items)
+        self.assertEqual(1024 * 1024, cache.max_bytes)
+        self.assertIsInstance(cache.policy, LFUPolicy)
+
+    def test_unbounded(self):
+        """Default memory cache has no policy"""
+        cache = MemoryCache()
+        self.assertFalse(cache.bounded)
+        for i in range(100):
+            cache.set(f'key{i}', 'value')
+        self.assertEqual(100, len(cache.cache))
+        self.assertEqual(0, cache.evictions)
+
+    def test_lru_max_items(self):
+        """Least recently used entry is evicted"""
+        cache = MemoryCache(max_items=2, policy='lru')
+        cache.set('a', '1')
+        cache.set('b', '2')
+        self.assertEqual('1', cache.get('a'))
+        cache.set('c', '3')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('1', cache.get('a'))
+        self.assertEqual('3', cache.get('c'))
+        self.assertEqual(1, cache.evictions)
+
+    def test_lfu_max_items(self):
+        """Least frequently used entry is evicted"""
+        cache = MemoryCache(max_items=2, policy='lfu')
+        cache.set('a', '1')
+        cache.set('b', '2')
+        for _ in range(3):
+            cache.get('b')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual('2', cache.get('b'))
+        self.assertEqual('3', cache.get('c'))
+
+    def test_max_bytes(self):
+        """Approximate size is tracked and bounded"""
+        cache = MemoryCache(max_bytes=2000)
+        for i in range(100):
+            cache.set(f'key{i}', 'x' * 100)
+        self.assertLessEqual(cache.size_bytes, 2000)
+        self.assertGreater(cache.evictions, 0)
+        self.assertGreater(cache.evicted_bytes, 0)
+        cache.set('huge', 'x' * 5000)
+        self.assertIsNone(cache.get('huge'))
+
+    def test_size_accounting_on_overwrite(self):
+        """Overwriting a key does not leak size"""
+        cache = MemoryCache(max_items=10)
+        cache.set('a', 'x' * 10)
+        size = cache.size_bytes
+        cache.set('a', 'x' * 10)
+        self.assertEqual(size, cache.size_bytes)
+
+
+class TestEvictionPolicies(unittest.TestCase):
+    """Test eviction policies"""
+
+    def test_create_policy(self):
+        """Policies are created by name"""
+        self.assertIsInstance(create_policy('LRU'), LRUPolicy)
+        with self.assertRaises(ValueError):
+            create_policy('fifo')
+
+    def test_lfu_remove_min_bucket(self):
+        """Victim skips buckets emptied by removals"""
+        policy = LFUPolicy()
+        policy.add('a')
+        policy.add('b')
+        policy.touch('b')
+        policy.remove('a')
+        self.assertEqual('b', policy.victim())
+        policy.remove('b')
+        self.assertIsNone(policy.victim())
+
+    def test_lfu_min_frequency_after_removal(self):
+        """Lowest frequency is tracked without scanning up to hot keys"""
+        policy = LFUPolicy()
+        policy.add('hot')
+        for _ in range(1000):
+            policy.touch('hot')
+        policy.add('warm')
+        policy.touch('warm')
+        policy.touch('warm')
+        policy.add('cold')
+        self.assertEqual('cold', policy.victim())
+        policy.remove('cold')
+        self.assertEqual(3, policy.min_frequency)
+        self.assertEqual('warm', policy.victim())
+        policy.remove('warm')
+        self.assertEqual(1001, policy.min_frequency)
+        policy.add('new')
+        self.assertEqual('new', policy.victim())
+        policy.touch('new')
+        self.assertEqual([2, 1001], sorted(policy.buckets))
+        self.assertEqual('new', policy.victim())
+
+    def test_parse_size(self):
+        """Size strings"""
+        self.assertEqual(1024, parse_size('1KB'))
+        self.assertEqual(256 * 1024 ** 2, parse_size('256MB'))
+        self.assertEqual(100, parse_size('100'))
+        self.assertEqual(10, parse_size('10B'))
+        with self.assertRaises(ValueError):
+            parse_size('abc')
+
+
+class TestMemoryCacheExpiration(unittest.TestCase):
+    """Test memory cache expiration index and sweeper"""
+
+    def test_set_reclaims_expired_entries(self):
+        """Expired entries are removed without being read"""
+        cache = MemoryCache(sweep_slice=10)
+        for i in range(5):
+            cache.set(f'key{i}', 'value', datetime.timedelta(seconds=-1))
+        cache.set('alive', 'value')
+        self.assertEqual(['alive'], list(cache.cache))
+        self.assertEqual(5, cache.expirations)
+
+    def test_eviction_sweeps_a_slice(self):
+        """Over-limit inserts sweep at most sweep_slice expired entries"""
+        cache = MemoryCache(sweep_slice=4)
+        expired = time.monotonic() - 1
+        for i in range(100):
+            cache.cache[f'key{i}'] = ('value', expired)
+            cache.expiry_heap.append((expired, f'key{i}'))
+        cache.configure(max_items=50)
+        self.assertEqual(4, cache.expirations)
+        self.assertEqual(46, cache.evictions)
+        self.assertEqual(50, len(cache.cache))
+
+    def test_sweep_slices(self):
+        """Sweep removes at most max_items entries per call"""
+        cache = MemoryCache(sweep_slice=0)
+        expired = time.monotonic() - 1
+        for i in range(10):
+            cache.cache[f'key{i}'] = ('value', expired)
+            cache.expiry_heap.append((expired, f'key{i}'))
+        self.assertEqual(3, cache.sweep(3))
+        self.assertEqual(7, cache.sweep())
+        self.assertEqual({}, cache.cache)
+
+    def test_overwrite_keeps_new_deadline(self):
+        """Stale heap entries do not remove overwritten keys"""
+        cache = MemoryCache()
+        cache.set('key', 'old', datetime.timedelta(seconds=-1))
+        cache.set('key', 'new')
+        cache.sweep()
+        self.assertEqual('new', cache.get('key'))
+
+    def test_background_sweeper(self):
+        """Background sweeper reclaims expired entries"""
+        cache = get_cache('memory?sweep_interval=0.01&sweep_slice=2')
+        lock = cache.lock
+        try:
+            for i in range(10):
+                cache.set(f'exp{i}', 'value',
+                          datetime.timedelta(milliseconds=10))
+            deadline = time.monotonic() + 2
+            while any(k.startswith('exp') for k in list(cache.cache)) and \
+                    time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertFalse(
+                any(k.startswith('exp') for k in list(cache.cache)))
+        finally:
+            cache.stop_sweeper()
+        self.assertIs(lock, cache.lock)
+        self.assertFalse(cache._locking)
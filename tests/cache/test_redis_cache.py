@@ -0,0 +1,135 @@
+"""Test redis cache pooling and auto pipelining"""
+import datetime
+import time
+import unittest
+from unittest.mock import patch
+
+from gs.cache import RedisCache, get_cache
+from gs.cache.redis_cache import (AutoPipeline, PipelineError,
+                                  close_connection_pools, get_connection_pool)
+
+from .mock_cache_redis import FakeRedis
+
+
+class TestRedisConnectionPool(unittest.TestCase):
+    """Test shared connection pools"""
+
+    def tearDown(self):
+        close_connection_pools()
+
+    @patch('redis.Redis', FakeRedis)
+    def test_shared_pool(self):
+        """Instances with the same URL share the pool"""
+        with patch.object(FakeRedis, '__init__', return_value=None) as init:
+            get_cache('redis://localhost:6379/0?max_connections=5',
+                      reuse=False)
+            get_cache('redis://localhost:6379/0?max_connections=5',
+                      reuse=False)
+            pools = [call.kwargs['connection_pool']
+                     for call in init.call_args_list]
+        self.assertIs(pools[0], pools[1])
+        self.assertEqual(5, pools[0].max_connections)
+
+    def test_pool_options(self):
+        """Pool options come from the URL"""
+        pool = get_connection_pool(
+            'redis://localhost:6379/1?socket_timeout=1.5&timeout=3')
+        self.assertEqual(1.5, pool.connection_kwargs['socket_timeout'])
+        self.assertEqual(1, pool.connection_kwargs['db'])
+        self.assertEqual(3, pool.timeout)
+        self.assertIsNot(pool, get_connection_pool('redis://localhost/1'))
+
+
+class TestRedisCacheTTL(unittest.TestCase):
+    """Test remaining time to live"""
+
+    def tearDown(self):
+        close_connection_pools()
+
+    @patch('redis.Redis', FakeRedis)
+    def test_expired_between_get_and_pttl(self):
+        """PTTL -2 (key gone after GET) is a miss, not a value without
+        expiration"""
+        cache = get_cache('redis://localhost:6379/0', reuse=False)
+        cache.set('key', 'value', datetime.timedelta(seconds=10))
+        cache.set('forever', 'value')
+        self.assertEqual(('value', datetime.timedelta(0)),
+                         cache.get_with_ttl('forever'))
+        with patch.object(FakeRedis, 'pttl', return_value=-2):
+            self.assertEqual((None, None), cache.get_with_ttl('key'))
+            self.assertEqual({'key': (None, None)},
+                             cache.get_many_with_ttl(['key']))
+
+
+class TestAutoPipeline(unittest.TestCase):
+    """Test auto pipelining"""
+
+    @patch('redis.Redis', FakeRedis)
+    def test_auto_pipeline(self):
+        """Writes are merged and flushed before reads"""
+        cache = get_cache('redis://localhost:6379/0?auto_pipeline=1'
+                          '&pipeline_size=3&pipeline_delay=10')
+        self.assertIsInstance(cache, RedisCache)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        self.assertEqual(2, len(cache.pipeline))
+        self.assertEqual({}, cache.redis.data)
+        cache.set('c', '3')
+        self.assertEqual(0, len(cache.pipeline))
+        self.assertEqual(1, cache.pipeline.flushes)
+
+        cache.set('d', '4')
+        self.assertEqual('4', cache.get('d'))
+        self.assertEqual(2, cache.pipeline.flushes)
+        close_connection_pools()
+
+    def test_timer_flush(self):
+        """Pending writes are flushed after the delay"""
+        client = FakeRedis()
+        pipeline = AutoPipeline(client, max_size=100, delay=0.01)
+        pipeline.add('set', 'a', '1')
+        deadline = time.monotonic() + 2
+        while len(pipeline) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(b'1', client.get('a'))
+        self.assertEqual(1, pipeline.flushes)
+
+    def _wait_flush(self, pipeline: AutoPipeline, flushes: int):
+        deadline = time.monotonic() + 2
+        while pipeline.flushes + pipeline.errors < flushes and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_single_flusher_thread(self):
+        """Delayed flushes reuse one flusher thread"""
+        client = FakeRedis()
+        pipeline = AutoPipeline(client, max_size=100, delay=0.01)
+        pipeline.add('set', 'a', '1')
+        flusher = pipeline._flusher
+        self._wait_flush(pipeline, 1)
+        pipeline.add('set', 'b', '2')
+        self._wait_flush(pipeline, 2)
+        self.assertIs(flusher, pipeline._flusher)
+        self.assertEqual(2, pipeline.flushes)
+        pipeline.close()
+        self.assertFalse(flusher.is_alive())
+        pipeline.add('set', 'c', '3')
+        self.assertEqual(b'3', client.get('c'))
+
+    def test_background_error(self):
+        """A failed delayed flush raises on the next call"""
+        client = FakeRedis()
+        pipeline = AutoPipeline(client, max_size=100, delay=0.01)
+        with patch.object(FakeRedis, 'pipeline',
+                          side_effect=ConnectionError('down')), \
+                self.assertLogs('AutoPipeline', 'ERROR'):
+            pipeline.add('set', 'a', '1')
+            self._wait_flush(pipeline, 1)
+        self.assertEqual(1, pipeline.errors)
+        with self.assertRaises(PipelineError):
+            pipeline.add('set', 'b', '2')
+        pipeline.add('set', 'b', '2')
+        pipeline.flush()
+        self.assertIsNone(client.get('a'))
+        self.assertEqual(b'2', client.get('b'))
+        pipeline.close()
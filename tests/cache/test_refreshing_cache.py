@@ -0,0 +1,153 @@
+"""Test refreshing cache"""
+import datetime
+import threading
+import unittest
+from unittest.mock import patch
+
+from gs.cache import MemoryCache, RefreshingCache, get_cache
+
+from .mock_cache_redis import FakeRedis
+
+
+class Loader:
+    """Counts loads, returns '<key>:<load number>'"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, key: str) -> str:
+        self.release.wait(5)
+        self.calls.append(key)
+        return f'{key}:{len(self.calls)}'
+
+
+class TestRefreshingCache(unittest.TestCase):
+    """Test refreshing cache"""
+
+    def setUp(self):
+        self.loader = Loader()
+        self.memory = MemoryCache()
+        self.cache = RefreshingCache(self.memory, self.loader, ttl=60,
+                                     stale_ttl=300)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_miss_loads(self):
+        """Missing keys are loaded once and stored with the hard TTL"""
+        self.assertEqual('a:1', self.cache.get('a'))
+        self.assertEqual('a:1', self.cache.get('a'))
+        self.assertEqual(['a'], self.loader.calls)
+        _, remaining = self.memory.get_with_ttl('a')
+        self.assertGreater(remaining, datetime.timedelta(seconds=359))
+        self.assertEqual(1, self.cache.stats()['misses'])
+        self.assertEqual(1, self.cache.stats()['hits'])
+
+    def test_stale_while_revalidate(self):
+        """Stale values are returned while the loader runs in background"""
+        # 10 seconds of hard TTL left: 290 seconds past the soft TTL
+        self.memory.set('a', 'old', datetime.timedelta(seconds=10))
+        self.loader.release.clear()
+        value, remaining = self.cache.get_with_ttl('a')
+        self.assertEqual('old', value)
+        self.assertLess(remaining, datetime.timedelta(0))
+        # Scheduled once while the refresh runs
+        self.assertEqual('old', self.cache.get('a'))
+        self.loader.release.set()
+        self.cache.close()
+        self.assertEqual(['a'], self.loader.calls)
+        self.assertEqual('a:1', self.cache.get('a'))
+        stats = self.cache.stats()
+        self.assertEqual(2, stats['stale_hits'])
+        self.assertEqual(1, stats['refreshes'])
+
+    def test_refresh_error_keeps_stale(self):
+        """Loader errors keep the stale value"""
+        def failing(key):
+            raise RuntimeError(key)
+
+        cache = RefreshingCache(self.memory, failing, ttl=60, stale_ttl=300)
+        self.memory.set('a', 'old', datetime.timedelta(seconds=10))
+        with self.assertLogs('RefreshingCache', 'ERROR'):
+            self.assertEqual('old', cache.get('a'))
+            cache.close()
+            self.assertEqual('old', cache.get('a'))
+            cache.close()
+        self.assertEqual(2, cache.stats()['refresh_errors'])
+
+    def test_refresh_ahead(self):
+        """Hot keys close to the soft TTL are refreshed early"""
+        cache = RefreshingCache(self.memory, self.loader, ttl=60,
+                                stale_ttl=300, refresh_ahead=0.2,
+                                refresh_hits=2)
+        # 5 seconds of soft TTL left
+        self.memory.set('a', 'old', datetime.timedelta(seconds=305))
+        self.memory.set('b', 'old', datetime.timedelta(seconds=350))
+        self.assertEqual('old', cache.get('a'))
+        self.assertEqual('old', cache.get('b'))
+        self.assertEqual('old', cache.get('b'))
+        cache.close()
+        self.assertEqual([], self.loader.calls)
+        self.assertEqual('old', cache.get('a'))
+        cache.close()
+        self.assertEqual(['a'], self.loader.calls)
+        self.assertEqual('a:1', cache.get('a'))
+        self.assertEqual(1, cache.stats()['early_refreshes'])
+
+    @patch('gs.cache.refreshing_cache.MAX_TRACKED_KEYS', 4)
+    def test_access_aging(self):
+        """Access counts are aged one key at a time, hot keys are kept"""
+        accesses = self.cache._accesses
+        for _ in range(8):
+            self.cache._hot('hot')
+        for key in 'abc':
+            self.cache._hot(key)
+        self.cache._hot('d')  # drops the oldest cold counter after halving
+        self.assertEqual(4, len(accesses))
+        self.assertEqual(4, accesses['hot'])
+        self.assertNotIn('a', accesses)
+        for key in 'efgh':
+            self.cache._hot(key)
+        self.assertEqual(4, len(accesses))
+        self.assertIn('hot', accesses)
+
+    def test_threaded_counters(self):
+        """Counters updated by many threads are not lost"""
+        self.cache.set('a', 'value')
+
+        def reader():
+            for _ in range(1000):
+                self.cache.get('a')
+
+        threads = [threading.Thread(target=reader) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8000, self.cache.stats()['hits'])
+
+    def test_no_expiration(self):
+        """ttl=0 entries are never stale"""
+        self.cache.set('a', 'value', datetime.timedelta(0))
+        self.assertEqual(('value', datetime.timedelta(0)),
+                         self.cache.get_with_ttl('a'))
+        self.assertEqual([], self.loader.calls)
+
+    def test_per_call_loader(self):
+        """get accepts a loader"""
+        cache = RefreshingCache(self.memory)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual('A', cache.get('a', loader=str.upper))
+
+    @patch('redis.Redis', FakeRedis)
+    def test_redis(self):
+        """Works on redis"""
+        cache = RefreshingCache(
+            get_cache('redis://localhost:6379/0', reuse=False),
+            self.loader, ttl=1, stale_ttl=60)
+        cache.set_many({'a': '1', 'b': '2'})
+        self.assertEqual({'a': '1', 'b': '2', 'c': 'c:1'},
+                         cache.get_many(['a', 'b', 'c']))
+        self.assertEqual(1, cache.delete_many(['a']))
@@ -0,0 +1,93 @@
+"""Test cache backend registry"""
+import subprocess
+import sys
+import unittest
+
+from gs.cache import (MemoryCache, clear_cache_instances, get_cache,
+                      register_backend)
+from gs.cache.registry import BackendRegistry, scheme_of
+
+
+class CustomCache(MemoryCache):
+    """Third-party backend"""
+
+    def parse(self, connection_string: str) -> 'CustomCache':
+        self.connection_string = connection_string
+        return self
+
+
+class RejectingCache(MemoryCache):
+    """Backend for other connection strings"""
+
+    def parse(self, connection_string: str) -> 'RejectingCache':
+        return None
+
+
+class TestRegistry(unittest.TestCase):
+    """Test cache backend registry"""
+
+    def tearDown(self):
+        clear_cache_instances()
+
+    def test_scheme_of(self):
+        """Scheme is the text before ':' or '?'"""
+        self.assertEqual('memory', scheme_of('memory'))
+        self.assertEqual('memory', scheme_of('memory?max_items=10'))
+        self.assertEqual('redis', scheme_of('redis://localhost:6379/0'))
+        self.assertEqual('path', scheme_of('path:/tmp/cache'))
+        self.assertIsNone(scheme_of('/tmp/cache'))
+
+    def test_reuse(self):
+        """Same connection string and reuse, same instance"""
+        cache = get_cache('memory?max_items=10', reuse=True)
+        self.assertIs(cache, get_cache('memory?max_items=10', reuse=True))
+        self.assertIsNot(cache, get_cache('memory?max_items=10'))
+        self.assertIsNot(cache, get_cache('memory?max_items=20', reuse=True))
+        clear_cache_instances()
+        self.assertIsNot(cache, get_cache('memory?max_items=10', reuse=True))
+
+    def test_register_backend(self):
+        """Third-party backends join get_cache"""
+        register_backend('custom', CustomCache)
+        cache = get_cache('custom:anything')
+        self.assertIsInstance(cache, CustomCache)
+        self.assertEqual('custom:anything', cache.connection_string)
+
+    def test_option_backend(self):
+        """Backends registered with an option need it"""
+        registry = BackendRegistry()
+        registry.register('memory', MemoryCache)
+        registry.register('memory', CustomCache, option='custom')
+        self.assertIs(MemoryCache,
+                      type(registry.create('memory?max_items=1')))
+        self.assertIs(CustomCache, type(registry.create('memory?custom=1')))
+        with self.assertRaises(Exception):
+            registry.create('unknown')
+        self.assertEqual(['memory'], registry.schemes)
+
+    def test_parse_fallthrough(self):
+        """Backends whose parse returns None pass to the next one"""
+        registry = BackendRegistry()
+        registry.register('memory', MemoryCache)
+        registry.register('memory', RejectingCache)
+        self.assertIsInstance(registry.create('memory'), MemoryCache)
+        registry = BackendRegistry()
+        registry.register('memory', RejectingCache)
+        with self.assertRaises(Exception):
+            registry.create('memory')
+
+    def test_lazy_import(self):
+        """redis is imported only for redis:// connection strings"""
+        result = subprocess.run(
+            [sys.executable, '-c',
+             'import sys; from gs.cache import get_cache; '
+             'get_cache("memory"); print("redis" in sys.modules); '
+             'from gs.cache import RedisCache; '
+             'print("redis" in sys.modules)'],
+            capture_output=True, text=True, check=True)
+        self.assertEqual(['False', 'True'], result.stdout.split())
+
+    def test_unknown(self):
+        """Unknown schemes raise"""
+        with self.assertRaises(Exception):
+            get_cache('unknown:thing')
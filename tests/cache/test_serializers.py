@@ -0,0 +1,111 @@
+"""Test serializers and compression"""
+import datetime
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from gs.cache import get_cache
+from gs.cache.redis_cache import close_connection_pools
+from gs.cache.serializers import MAGIC, Codec, codec_from_options
+
+from .mock_cache_redis import FakeRedis
+
+
+class TestCodec(unittest.TestCase):
+    """Test Codec"""
+
+    def test_raw(self):
+        """Strings are plain UTF-8, bytes are tagged"""
+        codec = Codec()
+        self.assertEqual('ação'.encode('utf-8'), codec.encode('ação'))
+        self.assertEqual('ação', codec.decode(codec.encode('ação')))
+        encoded = codec.encode(b'\xff\x00')
+        self.assertTrue(encoded.startswith(MAGIC))
+        self.assertEqual(b'\xff\x00', codec.decode(encoded))
+        text = MAGIC.decode('utf-8') + 'text'
+        self.assertEqual(text, codec.decode(codec.encode(text)))
+        with self.assertRaises(TypeError):
+            codec.encode(1)
+
+    def test_legacy_values(self):
+        """Values without header are read as strings"""
+        codec = Codec('json')
+        self.assertEqual('legacy', codec.decode(b'legacy'))
+        self.assertEqual('legacy', codec.decode('legacy'))
+        self.assertIsNone(codec.decode(None))
+        self.assertEqual(b'\xff', codec.decode(b'\xff'))
+
+    def test_serializers(self):
+        """json and pickle serializers"""
+        value = {'a': [1, 2, 3], 'b': None}
+        for name in ('json', 'pickle'):
+            codec = Codec(name)
+            self.assertEqual(value, codec.decode(codec.encode(value)))
+        pickled = Codec('pickle').encode(datetime.date(2022, 1, 1))
+        self.assertEqual(datetime.date(2022, 1, 1), Codec().decode(pickled))
+
+    def test_compression(self):
+        """zlib compression above the threshold"""
+        codec = Codec(compression='zlib', compress_min=100)
+        small = codec.encode('x' * 10)
+        self.assertEqual(b'x' * 10, small)
+        large = codec.encode('x' * 10000)
+        self.assertLess(len(large), 100)
+        self.assertEqual('x' * 10000, codec.decode(large))
+        self.assertEqual('x' * 10000, Codec().decode(large))
+
+    def test_invalid(self):
+        """Unknown serializers and compressions"""
+        with self.assertRaises(ValueError):
+            Codec('yaml')
+        with self.assertRaises(ValueError):
+            Codec(compression='brotli')
+
+    def test_options(self):
+        """Codec options are removed from connection options"""
+        options = {'serializer': 'json', 'compression': 'zlib',
+                   'compress_min': '1KB', 'max_items': '10'}
+        codec = codec_from_options(options)
+        self.assertEqual({'max_items': '10'}, options)
+        self.assertEqual('json', codec.serializer.name)
+        self.assertEqual(1024, codec.compress_min)
+
+
+class TestBackendSerializers(unittest.TestCase):
+    """Test serializer options on backends"""
+
+    def _test_values(self, cache):
+        value = {'text': 'abc' * 1000}
+        cache.set('key', value)
+        self.assertEqual(value, cache.get('key'))
+        cache.set_many({'a': [1], 'b': [2]})
+        self.assertEqual({'a': [1], 'b': [2]}, cache.get_many(['a', 'b']))
+
+    def test_memory(self):
+        """Memory cache stores encoded copies"""
+        cache = get_cache('memory?serializer=pickle&compression=zlib')
+        self._test_values(cache)
+        self.assertIsInstance(cache.cache['key'][0], bytes)
+
+    def test_file(self):
+        """File cache"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self._test_values(get_cache(
+                f'path:{tmpdir}?serializer=json&compression=zlib'
+                '&compress_min=10'))
+
+    def test_sqlite(self):
+        """SQLite cache"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = get_cache(f'sqlite:{tmpdir}/cache.db?serializer=pickle')
+            self._test_values(cache)
+            cache.close()
+
+    @patch('redis.Redis', FakeRedis)
+    def test_redis(self):
+        """Redis cache"""
+        cache = get_cache('redis://localhost:6379/0?serializer=json'
+                          '&compression=zlib&compress_min=100')
+        self._test_values(cache)
+        self.assertLess(len(cache.redis.data['key'][0]), 1000)
+        close_connection_pools()
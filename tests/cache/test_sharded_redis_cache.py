@@ -0,0 +1,196 @@
+"""Test sharded redis cache"""
+import datetime
+import time
+import unittest
+from unittest.mock import patch
+
+import redis
+
+from gs.cache import RedisCache, ShardedRedisCache, get_cache
+from gs.cache.redis_cache import close_connection_pools
+from gs.cache.sharded_redis_cache import HashRing
+
+from .mock_cache_redis import FakeRedis
+
+NODES = 'redis://a:6379/0,redis://b:6379/0,redis://c:6379/0'
+
+
+class DownRedis():
+    """Redis client of an unreachable server"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.calls += 1
+            raise redis.ConnectionError('Connection refused')
+        return command
+
+
+class TestHashRing(unittest.TestCase):
+    """Test consistent hash ring"""
+
+    def test_balance(self):
+        """Virtual nodes spread keys evenly"""
+        ring = HashRing(['a', 'b', 'c', 'd'])
+        counts = {}
+        for index in range(10000):
+            node = ring.node_of(f'key{index}')
+            counts[node] = counts.get(node, 0) + 1
+        self.assertEqual(['a', 'b', 'c', 'd'], sorted(counts))
+        for count in counts.values():
+            self.assertGreater(count, 1500)
+            self.assertLess(count, 3500)
+
+    def test_minimal_remapping(self):
+        """Adding a node only moves keys to the new node"""
+        before = HashRing(['a', 'b', 'c', 'd'])
+        after = HashRing(['a', 'b', 'c', 'd', 'e'])
+        keys = [f'key{index}' for index in range(10000)]
+        moved = [key for key in keys
+                 if before.node_of(key) != after.node_of(key)]
+        self.assertTrue(all(after.node_of(key) == 'e' for key in moved))
+        self.assertLess(len(moved), 3000)
+
+    def test_stable(self):
+        """Rings with the same nodes agree"""
+        self.assertEqual(HashRing(['b', 'a']).node_of('key'),
+                         HashRing(['a', 'b']).node_of('key'))
+
+
+@patch('redis.Redis', FakeRedis)
+class TestShardedRedisCache(unittest.TestCase):
+    """Test sharded redis cache"""
+
+    def tearDown(self):
+        close_connection_pools()
+
+    def _cache(self, options: str = '') -> ShardedRedisCache:
+        return get_cache(f'{NODES}{options}', reuse=False)
+
+    def test_parse(self):
+        """Comma separated nodes select the sharded cache"""
+        cache = self._cache('?vnodes=10&retry_interval=5&serializer=pickle')
+        self.assertIsInstance(cache, ShardedRedisCache)
+        self.assertEqual(3, len(cache.nodes))
+        self.assertEqual(10, cache.vnodes)
+        self.assertEqual(5, cache.retry_interval)
+        for node in cache.nodes.values():
+            self.assertIsInstance(node, RedisCache)
+            self.assertEqual('pickle', node.codec.serializer.name)
+        self.assertIsInstance(
+            get_cache('redis://a:6379/0', reuse=False), RedisCache)
+
+    def test_operations(self):
+        """Keys are spread over the nodes"""
+        cache = self._cache()
+        items = {f'key{index}': str(index) for index in range(100)}
+        cache.set_many(items, datetime.timedelta(seconds=60))
+        cache.set('single', 'value')
+        self.assertEqual(items, cache.get_many(items))
+        self.assertEqual('value', cache.get('single'))
+        value, ttl = cache.get_with_ttl('key1')
+        self.assertEqual('1', value)
+        self.assertGreater(ttl, datetime.timedelta(seconds=50))
+        sizes = [len(node.redis.data) for node in cache.nodes.values()]
+        self.assertEqual(101, sum(sizes))
+        self.assertTrue(all(sizes))
+        for key in items:
+            node = cache.nodes[cache.ring.node_of(key)]
+            self.assertIn(key, node.redis.data)
+        self.assertEqual(100, cache.delete_many(list(items) + ['missing']))
+        self.assertEqual({'key1': None}, cache.get_many(['key1']))
+
+    def test_atomic(self):
+        """Atomic operations run on the node of the key"""
+        cache = self._cache()
+        for index in range(10):
+            key = f'counter{index}'
+            self.assertEqual(3, cache.incr(key, 3))
+            self.assertIn(key, cache.nodes[cache.ring.node_of(key)].redis.data)
+        self.assertTrue(cache.add('lock', 'owner'))
+        self.assertFalse(cache.add('lock', 'other'))
+        self.assertTrue(cache.cas('lock', 'owner', 'other'))
+        self.assertTrue(cache.delete('lock'))
+
+    def test_batches_per_node(self):
+        """Batch reads send one MGET per node"""
+        cache = self._cache()
+        items = {f'key{index}': 'value' for index in range(30)}
+        cache.set_many(items)
+        with patch.object(FakeRedis, 'mget', autospec=True,
+                          side_effect=FakeRedis.mget) as mget:
+            cache.get_many(items)
+        self.assertEqual(3, mget.call_count)
+
+    def test_unhealthy_node(self):
+        """Failing nodes leave the ring until retry_interval elapses"""
+        cache = self._cache('?retry_interval=0.1')
+        keys = [f'key{index}' for index in range(30)]
+        name = cache.ring.node_of('key0')
+        client = cache.nodes[name].redis
+        down = DownRedis()
+        cache.nodes[name].redis = down
+        with self.assertLogs('ShardedRedisCache', 'WARNING'):
+            cache.set_many({key: 'value' for key in keys})
+        self.assertEqual(1, cache.errors)
+        self.assertNotIn(name, cache.healthy_nodes)
+        self.assertEqual({key: 'value' for key in keys},
+                         cache.get_many(keys))
+        self.assertEqual(1, down.calls)
+
+        cache.nodes[name].redis = client
+        time.sleep(0.15)
+        self.assertIn(name, cache.healthy_nodes)
+        self.assertIsNone(cache.get('key0'))
+
+    def test_no_stale_values_after_outage(self):
+        """Keys written or deleted during an outage are deleted on the node
+        when it comes back"""
+        cache = self._cache('?retry_interval=0.1')
+        name = cache.ring.node_of('key0')
+        cache.set_many({'key0': 'old', 'gone': 'old', 'kept': 'old'})
+        client = cache.nodes[name].redis
+        cache.nodes[name].redis = DownRedis()
+        with self.assertLogs('ShardedRedisCache', 'WARNING'):
+            cache.set('key0', 'new')
+        cache.delete('gone')
+        self.assertEqual('new', cache.get('key0'))
+
+        cache.nodes[name].redis = client
+        time.sleep(0.15)
+        self.assertIn(name, cache.healthy_nodes)
+        self.assertIsNone(cache.get('key0'))
+        self.assertIsNone(cache.get('gone'))
+        self.assertEqual('old', cache.get('kept'))
+        self.assertEqual({}, cache._moved)
+
+    def test_atomic_without_failover(self):
+        """Atomic operations fail while the node of the key is down"""
+        cache = self._cache('?retry_interval=60')
+        name = cache.ring.node_of('counter')
+        self.assertEqual(1, cache.incr('counter'))
+        cache.nodes[name].redis = DownRedis()
+        with self.assertLogs('ShardedRedisCache', 'WARNING'):
+            with self.assertRaises(redis.ConnectionError):
+                cache.incr('counter')
+        self.assertNotIn(name, cache.healthy_nodes)
+        with self.assertRaises(redis.ConnectionError):
+            cache.incr('counter')
+        with self.assertRaises(redis.ConnectionError):
+            cache.add('counter', '1')
+        with self.assertRaises(redis.ConnectionError):
+            cache.cas('counter', '1', '2')
+        for other in cache.healthy_nodes:
+            self.assertNotIn('counter', cache.nodes[other].redis.data)
+
+    def test_all_nodes_down(self):
+        """Without healthy nodes operations fail"""
+        cache = self._cache()
+        for node in cache.nodes.values():
+            node.redis = DownRedis()
+        with self.assertLogs('ShardedRedisCache', 'WARNING'):
+            with self.assertRaises(redis.ConnectionError):
+                cache.get('key')
+        self.assertEqual([], cache.healthy_nodes)
@@ -0,0 +1,121 @@
+"""Test shared memory cache"""
+import datetime
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+from gs.cache import SharedMemoryCache, get_cache
+from gs.cache.shared_memory_cache import HEADER_SIZE, SLOT_HEADER, WAYS
+
+
+def write_entries(connection_string: str, count: int) -> None:
+    """Write count entries from another process"""
+    cache = get_cache(connection_string)
+    for index in range(count):
+        cache.set(f'key{index}', f'value{index}')
+    cache.close()
+
+
+class TestSharedMemoryCache(unittest.TestCase):
+    """Test shared memory cache"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.connection_string = \
+            f'shm:test?size=256KB&slot_size=256&dir={self.directory.name}'
+        self.cache = get_cache(self.connection_string)
+
+    def tearDown(self):
+        self.cache.unlink()
+        self.directory.cleanup()
+
+    def test_layout(self):
+        """size and slot_size define the slot table"""
+        self.assertIsInstance(self.cache, SharedMemoryCache)
+        self.assertEqual(256, self.cache.slot_size)
+        self.assertEqual(0, self.cache.slot_count % WAYS)
+        self.assertEqual(HEADER_SIZE + self.cache.slot_count * 256,
+                         os.path.getsize(self.cache.filename))
+        self.assertTrue(self.cache.filename.endswith('gs-cache-test'))
+
+    def test_invalid(self):
+        """Invalid names and sizes are rejected"""
+        with self.assertRaises(ValueError):
+            get_cache('shm:../escape')
+        with self.assertRaises(ValueError):
+            get_cache(f'shm:small?size=4KB&dir={self.directory.name}')
+
+    def test_shared_between_instances(self):
+        """Another instance sees the same entries and keeps the geometry"""
+        self.cache.set('key', 'value', datetime.timedelta(seconds=60))
+        other = get_cache(
+            f'shm:test?size=1MB&slot_size=1KB&dir={self.directory.name}')
+        self.assertEqual(256, other.slot_size)
+        self.assertEqual('value', other.get('key'))
+        other.delete_many(['key'])
+        self.assertIsNone(self.cache.get('key'))
+        other.close()
+
+    def test_instances_exclude_each_other(self):
+        """Instances of a process share the file locks; closing one keeps
+        the others' locks"""
+        other = get_cache(self.connection_string)
+        self.assertIs(self.cache._file, other._file)
+        acquired = threading.Event()
+
+        def lock_other():
+            with other._locked(0):
+                acquired.set()
+
+        with self.cache._locked(0):
+            thread = threading.Thread(target=lock_other)
+            thread.start()
+            self.assertFalse(acquired.wait(0.2))
+        thread.join(5)
+        self.assertTrue(acquired.is_set())
+        other.close()
+        os.fstat(self.cache._file.fd)
+        self.cache.set('key', 'value')
+        self.assertEqual('value', self.cache.get('key'))
+
+    def test_shared_between_processes(self):
+        """Entries written by another process are read"""
+        process = multiprocessing.Process(
+            target=write_entries, args=(self.connection_string, 20))
+        process.start()
+        process.join(30)
+        self.assertEqual(0, process.exitcode)
+        self.assertEqual('value7', self.cache.get('key7'))
+        self.assertEqual(20, sum(
+            value is not None
+            for value in self.cache.get_many(
+                [f'key{index}' for index in range(20)]).values()))
+
+    def test_expiration(self):
+        """Expired entries are not returned and free their slot"""
+        self.cache.set('key', 'value', datetime.timedelta(seconds=-1))
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(1, self.cache.expirations)
+        self.assertEqual(0, self.cache.delete_many(['key']))
+
+    def test_too_large(self):
+        """Values larger than a slot are not stored"""
+        self.cache.set('key', 'small')
+        self.cache.set('key', 'x' * 256)
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 'x' * (256 - SLOT_HEADER.size - 3))
+        self.assertIsNotNone(self.cache.get('key'))
+
+    def test_eviction(self):
+        """Full buckets replace the entry closest to expiration"""
+        items = {f'key{index}': 'value'
+                 for index in range(self.cache.slot_count * 2)}
+        self.cache.set_many(items, datetime.timedelta(seconds=60))
+        values = self.cache.get_many(items)
+        live = sum(value is not None for value in values.values())
+        self.assertLessEqual(live, self.cache.slot_count)
+        self.assertEqual(len(items), live + self.cache.evictions)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('key0'))
@@ -0,0 +1,106 @@
+"""Test sqlite cache"""
+import datetime
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from gs.cache import SQLiteCache, get_cache
+
+
+def _write_entries(filename: str, worker: int):
+    cache = get_cache(f'sqlite:{filename}')
+    cache.set_many({f'w{worker}_{i}': str(i) for i in range(100)})
+    cache.close()
+
+
+class TestSQLiteCache(unittest.TestCase):
+    """Test sqlite cache"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'sub', 'cache.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_purge(self):
+        """Expired entries are purged using the expiration index"""
+        cache = get_cache(f'sqlite:{self.filename}?purge_interval=3600')
+        self.assertIsInstance(cache, SQLiteCache)
+        cache.set('alive', 'value')
+        cache.set_many({f'key{i}': 'value' for i in range(10)},
+                       datetime.timedelta(seconds=-1))
+        self.assertIsNone(cache.get('key0'))
+        self.assertEqual(10, cache.purge())
+        self.assertEqual(0, cache.purge())
+        self.assertEqual('value', cache.get('alive'))
+        plan = cache.connection.execute(
+            'EXPLAIN QUERY PLAN DELETE FROM cache WHERE valid_until <= 0'
+        ).fetchall()
+        self.assertIn('cache_valid_until', str(plan))
+        cache.close()
+
+    def test_bytes_and_large_batches(self):
+        """Values may be bytes and batches larger than the variable limit"""
+        cache = get_cache(f'sqlite:{self.filename}')
+        items = {f'key{i}': f'{i}'.encode() for i in range(1200)}
+        cache.set_many(items)
+        values = cache.get_many(list(items) + ['missing'])
+        self.assertEqual(b'1199', values['key1199'])
+        self.assertIsNone(values['missing'])
+        self.assertEqual(1200, cache.delete_many(items))
+        cache.close()
+
+    def test_threads(self):
+        """Each thread has its own connection"""
+        cache = get_cache(f'sqlite:{self.filename}')
+        errors = []
+
+        def worker(number):
+            try:
+                cache.set(f'thread{number}', str(number))
+                self.assertEqual(str(number), cache.get(f'thread{number}'))
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+            finally:
+                if number % 2:
+                    cache.close_thread()
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual('7', cache.get('thread7'))
+        # Odd workers closed theirs; finished threads are pruned on connect
+        self.assertIn(threading.current_thread(), cache._connections)
+        self.assertFalse(set(cache._connections) & set(threads[1::2]))
+        connections = list(cache._connections.values())
+        cache.close()
+        self.assertEqual({}, cache._connections)
+        for connection in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                connection.execute('SELECT 1')
+        self.assertEqual('0', cache.get('thread0'))  # reconnects
+        cache.close()
+
+    def test_processes(self):
+        """Many processes share the database"""
+        get_cache(f'sqlite:{self.filename}').close()
+        processes = [multiprocessing.Process(target=_write_entries,
+                                             args=(self.filename, i))
+                     for i in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        cache = get_cache(f'sqlite:{self.filename}')
+        self.assertEqual('99', cache.get('w2_99'))
+        self.assertEqual(300, cache.connection.execute(
+            'SELECT COUNT(*) FROM cache').fetchone()[0])
+        cache.close()
@@ -0,0 +1,161 @@
+"""Test cache metrics"""
+import datetime
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from gs.cache import FileCache, MemoryCache, get_cache
+from gs.cache.stats import LatencyHistogram, StatsDSink
+
+from .mock_cache_redis import FakeRedis
+
+
+class RecordingSink:
+    """Sink keeping every metric"""
+
+    def __init__(self):
+        self.counters = {}
+        self.timings = []
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Increment counter"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def timing(self, name: str, seconds: float) -> None:
+        """Record timing"""
+        self.timings.append((name, seconds))
+
+
+class TestStats(unittest.TestCase):
+    """Test cache metrics"""
+
+    def test_disabled(self):
+        """Without metrics, methods are not wrapped and only backend
+        counters are reported"""
+        cache = MemoryCache(max_items=1)
+        self.assertNotIn('get', cache.__dict__)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertFalse(stats['metrics_enabled'])
+        self.assertEqual(0, stats['hits'])
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual({}, stats['latency'])
+
+    def test_memory_metrics(self):
+        """Hits, misses, bytes and latency are collected"""
+        cache = get_cache('memory?metrics=1')
+        cache.set('a', 'value')
+        cache.set_many({'b': 'xy', 'c': 'z'})
+        self.assertEqual('value', cache.get('a'))
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual({'b': 'xy', 'x': None}, cache.get_many(['b', 'x']))
+        self.assertEqual('z', cache.get_with_ttl('c')[0])
+        stats = cache.stats()
+        self.assertTrue(stats['metrics_enabled'])
+        self.assertEqual(3, stats['hits'])
+        self.assertEqual(2, stats['misses'])
+        self.assertEqual(8, stats['bytes_written'])
+        self.assertEqual(8, stats['bytes_read'])
+        self.assertEqual(2, stats['latency']['get']['count'])
+        self.assertEqual(1, stats['latency']['set_many']['count'])
+        self.assertGreater(stats['latency']['get']['p99'], 0)
+
+    def test_expirations(self):
+        """Expired entries are counted"""
+        cache = MemoryCache()
+        cache.set('a', '1', datetime.timedelta(seconds=-1))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.stats()['expirations'])
+
+    def test_errors(self):
+        """Exceptions are counted as errors and re-raised"""
+        cache = MemoryCache()
+        cache.enable_metrics()
+        with self.assertRaises(AttributeError):
+            cache.set('a', 'value', ttl=None)
+        self.assertEqual(1, cache.stats()['errors'])
+        self.assertEqual(1, cache.stats()['latency']['set']['count'])
+
+    def test_sink(self):
+        """Sink receives counters and timings"""
+        sink = RecordingSink()
+        cache = MemoryCache()
+        cache.enable_metrics(sink)
+        cache.set('a', '1')
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual({'hits': 1, 'misses': 1, 'bytes_read': 1,
+                          'bytes_written': 1}, sink.counters)
+        self.assertEqual(['set', 'get', 'get'],
+                         [name for name, _ in sink.timings])
+
+    def test_disable(self):
+        """Disabling restores class methods"""
+        cache = MemoryCache()
+        cache.enable_metrics()
+        self.assertIn('get', cache.__dict__)
+        cache.disable_metrics()
+        self.assertNotIn('get', cache.__dict__)
+        cache.get('a')
+        self.assertEqual(0, cache.stats()['misses'])
+
+    def test_file_cache(self):
+        """File cache counts expirations and errors"""
+        with tempfile.TemporaryDirectory() as path:
+            cache = get_cache(f'path:{path}?metrics=1')
+            self.assertIsInstance(cache, FileCache)
+            cache.set('a', '1', datetime.timedelta(seconds=-1))
+            cache.set('b', '2')
+            self.assertIsNone(cache.get('a'))
+            with open(cache._filename('b'), 'wb') as file:
+                file.write(b'garbage')
+            self.assertIsNone(cache.get('b'))
+            stats = cache.stats()
+            self.assertEqual(1, stats['expirations'])
+            self.assertEqual(1, stats['errors'])
+            self.assertEqual(2, stats['misses'])
+            self.assertFalse(any(files for _, _, files in os.walk(path)))
+
+    def test_sqlite_cache(self):
+        """SQLite set is measured once"""
+        with tempfile.TemporaryDirectory() as path:
+            cache = get_cache(f'sqlite:{path}/cache.db?metrics=1')
+            cache.set('a', 'value')
+            stats = cache.stats()
+            self.assertEqual(5, stats['bytes_written'])
+            self.assertEqual(['set'], list(stats['latency']))
+            cache.close()
+
+    @patch('redis.Redis', FakeRedis)
+    def test_redis_cache(self):
+        """metrics option is not passed to redis"""
+        cache = get_cache('redis://localhost:6379/0?metrics=1')
+        cache.set('a', 'value')
+        self.assertEqual('value', cache.get('a'))
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(0, stats['errors'])
+
+    def test_histogram(self):
+        """Latencies go to log2 microsecond buckets"""
+        histogram = LatencyHistogram()
+        histogram.record(0.0000005)
+        histogram.record(0.000003)
+        histogram.record(0.001)
+        snapshot = histogram.snapshot()
+        self.assertEqual(3, snapshot['count'])
+        self.assertEqual({1: 1, 4: 1, 1024: 1}, snapshot['buckets'])
+        self.assertEqual(4 / 1_000_000, snapshot['p50'])
+        self.assertEqual(1024 / 1_000_000, snapshot['p99'])
+
+    def test_statsd_sink(self):
+        """StatsD sink formats counters and timings"""
+        sink = StatsDSink(prefix='app')
+        with patch.object(sink, '_send') as send:
+            sink.increment('hits', 2)
+            sink.timing('get', 0.0015)
+        send.assert_any_call('app.hits:2|c')
+        send.assert_any_call('app.get:1.500|ms')
@@ -0,0 +1,123 @@
+"""Test tiered cache"""
+import datetime
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from gs.cache import (FileCache, MemoryCache, RedisCache, TieredCache,
+                      get_cache)
+from gs.cache.redis_cache import close_connection_pools
+
+from .mock_cache_redis import FakeRedis
+
+
+class TestTieredCache(unittest.TestCase):
+    """Test tiered cache"""
+
+    def test_parse(self):
+        """Tiers are built from the connection string"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = get_cache(f'tiered:memory?max_items=10|path:{tmpdir}'
+                              '|l1_ttl=5')
+            self.assertIsInstance(cache, TieredCache)
+            self.assertIsInstance(cache.l1, MemoryCache)
+            self.assertEqual(10, cache.l1.max_items)
+            self.assertIsInstance(cache.l2, FileCache)
+            self.assertEqual(datetime.timedelta(seconds=5), cache.l1_ttl)
+        with self.assertRaises(ValueError):
+            get_cache('tiered:memory')
+
+    @patch('redis.Redis', FakeRedis)
+    def test_redis_l2(self):
+        """L2 hits fill L1 with the remaining TTL"""
+        cache = get_cache('tiered:memory|redis://localhost:6379/0')
+        self.assertIsInstance(cache.l2, RedisCache)
+        cache.l2.set('key', 'value', datetime.timedelta(seconds=30))
+
+        self.assertEqual('value', cache.get('key'))
+        _, ttl = cache.l1.get_with_ttl('key')
+        self.assertLessEqual(ttl, datetime.timedelta(seconds=30))
+        self.assertGreater(ttl, datetime.timedelta(seconds=25))
+
+        self.assertEqual('value', cache.get('key'))
+        self.assertIsNone(cache.get('missing'))
+        stats = cache.stats()
+        self.assertEqual(1, stats['l1_hits'])
+        self.assertEqual(1, stats['l2_hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertAlmostEqual(1 / 3, stats['l1_hit_ratio'])
+        self.assertAlmostEqual(0.5, stats['l2_hit_ratio'])
+        close_connection_pools()
+
+    def test_l1_ttl_cap(self):
+        """L1 entries never live longer than l1_ttl"""
+        cache = TieredCache(MemoryCache(), MemoryCache(),
+                            datetime.timedelta(seconds=10))
+        cache.set('forever', 'value')
+        cache.set('long', 'value', datetime.timedelta(hours=1))
+        cache.set('short', 'value', datetime.timedelta(seconds=5))
+        self.assertEqual(datetime.timedelta(0),
+                         cache.l2.get_with_ttl('forever')[1])
+        for key, maximum in (('forever', 10), ('long', 10), ('short', 5)):
+            _, ttl = cache.l1.get_with_ttl(key)
+            self.assertLessEqual(ttl, datetime.timedelta(seconds=maximum))
+            self.assertGreater(ttl, datetime.timedelta(0))
+
+    def test_batch(self):
+        """Batch operations go through both tiers"""
+        cache = TieredCache(MemoryCache(), MemoryCache())
+        cache.l2.set_many({'a': '1', 'b': '2'})
+        cache.set('c', '3')
+        self.assertEqual({'a': '1', 'b': '2', 'c': '3', 'd': None},
+                         cache.get_many(['a', 'b', 'c', 'd']))
+        self.assertEqual('1', cache.l1.get('a'))
+        self.assertEqual(1, cache.l1_hits)
+        self.assertEqual(2, cache.l2_hits)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(2, cache.delete_many(['a', 'c']))
+        self.assertEqual({'a': None, 'c': None},
+                         cache.get_many(['a', 'c']))
+
+    def _check_batch_ttls(self, cache: TieredCache):
+        cache.l2.set('short', '1', datetime.timedelta(seconds=5))
+        cache.l2.set('long', '2', datetime.timedelta(hours=1))
+        cache.l2.set('forever', '3')
+        self.assertEqual({'short': '1', 'long': '2', 'forever': '3'},
+                         cache.get_many(['short', 'long', 'forever']))
+        _, ttl = cache.l1.get_with_ttl('short')
+        self.assertLessEqual(ttl, datetime.timedelta(seconds=5))
+        self.assertGreater(ttl, datetime.timedelta(seconds=3))
+        _, ttl = cache.l1.get_with_ttl('long')
+        self.assertGreater(ttl, datetime.timedelta(minutes=59))
+        self.assertEqual(datetime.timedelta(0),
+                         cache.l1.get_with_ttl('forever')[1])
+
+    @patch('redis.Redis', FakeRedis)
+    def test_batch_l2_ttl_redis(self):
+        """Batch reads fill L1 with the remaining TTL of each key"""
+        cache = get_cache('tiered:memory|redis://localhost:6379/0|l1_ttl=0',
+                          reuse=False)
+        self._check_batch_ttls(cache)
+        close_connection_pools()
+
+    def test_batch_l2_ttl_sqlite(self):
+        """SQLite L2 returns TTLs in batch"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = get_cache(f'tiered:memory|sqlite:{tmpdir}/cache.db'
+                              '|l1_ttl=0', reuse=False)
+            self._check_batch_ttls(cache)
+            cache.l2.close()
+
+    def test_atomic(self):
+        """Atomic operations run on L2 and invalidate L1"""
+        cache = TieredCache(MemoryCache(), MemoryCache())
+        self.assertEqual(1, cache.incr('counter'))
+        self.assertEqual('1', cache.get('counter'))
+        self.assertEqual(2, cache.incr('counter'))
+        self.assertEqual('2', cache.get('counter'))
+        self.assertTrue(cache.cas('counter', '2', '10'))
+        self.assertEqual('10', cache.get('counter'))
+        self.assertFalse(cache.add('counter', '0'))
+        self.assertTrue(cache.delete('counter'))
+        self.assertIsNone(cache.l1.get('counter'))
+        self.assertTrue(cache.add('counter', '0'))
@@ -5,8 +5,14 @@ import tempfile
 import unittest
 from datetime import date, datetime, timedelta
 from typing import List
+from unittest.mock import patch
 
-from gs.config import BaseConfig
+from gs.config import BaseConfig, Env, config_lazy, config_slots
+
+try:
+    from typing import Annotated
+except ImportError:  # Python 3.8
+    from typing_extensions import Annotated
 
 
 class SubConfig(BaseConfig):
@@ -34,6 +40,14 @@ class EnvConfig(BaseConfig):
     TESTING_GAMMA: bool = False     # ENV:TEST_GAMMA
 
 
+class AnnotatedEnvConfig(BaseConfig):
+    """Environment names in annotations"""
+
+    TESTING_ALPHA: Annotated[str, Env('TEST_ALPHA')] = 'alpha'
+    TESTING_BETA: str = 'beta'
+    TESTING_GAMMA: Annotated[bool, Env('TEST_GAMMA')] = False
+
+
 class ConfigTypes(BaseConfig):
     """Types config"""
     INT_ARG: int = 1
@@ -98,6 +112,16 @@ class TestBaseConfig(unittest.TestCase):
         self.assertEqual('BETA', cfg.TESTING_BETA)
         self.assertTrue(cfg.TESTING_GAMMA)
 
+    def test_load_from_env_annotated(self):
+        """Env annotations map fields to environment variables"""
+        with patch.dict(os.environ, {'TEST_ALPHA': 'ALPHA',
+                                     'TEST_GAMMA': '1'}):
+            cfg = AnnotatedEnvConfig.load_from_env()
+        self.assertEqual('ALPHA', cfg.TESTING_ALPHA)
+        self.assertTrue(cfg.TESTING_GAMMA)
+        self.assertEqual({'TEST_ALPHA': 'alpha', 'TESTING_BETA': 'beta',
+                          'TEST_GAMMA': False}, cfg.sample_dict())
+
     def test_load_from_file(self):
         """Testing loading from file"""
         with tempfile.NamedTemporaryFile('w', delete=True) as tmp:
@@ -109,3 +133,189 @@ class TestBaseConfig(unittest.TestCase):
         self.assertEqual('ALPHA', cfg.TESTING_ALPHA)
         self.assertEqual('BETA', cfg.TESTING_BETA)
         self.assertTrue(cfg.TESTING_GAMMA)
+
+    def test_schema_cache(self):
+        """Fields are read once per class"""
+        class CachedConfig(BaseConfig):
+            """Config built many times"""
+            ITEMS: List[SubConfig]
+            NAME: str = 'name'  # ENV:CACHED_NAME
+
+        with patch('gs.config.base_config.get_envs',
+                   return_value={'NAME': 'CACHED_NAME'}) as get_envs:
+            for _ in range(3):
+                cfg = CachedConfig(CACHED_NAME='other',
+                                   ITEMS=[{'ARG_1': 1}, {'ARG_1': 2}])
+        self.assertEqual(1, get_envs.call_count)
+        self.assertEqual('other', cfg.NAME)
+        self.assertEqual([1, 2], [item.ARG_1 for item in cfg.ITEMS])
+        self.assertIs(CachedConfig.config_schema(),
+                      CachedConfig.config_schema())
+
+    def test_init_fields(self):
+        """Fields assigned in __init__ join the schema of the class"""
+        class WithInit(BaseConfig):
+            """Config with fields assigned in __init__"""
+            NAME: str = 'name'
+
+            def __init__(self, source=None, **dict_source):
+                self.FOO = 'a'  # ENV:MY_FOO
+                super().__init__(source, **dict_source)
+
+        WithInit.config_schema()  # built before any instance
+        self.assertEqual('b', WithInit(MY_FOO='b').FOO)
+        self.assertEqual({'MY_FOO': 'a', 'NAME': 'name'},
+                         WithInit().to_dict())
+        schema = WithInit.config_schema()
+        WithInit(NAME='other')
+        self.assertIs(schema, WithInit.config_schema())
+
+        @config_lazy
+        class LazyWithInit(BaseConfig):
+            """Lazy config with a field assigned in __init__"""
+            NAME: str = 'name'
+
+            def __init__(self, source=None, **dict_source):
+                self.FOO = 'a'
+                super().__init__(source, **dict_source)
+
+        with self.assertRaises(TypeError):
+            LazyWithInit()
+
+    def test_subclass_schema(self):
+        """Subclasses have their own schema, with the parent fields"""
+        class Parent(BaseConfig):
+            """Parent config"""
+            ARG_1: int = 1
+
+        class Child(Parent):
+            """Child config"""
+            ARG_2: str = 'abc'
+            ARG_3: int
+
+        self.assertEqual({'ARG_1'}, set(Parent.config_schema()))
+        self.assertEqual({'ARG_1', 'ARG_2', 'ARG_3'},
+                         set(Child.config_schema()))
+        self.assertEqual({'ARG_1': 1, 'ARG_2': 'abc', 'ARG_3': 0},
+                         Child().to_dict())
+
+        Parent.ARG_1 = 5
+        self.assertEqual(1, Child().ARG_1)
+        Parent.reset_schema()
+        self.assertEqual(5, Child().ARG_1)
+        self.assertEqual(5, Parent().ARG_1)
+
+    def test_from_dict(self):
+        """from_dict loads dicts with the generated loader"""
+        cfg = Config.from_dict({'INT_ARG': '5', 'SUB_CONFIG': {'ARG_1': 2},
+                                'SUB_CONFIGS': [{'ARG_2': 'x'}]})
+        self.assertEqual(5, cfg.INT_ARG)
+        self.assertEqual(0, cfg.INT_ARG_2)
+        self.assertEqual(['a', 'b', 'c', 'd'], cfg.LIST_ARG)
+        self.assertEqual(2, cfg.SUB_CONFIG.ARG_1)
+        self.assertEqual(['x'], [sub.ARG_2 for sub in cfg.SUB_CONFIGS])
+        self.assertEqual(cfg.to_dict(), Config(cfg.to_dict()).to_dict())
+
+    def test_default_instances(self):
+        """Fields without default get a new value for each instance"""
+        first, second = Config(), Config()
+        self.assertIsNot(first.SUB_CONFIG, second.SUB_CONFIG)
+        first.SUB_CONFIG.ARG_1 = 99
+        self.assertEqual(10, second.SUB_CONFIG.ARG_1)
+
+    def test_unknown_type(self):
+        """Fields of unsupported types fail on load"""
+        class BadConfig(BaseConfig):
+            """Config with a set field"""
+            ARG: set = set()
+
+        self.assertEqual(set(), BadConfig().ARG)
+        with self.assertRaises(TypeError):
+            BadConfig(ARG=[1])
+
+    def test_config_slots(self):
+        """config_slots stores fields in __slots__"""
+        @config_slots
+        class SlotConfig(BaseConfig):
+            """Slotted config"""
+            ARG_1: int = 10
+            ARG_2: Annotated[str, Env('SLOT_ARG_2')] = 'abc'
+
+            def after_load(self):
+                self.ARG_1 *= 2
+
+        cfg = SlotConfig(SLOT_ARG_2='other')
+        self.assertFalse(hasattr(cfg, '__dict__'))
+        self.assertEqual(('ARG_1', 'ARG_2'), SlotConfig.__slots__)
+        self.assertEqual(20, cfg.ARG_1)
+        self.assertEqual('other', cfg.ARG_2)
+        self.assertEqual('abc', SlotConfig.from_dict({}).ARG_2)
+        self.assertTrue(SlotConfig.__qualname__.endswith('.SlotConfig'))
+        with self.assertRaises(AttributeError):
+            cfg.OTHER = 1
+
+        @config_slots
+        class ChildSlotConfig(SlotConfig):
+            """Slotted child config"""
+            ARG_3: float = 1.5
+
+        child = ChildSlotConfig()
+        self.assertEqual(('ARG_3',), ChildSlotConfig.__slots__)
+        self.assertEqual({'ARG_1': 20, 'SLOT_ARG_2': 'abc', 'ARG_3': 1.5},
+                         child.to_dict())
+
+    def test_config_lazy(self):
+        """config_lazy converts fields on first access"""
+        @config_lazy
+        class LazyConfig(BaseConfig):
+            """Lazy config"""
+            WHEN: datetime
+            COUNT: Annotated[int, Env('LAZY_COUNT')] = 1
+            SUBS: List[SubConfig]
+
+        # Invalid values do not fail before access
+        cfg = LazyConfig(WHEN='bad', LAZY_COUNT='5',
+                         SUBS=[{'ARG_1': 2}, {'ARG_1': 'x'}],
+                         OTHER='unused')
+        self.assertEqual({'WHEN', 'LAZY_COUNT', 'SUBS'},
+                         set(cfg.__config_raw__))
+        self.assertNotIn('COUNT', cfg.__dict__)
+        self.assertEqual(5, cfg.COUNT)
+        self.assertEqual(5, cfg.__dict__['COUNT'])
+        self.assertEqual(1, LazyConfig.COUNT)
+        self.assertEqual(1, LazyConfig().COUNT)
+
+        with self.assertRaises(ValueError):
+            cfg.validate_all()
+        with self.assertRaises(ValueError):
+            _ = cfg.WHEN
+
+        cfg = LazyConfig.from_dict({'WHEN': '2022-01-01 10:00:00'})
+        cfg.validate_all()
+        self.assertEqual(datetime(2022, 1, 1, 10), cfg.WHEN)
+        cfg.COUNT = 3
+        self.assertEqual(3, cfg.to_dict()['LAZY_COUNT'])
+
+    def test_config_lazy_nested(self):
+        """validate_all checks nested lazy configs"""
+        @config_lazy
+        class LazySub(BaseConfig):
+            """Lazy nested config"""
+            ARG: int = 0
+
+        class Parent(BaseConfig):
+            """Eager parent"""
+            SUBS: List[LazySub]
+
+        cfg = Parent(SUBS=[{'ARG': '1'}, {'ARG': 'x'}])
+        self.assertEqual(1, cfg.SUBS[0].ARG)
+        with self.assertRaises(ValueError):
+            cfg.validate_all()
+
+        @config_slots
+        class SlotConfig(BaseConfig):
+            """Slotted config"""
+            ARG: int = 0
+
+        with self.assertRaises(TypeError):
+            config_lazy(SlotConfig)
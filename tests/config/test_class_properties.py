@@ -1,7 +1,16 @@
+import inspect
 from typing import List
 import unittest
+from unittest.mock import patch
 
+from gs.config import Env
 from gs.config.class_properties import get_fields_default_values, get_types, get_comments, get_envs
+from gs.config.class_properties import parse_comments
+
+try:
+    from typing import Annotated
+except ImportError:  # Python 3.8
+    from typing_extensions import Annotated
 
 
 class DummyClass(object):
@@ -17,6 +26,36 @@ class DummyClass(object):
         self.STR_FIELD = 'abc'  # STR FIELD COMMENT
 
 
+class AnnotatedClass(object):
+    """Env names declared in annotations"""
+
+    ALPHA: Annotated[str, Env('TEST_ALPHA')] = 'alpha'
+    NAMES: Annotated[List[str], Env('TEST_NAMES')]
+    BETA: str = 'beta'  # ENV:TEST_BETA
+
+
+SOURCE = """
+class Outer:
+    A = 1  # OUTER A
+
+    class Inner:
+        B: int = 2  # INNER B
+
+        def method(self):
+            C = 3  # NOT A FIELD
+
+
+def factory():
+    class Local:
+        D = 4  # LOCAL D
+
+        def __init__(self):
+            if True:
+                self.E = 5  # LOCAL E
+    return Local
+"""
+
+
 class TestClassProperties(unittest.TestCase):
 
     def test_get_fields_defaults_values(self):
@@ -41,3 +80,34 @@ class TestClassProperties(unittest.TestCase):
     def test_get_envs(self):
         envs = get_envs(DummyClass)
         self.assertDictEqual(envs, {'STR_LIST_FIELD': 'STR_LIST_FIELD_ENV'})
+
+    def test_annotated_env(self):
+        """Env annotations do not need the source"""
+        self.assertDictEqual(
+            get_types(AnnotatedClass),
+            {'ALPHA': (str, False), 'NAMES': (str, True), 'BETA': (str, False)})
+        self.assertDictEqual(
+            get_envs(AnnotatedClass),
+            {'ALPHA': 'TEST_ALPHA', 'NAMES': 'TEST_NAMES', 'BETA': 'TEST_BETA'})
+        with patch('gs.config.class_properties._MODULE_COMMENTS', {}), \
+                patch('inspect.getsource', side_effect=OSError('no source')):
+            self.assertDictEqual(
+                get_envs(AnnotatedClass),
+                {'ALPHA': 'TEST_ALPHA', 'NAMES': 'TEST_NAMES'})
+
+    def test_parse_comments(self):
+        """Comments of every class of a module in one pass"""
+        self.assertDictEqual(parse_comments(SOURCE), {
+            'Outer': ({'A': 'OUTER A'}, {}),
+            'Outer.Inner': ({'B': 'INNER B'}, {}),
+            'factory.<locals>.Local': ({'D': 'LOCAL D'}, {'E': 'LOCAL E'}),
+        })
+
+    def test_module_parsed_once(self):
+        """The module source is read once for all its classes"""
+        with patch('gs.config.class_properties._MODULE_COMMENTS', {}), \
+                patch('inspect.getsource',
+                      wraps=inspect.getsource) as getsource:
+            get_comments(DummyClass)
+            get_envs(AnnotatedClass)
+        self.assertEqual(1, getsource.call_count)
@@ -0,0 +1,128 @@
+"""Configuration parsers tests"""
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from gs.config import BaseConfig, parsers
+from gs.config.parsers import (clear_file_cache, parse_content, parse_file,
+                               sniff_format)
+
+TOML = '''# comment
+NAME = "toml"
+
+[SUB]
+ARG = 2
+'''
+
+
+class SubConfig(BaseConfig):
+    """Nested config"""
+    ARG: int = 0
+
+
+class Config(BaseConfig):
+    """Sample config"""
+    NAME: str = 'name'
+    SUB: SubConfig
+
+
+class TestParsers(unittest.TestCase):
+    """Test format detection and parsed file cache"""
+
+    def setUp(self):
+        clear_file_cache()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, filename: str, content: str) -> str:
+        path = os.path.join(self.tmp.name, filename)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_sniff_format(self):
+        """Format detected from the first significant line"""
+        self.assertEqual('json', sniff_format('\n  {"a": 1}'))
+        self.assertEqual('json', sniff_format('[1, 2]'))
+        self.assertEqual('json', sniff_format('["a"]'))
+        self.assertEqual('json', sniff_format('[["a"]]'))
+        self.assertEqual('toml', sniff_format(TOML))
+        self.assertEqual('toml', sniff_format('[server]\nport = 1'))
+        self.assertEqual('yaml', sniff_format('# comment\na: 1'))
+        self.assertEqual('yaml', sniff_format('- a\n- b'))
+        self.assertEqual('yaml', sniff_format(''))
+
+    def test_parse_content(self):
+        """Sniffed content is parsed by its parser"""
+        self.assertEqual({'a': 1}, parse_content('{"a": 1}'))
+        self.assertEqual({'a': [1, 2]}, parse_content('a:\n  - 1\n  - 2'))
+        self.assertEqual(['a'], parse_content('["a"]'))
+        self.assertEqual([['a']], parse_content('[["a"]]\n'))
+        # Not json: yaml flow mapping
+        self.assertEqual({'a': 'b'}, parse_content('{a: b}'))
+        with self.assertRaises(ValueError):
+            parse_content('{"a": 1}', 'toml')
+        with self.assertRaises(ValueError):
+            parse_content('a: 1', 'ini')
+        with self.assertRaises(ValueError):
+            parse_content('a: [1')
+
+    @unittest.skipIf(parsers.tomllib is None, 'needs tomllib or tomli')
+    def test_parse_toml(self):
+        """TOML content and files"""
+        self.assertEqual({'NAME': 'toml', 'SUB': {'ARG': 2}},
+                         parse_content(TOML))
+        path = self._write('config.toml', TOML)
+        cfg = Config.load_from_file(path)
+        self.assertEqual('toml', cfg.NAME)
+        self.assertEqual(2, cfg.SUB.ARG)
+
+    def test_toml_without_parser(self):
+        """Sniffed TOML is not read as yaml without a TOML parser"""
+        with patch.object(parsers, 'tomllib', None):
+            with self.assertRaisesRegex(ValueError, 'tomli'):
+                parse_content(TOML)
+            with self.assertRaisesRegex(ValueError, 'tomli'):
+                Config.load_from_file(self._write('config.toml', TOML))
+
+    def test_yaml_not_parsed_as_json(self):
+        """YAML content skips the json parser"""
+        json_parser = Mock()
+        with patch.dict(parsers.PARSERS, json=json_parser):
+            self.assertEqual({'a': 1}, parse_content('a: 1'))
+        json_parser.assert_not_called()
+
+    def test_file_extension(self):
+        """File extension selects the format"""
+        path = self._write('config.yml', '{"NAME": "json in yaml"}')
+        json_parser = Mock()
+        with patch.dict(parsers.PARSERS, json=json_parser):
+            self.assertEqual({'NAME': 'json in yaml'}, parse_file(path))
+        json_parser.assert_not_called()
+        path = self._write('config.json', 'NAME: yaml')
+        with self.assertRaises(ValueError):
+            parse_file(path)
+        with self.assertRaises(ValueError):
+            parse_file(os.path.join(self.tmp.name, 'missing.json'))
+
+    def test_file_cache(self):
+        """Unchanged files are not parsed again"""
+        path = self._write('config.yaml', 'NAME: first')
+        yaml_parser = Mock(wraps=parsers.PARSERS['yaml'])
+        with patch.dict(parsers.PARSERS, yaml=yaml_parser):
+            self.assertEqual('first', Config.load_from_file(path).NAME)
+            self.assertEqual('first', Config.load_from_file(path).NAME)
+            self.assertEqual(1, yaml_parser.call_count)
+
+            self._write('config.yaml', 'NAME: second')
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+            self.assertEqual('second', Config.load_from_file(path).NAME)
+            self.assertEqual(2, yaml_parser.call_count)
+
+            clear_file_cache()
+            Config.load_from_file(path)
+            self.assertEqual(3, yaml_parser.call_count)